@@ -0,0 +1,261 @@
+"""
+Chunked, compressed archive of decoded modipy and sevipy datasets.
+
+write() saves the datasets of a reader object (nrtMOD06, MOD06, nrtACAERO, MOD08, sevipy cloud/aero...) to a
+netCDF4 file after the HDF4 decode, masking and scaling, with long names and units. Floats are stored as float32
+(NaN for invalid pixels) or, with pack=True, as scaled 16-bit integers. Every variable is split into zlib
+compressed chunks. The readers' to_store() methods call write().
+
+read() opens an archive lazily: nothing is read until a dataset is used, and indexing a variable only
+decompresses the chunks it touches, e.g.
+
+    a = archive.read('MOD06_L2.A2016251.0930.nc')
+    Nd = a.ds['Nd'] #Whole dataset, read once
+    tile = a.variables['COT'][100:200,0:50] #Only the chunks covering the tile
+
+Requires netCDF4.
+"""
+
+#Import libraries
+import os
+import numpy as np
+import numpy.ma as ma
+import arrays
+
+#Default chunk size of the last two dimensions
+CHUNKS = (256,256)
+
+#Global attributes copied from reader objects if present
+ATTRS = ['file','satellite','year','jday','month','day','time','array_backend']
+
+#Fill value of packed variables
+PACKED_FILL = -32768
+
+def _dims(f,shape):
+    """
+    Dimension names for shape, created in netCDF4 Dataset f if needed.
+    """
+    dims = []
+    for axis, n in zip('zyx'[3-len(shape):],shape):
+        name = '%s%d' % (axis,n)
+        if name not in f.dimensions: f.createDimension(name,n)
+        dims.append(name)
+    return tuple(dims)
+
+def write(path,obj,variables=None,chunks=None,compression='zlib',complevel=4,pack=False):
+    """
+    Save the datasets of a reader object to a chunked, compressed netCDF4 file.
+
+    Parameters
+    ----------
+    path : string
+    Output file. Written to a temporary file first, so path is never left half written.
+
+    obj : reader object
+    Object with a ds dictionary of datasets, and ds_name or names and units dictionaries if available.
+
+    variables : list
+    Keys of ds to save. Default is every dataset the object can load (ds.available() for lazily loaded
+    datasets, or ds.keys()). lon and lat are always saved.
+
+    chunks : tuple
+    Chunk size of the last two dimensions (one for 1-D variables). Default is CHUNKS. Leading dimensions
+    are chunked one at a time.
+
+    compression : string
+    'zlib' (default) or None for no compression.
+
+    complevel : int
+    zlib compression level, 1-9. Default is 4.
+
+    pack : boolean
+    Store floats as 16-bit integers scaled to the range of valid data, about 1/65000 of the range precision.
+    Default False stores float32.
+    """
+    import netCDF4 as nc
+    if chunks is None: chunks = CHUNKS
+    if compression not in ['zlib',None]: raise ValueError("compression must be 'zlib' or None, not %r" % compression)
+    ds = obj.ds
+    if variables is None:
+        if hasattr(ds,'available'): variables = ds.available()
+        else: variables = sorted(ds.keys())
+    variables = [key for key in ['lon','lat'] if key not in variables] + list(variables)
+    names = getattr(obj,'ds_name',None) or getattr(obj,'names',{})
+    units = getattr(obj,'units',{})
+
+    tmp = '%s.%d.tmp' % (path,os.getpid())
+    f = nc.Dataset(tmp,'w',format='NETCDF4')
+    try:
+        f.reader = type(obj).__name__
+        for attr in ATTRS:
+            value = getattr(obj,attr,None)
+            if value is not None: setattr(f,attr,value if isinstance(value,(int,float)) else str(value))
+        for key in variables:
+            if key in ['lon','lat'] and key not in ds: data = getattr(obj,key)
+            else: data = ds[key]
+            if not isinstance(data,np.ndarray) or not 1 <= data.ndim <= 3 or data.dtype.hasobject: continue
+            kind = data.dtype.kind
+            shape = data.shape
+            c = list(chunks)[-data.ndim:]
+            chunksizes = tuple([1]*(data.ndim-len(c)) + [min(n,m) for n, m in zip(c,shape[data.ndim-len(c):])])
+            options = dict(zlib=compression == 'zlib',complevel=complevel,shuffle=True,chunksizes=chunksizes)
+            if kind == 'f':
+                bad = arrays.invalid(data)
+                values = ma.getdata(data)
+                if pack:
+                    good = values[~bad]
+                    vmin, vmax = (good.min(), good.max()) if good.size else (0., 0.)
+                    v = f.createVariable(key,'i2',_dims(f,shape),fill_value=np.int16(PACKED_FILL),**options)
+                    v.scale_factor = np.float32((vmax - vmin)/65533. or 1.)
+                    v.add_offset = np.float32((vmax + vmin)/2.)
+                    v[:] = ma.MaskedArray(values,bad)
+                else:
+                    v = f.createVariable(key,'f4',_dims(f,shape),fill_value=np.float32(np.nan),**options)
+                    v[:] = arrays.as_nan(data,np.float32)
+            elif kind in 'biu':
+                dtype = np.uint8 if kind == 'b' else data.dtype
+                if ma.isMaskedArray(data) and ma.getmaskarray(data).any():
+                    fill = np.array(np.iinfo(dtype).max if kind in 'bu' else np.iinfo(dtype).min,dtype)
+                    v = f.createVariable(key,dtype,_dims(f,shape),fill_value=fill,**options)
+                    v[:] = ma.MaskedArray(ma.getdata(data).astype(dtype),ma.getmaskarray(data))
+                else:
+                    v = f.createVariable(key,dtype,_dims(f,shape),**options)
+                    v[:] = np.asarray(ma.getdata(data),dtype)
+                if kind == 'b': v.boolean = 1
+            else: continue
+            if key in names: v.long_name = str(names[key])
+            if key in units: v.units = str(units[key])
+    except:
+        f.close()
+        os.remove(tmp)
+        raise
+    f.close()
+    os.rename(tmp,path)
+
+class Variable(object):
+    """
+    Lazily read variable of an Archive. Index it to read part of the data; only the chunks covering the
+    selection are decompressed.
+
+    Attributes
+    ----------
+    name, long_name, units : string
+
+    shape : tuple
+
+    dtype : numpy dtype
+    dtype of the values returned (float32 for stored floats).
+    """
+
+    def __init__(self,var,array_backend):
+        self.var = var
+        self.array_backend = array_backend
+        self.name = var.name
+        attrs = var.ncattrs()
+        self.long_name = var.getncattr('long_name') if 'long_name' in attrs else var.name
+        self.units = var.getncattr('units') if 'units' in attrs else 'N/A'
+        self.shape = var.shape
+        self.boolean = 'boolean' in attrs
+        if self.boolean: self.dtype = np.dtype(bool)
+        elif 'scale_factor' in attrs: self.dtype = np.dtype(np.float32)
+        else: self.dtype = var.dtype
+
+    def __getitem__(self,index):
+        data = self.var[index]
+        if self.dtype.kind == 'f': data = data.astype(np.float32)
+        if not ma.isMaskedArray(data) or not data.mask.any():
+            data = ma.getdata(data)
+            if self.boolean: data = data.astype(bool)
+            if self.array_backend == 'ma' and self.dtype.kind == 'f': return ma.masked_invalid(data)
+            return data
+        if self.array_backend == 'ma': return data
+        return arrays.as_nan(data,np.float32)
+
+    def __len__(self):
+        return self.shape[0]
+
+class _Datasets(dict):
+    #Read a whole variable when first used
+
+    def __init__(self,variables):
+        dict.__init__(self)
+        self.variables = variables
+
+    def __missing__(self,key):
+        value = self[key] = self.variables[key][...]
+        return value
+
+    def available(self):
+        return sorted(self.variables.keys())
+
+class Archive(object):
+    """
+    Archive written by write(), opened with read().
+
+    Attributes
+    ----------
+    variables : dict
+    Variable object of each dataset, for reading tiles.
+
+    ds : dict
+    Whole datasets, read from file when first used.
+
+    ds_name, units : dict
+    Long name and units of each dataset.
+
+    attrs : dict
+    Global attributes (reader, file, satellite, year, jday, time...).
+
+    lon, lat : array
+    Geolocation, read when first used.
+
+    Methods
+    -------
+    close: Close the file. Also closed by a with block.
+    """
+
+    def __init__(self,path,array_backend=None):
+        import netCDF4 as nc
+        self.path = path
+        self.array_backend = arrays.backend(array_backend)
+        self.f = nc.Dataset(path,'r')
+        self.attrs = dict((attr,self.f.getncattr(attr)) for attr in self.f.ncattrs())
+        self.variables = dict((key,Variable(var,self.array_backend)) for key, var in self.f.variables.items())
+        self.ds_name = dict((key,v.long_name) for key, v in self.variables.items())
+        self.units = dict((key,v.units) for key, v in self.variables.items())
+        self.ds = _Datasets(self.variables)
+
+    @property
+    def lon(self):
+        return self.ds['lon']
+
+    @property
+    def lat(self):
+        return self.ds['lat']
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+def read(path,array_backend=None):
+    """
+    Open an archive written by write(). Datasets are read lazily, see Archive.
+
+    Parameters
+    ----------
+    path : string
+    Archive file.
+
+    array_backend : string
+    'ma' for masked arrays or 'nan32' for float32 arrays with NaN, see arrays. Default is arrays.array_backend.
+
+    Returns
+    -------
+    archive : Archive
+    """
+    return Archive(path,array_backend)
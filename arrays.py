@@ -0,0 +1,122 @@
+"""
+Array backends for modipy and sevipy data.
+
+Readers mark invalid pixels in one of two ways:
+    'ma' : numpy masked arrays (default).
+    'nan32' : plain float32 arrays with NaN for invalid pixels. There is no separate mask and plain ndarray
+    arithmetic is several times faster than masked arithmetic, at half the memory of float64 data.
+
+Set array_backend here to change the default for every reader, or pass array_backend= to a reader to choose
+for one object, e.g. modipy.nrtMOD06(cfile,array_backend='nan32').
+
+The nan-aware helpers (invalid(), nanmin(), nanmax(), nanmean(), nansum()...) accept data from either backend,
+so plotting and statistics code doesn't need to know which one it was given.
+"""
+
+#Import libraries
+import numpy as np
+import numpy.ma as ma
+
+#Default backend for readers
+array_backend = 'ma'
+
+BACKENDS = ['ma','nan32']
+
+def backend(name=None):
+    """
+    Check a backend name. None gives the module default, array_backend.
+    """
+    if name is None: name = array_backend
+    if name not in BACKENDS:
+        raise ValueError("array_backend must be one of %s, not %r" % (', '.join(BACKENDS),name))
+    return name
+
+def masked(data,invalid,fill_value=None,array_backend=None):
+    """
+    Mark invalid pixels using the chosen backend.
+
+    Parameters
+    ----------
+    data : array
+    Data, already masked or not. A float32 ndarray is modified in place for 'nan32'.
+
+    invalid : boolean array
+    True for invalid pixels. Combined with the mask of data if it has one.
+
+    fill_value : number
+    Fill value of the masked array ('ma' only).
+
+    array_backend : string
+    'ma' or 'nan32'. Default is the module setting.
+
+    Returns
+    -------
+    data : masked array or float32 array
+    """
+    if backend(array_backend) == 'ma':
+        return ma.MaskedArray(data, mask=invalid, fill_value=fill_value)
+    if ma.isMaskedArray(data):
+        invalid = invalid | ma.getmaskarray(data)
+        data = ma.getdata(data)
+    data = np.asarray(data,dtype=np.float32)
+    data[invalid] = np.nan
+    return data
+
+def invalid(data):
+    """
+    Boolean array, True where data is masked or NaN.
+    """
+    bad = ma.getmaskarray(data)
+    if np.asarray(ma.getdata(data)).dtype.kind in 'fc': bad = bad | np.isnan(ma.getdata(data))
+    return bad
+
+def as_nan(data,dtype=None):
+    """
+    Plain float array with NaN for invalid pixels. Float ndarrays are returned as is (unless dtype differs).
+    """
+    if ma.isMaskedArray(data):
+        if dtype is None: dtype = np.result_type(data.dtype,np.float32)
+        return data.astype(dtype).filled(np.nan)
+    data = np.asarray(data)
+    if dtype is None: dtype = np.result_type(data.dtype,np.float32)
+    return np.asarray(data,dtype=dtype)
+
+def as_masked(data):
+    """
+    Masked array with NaN pixels masked. Masked arrays are returned as is.
+    """
+    if ma.isMaskedArray(data): return data
+    return ma.masked_invalid(data)
+
+def valid(data):
+    """
+    1-D array of the valid (unmasked, non-NaN) values.
+    """
+    return np.asarray(ma.getdata(data))[~invalid(data)]
+
+def count(data):
+    """
+    Number of valid pixels.
+    """
+    return int(np.size(data) - np.count_nonzero(invalid(data)))
+
+#Statistics over valid pixels, masked for a masked array with no valid pixels (like numpy.ma) and NaN otherwise
+def nanmin(data):
+    if ma.isMaskedArray(data): return data.min()
+    return np.nanmin(data)
+
+def nanmax(data):
+    if ma.isMaskedArray(data): return data.max()
+    return np.nanmax(data)
+
+def nanmean(data):
+    if ma.isMaskedArray(data): return data.mean()
+    return np.nanmean(data)
+
+def nanmedian(data):
+    if ma.isMaskedArray(data): return ma.median(data)
+    return np.nanmedian(data)
+
+def nansum(data):
+    if ma.isMaskedArray(data): return data.sum()
+    return np.nansum(data)
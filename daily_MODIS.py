@@ -16,8 +16,8 @@ reload(mod)
 import datetime
 import numpy as np
 import matplotlib.pylab as plt
-from mpl_toolkits.basemap import Basemap
-from scipy.ndimage.interpolation import zoom
+import render
+import grid
 from matplotlib.colors import LogNorm
 
 #Get today's date and current time
@@ -33,6 +33,13 @@ jday = mod.julian_day(now.month, now.day, year)
 
 print 'Running MODIS daily mapmaker at %s' % now
 plt.close("all")
+render.map_cache_dir = '/Users/michaeldiamond/Documents/oracles_files/maps'
+mod.granule_cache.directory = '/Users/michaeldiamond/Documents/oracles_files/granules'
+grid.daily_dir = '/Users/michaeldiamond/Documents/oracles_files/composites'
+#Also save the daily maps after every save_every granules (None to only save them once all granules are in)
+save_every = None
+#Only decode the part of each granule inside the map
+bbox = (render.ORACLES['llcrnrlon'],render.ORACLES['llcrnrlat'],render.ORACLES['urcrnrlon'],render.ORACLES['urcrnrlat'])
 
 """
 Terra
@@ -42,17 +49,16 @@ print 'Setting up maps...'
 #Create maps
 font = 'Arial'
 size = 16
-m = Basemap(llcrnrlon=-15.5,llcrnrlat=-25.5,urcrnrlon=15.5,urcrnrlat=-4.5,projection='merc',resolution='l')
+m = render.basemap(**render.ORACLES)
 
 #Delta ref
 plt.figure(7)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.fillcontinents('k',zorder=0)
+render.background(m,plt.gca(),stations=True)
 dummy = np.zeros((2,2)) #Make the dummy have all the values needed
 vmax = 6
 vmed = 0
@@ -71,12 +77,11 @@ fontname=font,fontsize=size)
 #Del ref
 plt.figure(14)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.fillcontinents('k',zorder=0)
+render.background(m,plt.gca(),stations=True)
 dummy = np.zeros((2,2)) #Make the dummy have all the values needed
 vmax = 500
 vmed = 0
@@ -95,12 +100,11 @@ fontname=font,fontsize=size)
 #Ref
 plt.figure(21)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.fillcontinents('k',zorder=0)
+render.background(m,plt.gca(),stations=True)
 dummy = 4*np.ones((2,2)) #Make the dummy have all the values needed
 vmax = 24
 vmed = 14
@@ -119,12 +123,11 @@ fontname=font,fontsize=size)
 #COT
 plt.figure(28)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.fillcontinents('k',zorder=0)
+render.background(m,plt.gca(),stations=True)
 dummy = np.zeros((2,2)) #Make the dummy have all the values needed
 vmax = 32
 vmed = 16
@@ -143,13 +146,11 @@ fontname=font,fontsize=size)
 #Nd
 plt.figure(35)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.drawmapboundary(fill_color='steelblue')
-m.fillcontinents(color='floralwhite',lake_color='steelblue',zorder=0)
+render.background(m,plt.gca(),land='floralwhite',ocean='steelblue',stations=True)
 dummy = np.ones((2,2)) #Make the dummy have all the values needed
 vmax = 1000
 vmed = 500
@@ -168,12 +169,11 @@ fontname=font,fontsize=size)
 #Delta COT
 plt.figure(42)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.fillcontinents('k',zorder=0)
+render.background(m,plt.gca(),stations=True)
 dummy = np.zeros((2,2)) #Make the dummy have all the values needed
 vmax = 1
 vmed = 0
@@ -192,12 +192,11 @@ fontname=font,fontsize=size)
 #Del COT
 plt.figure(49)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.fillcontinents('k',zorder=0)
+render.background(m,plt.gca(),stations=True)
 dummy = np.zeros((2,2)) #Make the dummy have all the values needed
 vmax = 100
 vmed = 0
@@ -216,12 +215,11 @@ fontname=font,fontsize=size)
 #Delta Nd
 plt.figure(56)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.fillcontinents('k',zorder=0)
+render.background(m,plt.gca(),stations=True)
 dummy = np.zeros((2,2)) #Make the dummy have all the values needed
 vmax = 300
 vmed = 0
@@ -240,12 +238,11 @@ fontname=font,fontsize=size)
 #Del Nd
 plt.figure(63)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.fillcontinents('k',zorder=0)
+render.background(m,plt.gca(),stations=True)
 dummy = np.zeros((2,2)) #Make the dummary have all the values needed
 vmax = 1000
 vmed = 0
@@ -264,12 +261,11 @@ fontname=font,fontsize=size)
 #ACAOD
 plt.figure(100)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.fillcontinents('k',zorder=0)
+render.background(m,plt.gca(),stations=True)
 dummy = np.zeros((2,2)) #Make the dummary have all the values needed
 vmax = 3
 vmed = 1.5
@@ -288,12 +284,11 @@ fontname=font,fontsize=size)
 #ACAOD_ModAbsAero
 plt.figure(107)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.fillcontinents('k',zorder=0)
+render.background(m,plt.gca(),stations=True)
 dummy = np.zeros((2,2)) #Make the dummary have all the values needed
 vmax = 3
 vmed = 1.5
@@ -315,177 +310,60 @@ print 'Done!\n'
 file_directory = '/Users/michaeldiamond/Documents/oracles_files/terra/%s' % jday
 image_directory = '/Users/michaeldiamond/Documents/oracles/terra/%s' % jday
 os.chdir(file_directory)
-files = os.listdir(file_directory)
-cloudfiles = []
-for f in files:
-    if f[-1] == 'f' and f[6] == 'L':
-        cloudfiles.append(f)
+index = mod.GranuleIndex(file_directory)
+cloudfiles = index.files('MOD06')
+
+#Composite the granules of the day onto a grid, then draw each map once
+composite = grid.daily('Terra',year,jday)
+maps = grid.DailyMaps(composite,m,image_directory,save_every=save_every)
+maps.map(plt.figure(7),'delta_ref16','%s_%s_%s_map_delta_ref' % (year,month,day),cmap='RdYlBu_r',vmin=-6,vmax=6)
+maps.map(plt.figure(14),'del_ref16','%s_%s_%s_map_del_ref' % (year,month,day),cmap='RdYlBu_r',vmin=-500,vmax=500)
+maps.map(plt.figure(21),'ref','%s_%s_%s_map_ref' % (year,month,day),cmap='viridis',vmin=4,vmax=24)
+maps.map(plt.figure(28),'COT','%s_%s_%s_map_cot' % (year,month,day),cmap='viridis',vmin=0,vmax=32)
+maps.map(plt.figure(35),'Nd','%s_%s_%s_map_Nd' % (year,month,day),cmap='cubehelix',norm=LogNorm(vmin=1,vmax=1000))
+maps.map(plt.figure(42),'delta_COT16','%s_%s_%s_map_delta_cot' % (year,month,day),cmap='RdYlBu_r',vmin=-1,vmax=1)
+maps.map(plt.figure(49),'del_COT16','%s_%s_%s_map_del_cot' % (year,month,day),cmap='RdYlBu_r',vmin=-100,vmax=100)
+maps.map(plt.figure(56),'delta_Nd16','%s_%s_%s_map_delta_Nd' % (year,month,day),cmap='RdYlBu',vmin=-300,vmax=300)
+maps.map(plt.figure(63),'del_Nd16','%s_%s_%s_map_del_Nd' % (year,month,day),cmap='RdYlBu',vmin=-1000,vmax=1000)
+maps.map(plt.figure(100),'Above_Cloud_AOD','%s_%s_%s_map_ACAOD' % (year,month,day),cmap='inferno_r',vmin=0,vmax=3)
+maps.map(plt.figure(107),'Above_Cloud_AOD_ModAbsAero','%s_%s_%s_map_ACAOD_ModAbsAero' % (year,month,day),cmap='inferno_r',vmin=0,vmax=3)
 
 #Make plots
 for f in cloudfiles:   
-    #Read in file
+    #Read in file, skipping granules outside the map
     os.chdir(file_directory)
-    cloud = mod.nrtMOD06(f)
+    if not mod.intersects(f,bbox): continue
+    try: cloud = mod.open_granule(f,bbox=bbox)
+    except ValueError: continue
     time = cloud.time
-    lon = zoom(cloud.lon,5.)
-    lat = zoom(cloud.lat,5.)
-    m = Basemap(llcrnrlon=-15.5,llcrnrlat=-25.5,urcrnrlon=15.5,urcrnrlat=-4.5,projection='merc',resolution='l')
-    lon, lat = m(lon, lat)
     #Move to image directory
     os.chdir(image_directory)
     #Now add tile to daily maps
     print 'Adding data to daily maps...'
-    print '...delta ref...'
-    plt.figure(7)
-    d = cloud.delta_ref16
-    plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='RdYlBu_r',vmin=-6,vmax=6)
-    m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-    m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-    m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-    fig = plt.gcf()
-    fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_map_delta_ref' % (year,month,day),dpi=150)
-    print '...del ref...'
-    plt.figure(14)
-    d = cloud.del_ref16
-    plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='RdYlBu_r',vmin=-500,vmax=500)
-    m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-    m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-    m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-    fig = plt.gcf()
-    fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_map_del_ref' % (year,month,day),dpi=150)
-    print '...effective radius...'
-    plt.figure(21)
-    d = cloud.ref
-    plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='viridis',vmin=4,vmax=24)
-    m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-    m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-    m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-    fig = plt.gcf()
-    fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_map_ref' % (year,month,day),dpi=150)
-    print '...cloud optical thickness...'
-    plt.figure(28)
-    d = cloud.COT
-    plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='viridis',vmin=0,vmax=32)
-    m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-    m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-    m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-    fig = plt.gcf()
-    fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_map_cot' % (year,month,day),dpi=150)
-    print '...Nd...'
-    plt.figure(35)
-    d = cloud.Nd
-    plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='cubehelix',norm = LogNorm(vmin=1, vmax=1000))
-    m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-    m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-    m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-    fig = plt.gcf()
-    fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_map_Nd' % (year,month,day),dpi=150)
-    print '...delta COT...'
-    plt.figure(42)
-    d = cloud.delta_COT16
-    plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='RdYlBu_r',vmin=-1,vmax=1)
-    m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-    m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-    m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-    fig = plt.gcf()
-    fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_map_delta_cot' % (year,month,day),dpi=150)
-    print '...del COT...'
-    plt.figure(49)
-    d = cloud.del_COT16
-    plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='RdYlBu_r',vmin=-100,vmax=100)
-    m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-    m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-    m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-    fig = plt.gcf()
-    fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_map_del_cot' % (year,month,day),dpi=150)
-    print '...delta Nd...'
-    plt.figure(56)
-    d = cloud.delta_Nd16
-    plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='RdYlBu',vmin=-300,vmax=300)
-    m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-    m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-    m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-    fig = plt.gcf()
-    fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_map_delta_Nd' % (year,month,day),dpi=150)
-    print '...del Nd...'
-    plt.figure(63)
-    d = cloud.del_Nd16
-    plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='RdYlBu',vmin=-1000,vmax=1000)
-    m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-    m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-    m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-    fig = plt.gcf()
-    fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_map_del_Nd' % (year,month,day),dpi=150)
-    afile = 'MOD06ACAERO.A%s%s.%s.006.NRT.hdf' % (year,jday,time)
-    if afile in files:
+    maps.add(cloud,grid.CLOUD_KEYS)
+    afile = index.partner(f,'ACAERO')
+    if afile is not None:
         #Now add tile to daily maps
         print '\nAdding aerosol data to daily maps...'
-        print '...ACAOD map...'
         os.chdir(file_directory)
-        aero = mod.nrtACAERO(afile)
-        comp = mod.nrt_comp(f,afile)
+        aero = mod.open_granule(afile,window=cloud.window)
+        comp = mod.nrt_comp(cloud,aero)
         os.chdir(image_directory)
-        plt.figure(100)
-        d = aero.ds['Above_Cloud_AOD']
-        plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='inferno_r',vmin=0,vmax=3)
-        m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-        m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-        m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-        m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-        m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-        fig = plt.gcf()
-        fig.set_size_inches(13.33,7.5)
-        plt.savefig('%s_%s_%s_map_ACAOD' % (year,month,day),dpi=150)
-        print '...ACAOD_ModAbsAero map...'
-        plt.figure(107)
-        d = aero.ds['Above_Cloud_AOD_ModAbsAero']
-        plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='inferno_r',vmin=0,vmax=3)
-        m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-        m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-        m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-        m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-        m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-        fig = plt.gcf()
-        fig.set_size_inches(13.33,7.5)
-        plt.savefig('%s_%s_%s_map_ACAOD_ModAbsAero' % (year,month,day),dpi=150)
+        maps.add(aero,grid.AEROSOL_KEYS)
         print 'Done!\n'
         print 'Making comparison plots...'
         for var in ['delta_ref16','delta_COT16','delta_Nd16','del_ref16','del_COT16','del_Nd16']:
             print '...%s...' % var
-            plt.figure('comp')
-            comp.compare(var)
-            fig = plt.gcf()
+            fig = comp.compare(var,num='comp')
             fig.set_size_inches(13.33,7.5)
-            plt.savefig('%s_%s_%s_%s_comp_%s' % (year,month,day,time,var),dpi=100)
+            render.save(fig,'%s_%s_%s_%s_comp_%s' % (year,month,day,time,var),dpi=100)
         print 'Done!\n'
 
+#Draw the daily maps
+print 'Drawing daily maps...'
+maps.render()
+print 'Done!\n'
+
 plt.close("all")
 
 """
@@ -497,12 +375,11 @@ print 'Setting up maps...'
 #Ref
 plt.figure(18)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.fillcontinents('k',zorder=0)
+render.background(m,plt.gca(),stations=True)
 dummy = 4*np.ones((2,2)) #Make the dummy have all the values needed
 vmax = 24
 vmed = 14
@@ -521,12 +398,11 @@ fontname=font,fontsize=size)
 #COT
 plt.figure(24)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.fillcontinents('k',zorder=0)
+render.background(m,plt.gca(),stations=True)
 dummy = np.zeros((2,2)) #Make the dummy have all the values needed
 vmax = 32
 vmed = 16
@@ -545,13 +421,11 @@ fontname=font,fontsize=size)
 #Nd
 plt.figure(30)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.drawmapboundary(fill_color='steelblue')
-m.fillcontinents(color='floralwhite',lake_color='steelblue',zorder=0)
+render.background(m,plt.gca(),land='floralwhite',ocean='steelblue',stations=True)
 dummy = np.ones((2,2)) #Make the dummy have all the values needed
 vmax = 1000
 vmed = 500
@@ -570,12 +444,11 @@ fontname=font,fontsize=size)
 #ACAOD
 plt.figure(101)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.fillcontinents('k',zorder=0)
+render.background(m,plt.gca(),stations=True)
 dummy = np.zeros((2,2)) #Make the dummy have all the values needed
 vmax = 3
 vmed = 1.5
@@ -594,12 +467,11 @@ fontname=font,fontsize=size)
 #ACAOD_ModAbsAero
 plt.figure(106)
 plt.clf()
+plt.gcf().set_size_inches(13.33,7.5)
 m
 m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
 m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-m.drawcoastlines()
-m.drawcountries()
-m.fillcontinents('k',zorder=0)
+render.background(m,plt.gca(),stations=True)
 dummy = np.zeros((2,2)) #Make the dummary have all the values needed
 vmax = 3
 vmed = 1.5
@@ -621,94 +493,45 @@ print 'Done!\n'
 file_directory = '/Users/michaeldiamond/Documents/oracles_files/aqua/%s' % jday
 image_directory = '/Users/michaeldiamond/Documents/oracles/aqua/%s' % jday
 os.chdir(file_directory)
-files = os.listdir(file_directory)
-cloudfiles = []
-for f in files:
-    if f[-1] == 'f' and f[6] == 'L':
-        cloudfiles.append(f)
+index = mod.GranuleIndex(file_directory)
+cloudfiles = index.files('MOD06')
+
+#Composite the granules of the day onto a grid, then draw each map once
+composite = grid.daily('Aqua',year,jday)
+maps = grid.DailyMaps(composite,m,image_directory,save_every=save_every)
+maps.map(plt.figure(18),'ref','%s_%s_%s_map_ref' % (year,month,day),cmap='viridis',vmin=4,vmax=24)
+maps.map(plt.figure(24),'COT','%s_%s_%s_map_cot' % (year,month,day),cmap='viridis',vmin=0,vmax=32)
+maps.map(plt.figure(30),'Nd','%s_%s_%s_map_Nd' % (year,month,day),cmap='cubehelix',norm=LogNorm(vmin=1,vmax=1000))
+maps.map(plt.figure(101),'Above_Cloud_AOD','%s_%s_%s_map_ACAOD' % (year,month,day),cmap='inferno_r',vmin=0,vmax=3)
+maps.map(plt.figure(106),'Above_Cloud_AOD_ModAbsAero','%s_%s_%s_map_ACAOD_ModAbsAero' % (year,month,day),cmap='inferno_r',vmin=0,vmax=3)
 
 #Make plots
 for f in cloudfiles:   
-    #Read in file
+    #Read in file, skipping granules outside the map
     os.chdir(file_directory)
-    cloud = mod.nrtMOD06(f)
+    if not mod.intersects(f,bbox): continue
+    try: cloud = mod.open_granule(f,bbox=bbox)
+    except ValueError: continue
     time = cloud.time
-    lon = zoom(cloud.lon,5.)
-    lat = zoom(cloud.lat,5.)
-    m = Basemap(llcrnrlon=-15.5,llcrnrlat=-25.5,urcrnrlon=15.5,urcrnrlat=-4.5,projection='merc',resolution='l')
-    lon, lat = m(lon, lat)
     #Move to image directory
     os.chdir(image_directory)
     #Now add tile to daily maps
     print 'Adding data to daily maps...'
-    print '...effective radius...'
-    plt.figure(18)
-    d = cloud.ref
-    plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='viridis',vmin=4,vmax=24)
-    m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-    m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-    m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-    fig = plt.gcf()
-    fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_map_ref' % (year,month,day),dpi=150)
-    print '...cloud optical thickness...'
-    plt.figure(24)
-    d = cloud.COT
-    plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='viridis',vmin=0,vmax=32)
-    m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-    m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-    m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-    fig = plt.gcf()
-    fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_map_cot' % (year,month,day),dpi=150)
-    print '...Nd...'
-    plt.figure(30)
-    d = cloud.Nd
-    plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='cubehelix',norm = LogNorm(vmin=1, vmax=1000))
-    m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-    m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-    m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-    m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-    fig = plt.gcf()
-    fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_map_Nd' % (year,month,day),dpi=150)
-    afile = 'MYD06ACAERO.A%s%s.%s.006.NRT.hdf' % (year,jday,time)
-    if afile in files:
+    maps.add(cloud,grid.CLOUD_KEYS)
+    afile = index.partner(f,'ACAERO')
+    if afile is not None:
         #Now add tile to daily maps
         print '\nAdding aerosol data to daily maps...'
-        print '...ACAOD map...'
         os.chdir(file_directory)
-        aero = mod.nrtACAERO(afile)
-        comp = mod.nrt_comp(f,afile)
+        aero = mod.open_granule(afile,window=cloud.window)
+        comp = mod.nrt_comp(cloud,aero)
         os.chdir(image_directory)
-        plt.figure(101)
-        d = aero.ds['Above_Cloud_AOD']
-        plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='inferno_r',vmin=0,vmax=3)
-        m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-        m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-        m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-        m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-        m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-        fig = plt.gcf()
-        fig.set_size_inches(13.33,7.5)
-        plt.savefig('%s_%s_%s_map_ACAOD' % (year,month,day),dpi=150)
-        print '...ACAOD_ModAbsAero map...'
-        plt.figure(106)
-        d = aero.ds['Above_Cloud_AOD_ModAbsAero']
-        plt.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],cmap='inferno_r',vmin=0,vmax=3)
-        m.scatter(14.5247,-22.9390,s=250,c='orange',marker='D',latlon=True)
-        m.scatter(-14.3559,-7.9467,s=375,c='c',marker='*',latlon=True)
-        m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
-        m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
-        m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-        fig = plt.gcf()
-        fig.set_size_inches(13.33,7.5)
-        plt.savefig('%s_%s_%s_map_ACAOD_ModAbsAero' % (year,month,day),dpi=150)
+        maps.add(aero,grid.AEROSOL_KEYS)
         print 'Done!\n'
 
+#Draw the daily maps
+print 'Drawing daily maps...'
+maps.render()
+print 'Done!\n'
+
 plt.close("all")
\ No newline at end of file
@@ -32,8 +32,12 @@ os.chdir('/Users/michaeldiamond/')
 from login import u, p
 import datetime
 import numpy as np
-import matplotlib.pylab as plt
-from mpl_toolkits.basemap import Basemap
+import render
+import grid
+render.headless = True
+render.map_cache_dir = '/Users/michaeldiamond/Documents/oracles_files/maps'
+mod.granule_cache.directory = '/Users/michaeldiamond/Documents/oracles_files/granules'
+grid.daily_dir = '/Users/michaeldiamond/Documents/oracles_files/composites'
 
 #Get today's date and current time
 now = datetime.datetime.utcnow()
@@ -133,21 +137,19 @@ for f in current_files:
 for f in new_files:
     #Read in file
     os.chdir(fdir)
-    try: cloud = mod.nrtMOD06(f)
+    try: cloud = mod.open_granule(f)
     except:
         os.system('rm '+f)
         break
-    m = Basemap(llcrnrlon=-15.5,llcrnrlat=-25.5,urcrnrlon=15.5,urcrnrlat=-4.5,projection='merc',resolution='l')
     #Move to image directory
     os.chdir(directory)
     #Triplots for each file
     print 'Making plots for %s...' % f
-    plt.figure('')
-    plt.clf()
-    cloud.five_plot(data='Nd')
-    fig = plt.gcf()
+    fig = cloud.five_plot(data='Nd',num=3)
     fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_%s_Nd' % (year,month,day,cloud.time),dpi=150)
+    render.save(fig,'%s_%s_%s_%s_Nd' % (year,month,day,cloud.time),dpi=150)
+    print '...daily composite...'
+    grid.daily(cloud.satellite,cloud.year,cloud.jday).update(cloud,grid.CLOUD_KEYS)
     print 'Done!\n'
 
 #
@@ -230,22 +232,20 @@ for f in current_files:
 for f in new_files:
     #Read in file
     os.chdir(fdir)
-    try: aero = mod.nrtACAERO(f)
+    try: aero = mod.open_granule(f)
     except:
         os.system('rm '+f)
         break
-    m = Basemap(llcrnrlon=-15.5,llcrnrlat=-25.5,urcrnrlon=15.5,urcrnrlat=-4.5,projection='merc',resolution='l')
     #Move to image directory
     os.chdir(directory)
     #Make AOD plot
     print 'Making plots for %s...' % f
-    plt.figure(3)
     print '...aod...'
-    plt.clf()
-    aero.AOD_plot()
-    fig = plt.gcf()
+    fig = aero.AOD_plot(num=3)
     fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_%s_aod' % (year,month,day,aero.time),dpi=125)
+    render.save(fig,'%s_%s_%s_%s_aod' % (year,month,day,aero.time),dpi=125)
+    print '...daily composite...'
+    grid.daily(aero.satellite,aero.year,aero.jday).update(aero,grid.AEROSOL_KEYS)
     print 'Done!\n'
 
 #
@@ -328,44 +328,36 @@ for f in current_files:
 for f in new_files:
     #Read in file
     os.chdir(fdir)
-    try: cloud = mod.nrtMOD06(f)
+    try: cloud = mod.open_granule(f)
     except:
         os.system('rm '+f)
         break
-    m = Basemap(llcrnrlon=-15.5,llcrnrlat=-25.5,urcrnrlon=15.5,urcrnrlat=-4.5,projection='merc',resolution='l')
     #Move to image directory
     os.chdir(directory)
     #Triplots for each file
     print 'Making triplots for %s...' % f
-    plt.figure(3)
     print '...ref...'
-    plt.clf()
     try:
-        cloud.five_plot(data='ref')
-        fig = plt.gcf()
+        fig = cloud.five_plot(data='ref',num=3)
         fig.set_size_inches(13.33,7.5)
-        plt.savefig('%s_%s_%s_%s_ref' % (year,month,day,cloud.time),dpi=125)
+        render.save(fig,'%s_%s_%s_%s_ref' % (year,month,day,cloud.time),dpi=125)
     except:
         os.system('rm '+f)
         break
     print '...geo...'
-    plt.clf()
-    cloud.triplot(data='geo',full_res=False,num=3)
-    fig = plt.gcf()
+    fig = cloud.triplot(data='geo',full_res=False,num=3)
     fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_%s_geo' % (year,month,day,cloud.time),dpi=150)
+    render.save(fig,'%s_%s_%s_%s_geo' % (year,month,day,cloud.time),dpi=150)
     print '...cot...'
-    plt.clf()
-    cloud.five_plot(data='cot')
-    fig = plt.gcf()
+    fig = cloud.five_plot(data='cot',num=3)
     fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_%s_cot' % (year,month,day,cloud.time),dpi=150)
+    render.save(fig,'%s_%s_%s_%s_cot' % (year,month,day,cloud.time),dpi=150)
     print '...Nd...'
-    plt.clf()
-    cloud.five_plot(data='Nd')
-    fig = plt.gcf()
+    fig = cloud.five_plot(data='Nd',num=3)
     fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_%s_Nd' % (year,month,day,cloud.time),dpi=150)
+    render.save(fig,'%s_%s_%s_%s_Nd' % (year,month,day,cloud.time),dpi=150)
+    print '...daily composite...'
+    grid.daily(cloud.satellite,cloud.year,cloud.jday).update(cloud,grid.CLOUD_KEYS)
     print 'Done!\n'
 
 #
@@ -448,22 +440,20 @@ for f in current_files:
 for f in new_files:
     #Read in file
     os.chdir(fdir)
-    try: aero = mod.nrtACAERO(f)
+    try: aero = mod.open_granule(f)
     except:
         os.system('rm '+f)
         break
-    m = Basemap(llcrnrlon=-15.5,llcrnrlat=-25.5,urcrnrlon=15.5,urcrnrlat=-4.5,projection='merc',resolution='l')
     #Move to image directory
     os.chdir(directory)
     #Triplots for each file
     print 'Making plots for %s...' % f
-    plt.figure(3)
     print '...aod...'
-    plt.clf()
-    aero.AOD_plot()
-    fig = plt.gcf()
+    fig = aero.AOD_plot(num=3)
     fig.set_size_inches(13.33,7.5)
-    plt.savefig('%s_%s_%s_%s_aod' % (year,month,day,aero.time),dpi=125)
+    render.save(fig,'%s_%s_%s_%s_aod' % (year,month,day,aero.time),dpi=125)
+    print '...daily composite...'
+    grid.daily(aero.satellite,aero.year,aero.jday).update(aero,grid.AEROSOL_KEYS)
     print 'Done!\n'
 
-plt.close("all")
+render.close()
@@ -17,7 +17,9 @@ import sevipy as sev
 reload(sev)
 os.chdir('/Users/michaeldiamond/Documents/')
 import datetime
-import matplotlib.pylab as plt
+import render
+render.headless = True
+render.map_cache_dir = '/Users/michaeldiamond/Documents/oracles_files/maps'
 
 #Get today's date and current time
 now = datetime.datetime.utcnow()
@@ -80,11 +82,9 @@ for f in new_files:
                 os.chdir(directory)
                 #Color ratio for each file pair
                 print 'Making CR plots for %s...' % f
-                plt.figure(1)
-                cr.merc()
-                fig = plt.gcf()
+                fig = cr.merc(num=1)
                 fig.set_size_inches(13.33,7.5)
-                plt.savefig('%s_%s_%s_%s_CRS' % (year,month,day,cr.time),dpi=150)
+                render.save(fig,'%s_%s_%s_%s_CRS' % (year,month,day,cr.time),dpi=150)
                 print 'Done!\n'
             else:
                 os.chdir(file_directory)
@@ -102,11 +102,9 @@ for f in new_files:
                 print 'Making plots for %s...' % fc
                 for var in ['Re','Nd','Tau','Pbot','Ptop','Ztf','Zbf','DZ']:
                     print '...%s...' % var
-                    plt.figure(1)
-                    cloud.plot(var)
-                    fig = plt.gcf()
+                    fig = cloud.plot(var,num=1)
                     fig.set_size_inches(13.33,7.5)
-                    plt.savefig('%s_%s_%s_%s_%s' % (year,month,day,cloud.time,var),dpi=150)
+                    render.save(fig,'%s_%s_%s_%s_%s' % (year,month,day,cloud.time,var),dpi=150)
                 print 'Done!\n'
             except: os.system('rm %s' % f)
         elif f[19] == 'a':
@@ -122,14 +120,12 @@ for f in new_files:
                 print 'Making plots for %s...' % fa
                 for var in ['AOD','ATYP']:
                     print '...%s...' % var
-                    plt.figure(1)
-                    aero.plot(var)
-                    fig = plt.gcf()
+                    fig = aero.plot(var,num=1)
                     fig.set_size_inches(13.33,7.5)
-                    plt.savefig('%s_%s_%s_%s_%s' % (year,month,day,aero.time,var),dpi=150)
+                    render.save(fig,'%s_%s_%s_%s_%s' % (year,month,day,aero.time,var),dpi=150)
                 print 'Done!\n'
             except: os.system('rm %s' % f)
         else: pass
     else: pass
 
-plt.close("all")
+render.close()
@@ -0,0 +1,623 @@
+"""
+Binning of swath data onto a regular lon/lat grid, for daily L3-style composites.
+
+A Composite keeps running statistics (count, sum, sum of squares, min and max) of each dataset for every grid
+cell. Granules are added one at a time: pixels are assigned to cells by flat index and accumulated with
+np.bincount, so overlapping swaths are averaged instead of drawn over each other. Mean, standard deviation,
+count, min and max can then be read for any dataset, or drawn as a single image, e.g.
+
+    comp = grid.Composite(grid.Grid(*grid.ORACLES),['Nd','ref'])
+    for f in files: comp.add(modipy.open_granule(f))
+    Nd = comp.mean('Nd')
+    fig = comp.plot('Nd',norm=LogNorm(vmin=1,vmax=1000))
+
+A DailyComposite is a Composite saved on disk and updated as each granule arrives, so the map of the day so far
+can be drawn at any time without decoding the granules again, e.g.
+
+    grid.daily_dir = '/path/to/composites'
+    day = grid.daily('Terra',2016,251)
+    day.update(cloud,grid.CLOUD_KEYS) #Does nothing if cloud was already added
+    fig = day.plot('Nd',norm=LogNorm(vmin=1,vmax=1000))
+"""
+
+#Import libraries
+import os
+import json
+import shutil
+from contextlib import contextmanager
+try: import fcntl
+except ImportError: fcntl = None
+import numpy as np
+import numpy.ma as ma
+import arrays
+import render
+
+#ORACLES map domain (lon_min, lat_min, lon_max, lat_max), as render.ORACLES
+ORACLES = (render.ORACLES['llcrnrlon'],render.ORACLES['llcrnrlat'],render.ORACLES['urcrnrlon'],render.ORACLES['urcrnrlat'])
+
+class Grid(object):
+    """
+    Regular lon/lat grid.
+
+    Parameters
+    ----------
+    lon_min, lat_min, lon_max, lat_max : float
+    Edges of the grid in degrees. If lon_min > lon_max, the grid crosses the antimeridian.
+
+    resolution : float
+    Size of a cell in degrees. Default is 0.1.
+
+    Attributes
+    ----------
+    shape : tuple
+    (rows, columns), rows going north from lat_min.
+
+    lons, lats : array
+    Longitude and latitude of the cell centers along each axis.
+
+    lon, lat : array
+    2-D longitude and latitude of the cell centers.
+
+    Methods
+    -------
+    cells: Flat cell index of each pixel.
+    """
+
+    def __init__(self,lon_min,lat_min,lon_max,lat_max,resolution=.1):
+        self.lon_min, self.lat_min, self.lon_max, self.lat_max = lon_min, lat_min, lon_max, lat_max
+        self.resolution = resolution
+        width = (lon_max - lon_min) % 360 or 360
+        self.shape = (int(round((lat_max - lat_min)/resolution)), int(round(width/resolution)))
+        self.size = self.shape[0]*self.shape[1]
+        self.lats = lat_min + resolution*(np.arange(self.shape[0]) + .5)
+        self.lons = (lon_min + resolution*(np.arange(self.shape[1]) + .5) + 180) % 360 - 180
+        self.lon, self.lat = np.meshgrid(self.lons,self.lats)
+
+    def __repr__(self):
+        return 'Grid(%r,%r,%r,%r,%r)' % (self.lon_min,self.lat_min,self.lon_max,self.lat_max,self.resolution)
+
+    def cells(self,lon,lat):
+        """
+        Flat index (row*columns + column) of the cell of each pixel, -1 for pixels outside the grid or with
+        invalid geolocation.
+        """
+        lon = np.asarray(ma.getdata(lon),dtype=float)
+        lat = np.asarray(ma.getdata(lat),dtype=float)
+        y = (lat - self.lat_min)/self.resolution
+        x = lon - self.lon_min
+        x[x < 0] += 360
+        x /= self.resolution
+        #NaN fails every comparison, so invalid geolocation is outside too
+        inside = (y >= 0) & (y < self.shape[0]) & (x >= 0) & (x < self.shape[1]) & (np.abs(lon) <= 180)
+        cells = np.full(lat.shape,-1,dtype=np.int64)
+        cells[inside] = y[inside].astype(np.int64)*self.shape[1] + x[inside].astype(np.int64)
+        return cells
+
+class Composite(object):
+    """
+    Running per-cell statistics of swath datasets on a Grid.
+
+    Parameters
+    ----------
+    grid : Grid
+    Output grid.
+
+    keys : list
+    Dataset keys to accumulate when granules are added, e.g. ['Nd','ref','COT'].
+
+    array_backend : string
+    'ma' for masked arrays or 'nan32' for float32 arrays with NaN for empty cells, see arrays. Default is
+    arrays.array_backend.
+
+    Methods
+    -------
+    add: Add the datasets of a granule (nrtMOD06, MOD06, nrtACAERO, nrt_comp...).
+
+    add_array: Add one dataset given its geolocation or cells.
+
+    merge: Add the statistics of another composite on the same grid (e.g. Terra + Aqua).
+
+    count, mean, std, min, max: Gridded statistics of a dataset.
+
+    draw: Draw a statistic of a dataset on an existing map.
+
+    plot: Draw a statistic of a dataset as a single image.
+
+    Attributes
+    ----------
+    stats : dict
+    Flat 'count', 'sum', 'sumsq', 'min' and 'max' arrays (one value per cell) for each dataset.
+
+    names, units : dict
+    Long name and units of each dataset, from the granules.
+
+    granules : list
+    Files added so far.
+    """
+
+    STATS = ['count','sum','sumsq','min','max']
+
+    def __init__(self,grid,keys=None,array_backend=None):
+        self.grid = grid
+        self.keys = list(keys or [])
+        self.array_backend = arrays.backend(array_backend)
+        self.stats = {}
+        self.names = {}
+        self.units = {}
+        self.granules = []
+
+    def _stats(self,key):
+        if key not in self.stats:
+            n = self.grid.size
+            self.stats[key] = {'count' : np.zeros(n,np.int64), 'sum' : np.zeros(n), 'sumsq' : np.zeros(n),\
+            'min' : np.full(n,np.inf), 'max' : np.full(n,-np.inf)}
+        return self.stats[key]
+
+    def add(self,granule,keys=None):
+        """
+        Add datasets of a granule. 1 km datasets are placed with granule.geo_1km(), datasets on the grid of
+        granule.lon/lat with those.
+
+        Parameters
+        ----------
+        granule : reader object
+        Object with ds, lon and lat (and geo_1km() for 5 km geolocation).
+
+        keys : list
+        Datasets to add. Default is the keys of the composite.
+        """
+        cells = {} #Cells for each data shape
+        for key in keys or self.keys:
+            data = granule.ds[key]
+            shape = np.shape(data)[:2]
+            if shape not in cells:
+                if shape == np.shape(granule.lat): cells[shape] = self.grid.cells(granule.lon,granule.lat)
+                else: cells[shape] = self.grid.cells(*granule.geo_1km(shape))
+            self.add_array(key,data,cells=cells[shape])
+            names = getattr(granule,'ds_name',None) or getattr(granule,'names',None) or getattr(granule,'name',{})
+            if key in names: self.names[key] = names[key]
+            if key in getattr(granule,'units',{}): self.units[key] = granule.units[key]
+        self.granules.append(getattr(granule,'file',None) or getattr(granule,'filename',None))
+
+    def add_array(self,key,data,lon=None,lat=None,cells=None):
+        """
+        Add a dataset. Give either lon and lat (same shape as data) or cells from self.grid.cells().
+        Invalid (masked or NaN) pixels are skipped.
+        """
+        if cells is None: cells = self.grid.cells(lon,lat)
+        good = ~arrays.invalid(data) & (cells >= 0)
+        c = cells[good]
+        v = np.asarray(ma.getdata(data),dtype=float)[good]
+        stats = self._stats(key)
+        n = self.grid.size
+        stats['count'] += np.bincount(c,minlength=n)
+        stats['sum'] += np.bincount(c,v,n)
+        stats['sumsq'] += np.bincount(c,v*v,n)
+        np.minimum.at(stats['min'],c,v)
+        np.maximum.at(stats['max'],c,v)
+
+    def merge(self,other):
+        """
+        Add the statistics of another Composite on the same grid.
+        """
+        if repr(other.grid) != repr(self.grid): raise ValueError('Composites are on different grids')
+        for key, theirs in other.stats.items():
+            ours = self._stats(key)
+            for stat in ['count','sum','sumsq']: ours[stat] += theirs[stat]
+            ours['min'] = np.minimum(ours['min'],theirs['min'])
+            ours['max'] = np.maximum(ours['max'],theirs['max'])
+        self.names.update(other.names)
+        self.units.update(other.units)
+        self.granules += other.granules
+
+    def _gridded(self,key,values):
+        empty = self.stats[key]['count'] == 0
+        return arrays.masked(values.reshape(self.grid.shape),empty.reshape(self.grid.shape),\
+        array_backend=self.array_backend)
+
+    def count(self,key):
+        """
+        Number of valid pixels in each cell.
+        """
+        return self.stats[key]['count'].reshape(self.grid.shape)
+
+    def mean(self,key):
+        """
+        Mean of each cell, masked (or NaN) where the cell is empty.
+        """
+        stats = self.stats[key]
+        return self._gridded(key,stats['sum']/np.maximum(stats['count'],1))
+
+    def std(self,key):
+        """
+        Standard deviation of the pixels in each cell, masked (or NaN) where the cell is empty.
+        """
+        stats = self.stats[key]
+        n = np.maximum(stats['count'],1)
+        mean = stats['sum']/n
+        return self._gridded(key,np.sqrt(np.maximum(stats['sumsq']/n - mean*mean,0)))
+
+    def min(self,key):
+        """
+        Minimum of each cell, masked (or NaN) where the cell is empty.
+        """
+        return self._gridded(key,self.stats[key]['min'].copy())
+
+    def max(self,key):
+        """
+        Maximum of each cell, masked (or NaN) where the cell is empty.
+        """
+        return self._gridded(key,self.stats[key]['max'].copy())
+
+    def draw(self,key,m,ax,stat='mean',cmap='viridis',vmin=None,vmax=None,norm=None,zorder=1):
+        """
+        Draw a statistic of a dataset as one image on an existing map.
+
+        Parameters
+        ----------
+        key : string
+        Dataset.
+
+        m : Basemap
+        Map projection of ax.
+
+        ax : matplotlib Axes
+        Axes to draw on.
+
+        stat : string
+        'mean' (default), 'std', 'count', 'min' or 'max'.
+
+        cmap, vmin, vmax, norm, zorder
+        Passed to imshow.
+
+        Returns
+        -------
+        im : matplotlib AxesImage
+        Remove it with im.remove() to draw the composite again on the same axes.
+        """
+        if stat not in ['mean','std','count','min','max']:
+            raise ValueError("stat must be 'mean', 'std', 'count', 'min' or 'max', not %r" % stat)
+        g = self.grid
+        data = arrays.as_masked(getattr(self,stat)(key))
+        lon_max = g.lon_min + g.shape[1]*g.resolution
+        x0, y0 = m(g.lon_min,g.lat_min)
+        x1, y1 = m(lon_max,g.lat_max)
+        #Rows of a regular lat grid aren't evenly spaced in Mercator y, so resample them first
+        ys = np.linspace(y0,y1,2*g.shape[0])
+        lats = m(np.zeros(len(ys)) + g.lons[0],ys,inverse=True)[1]
+        rows = np.clip(np.floor((lats - g.lat_min)/g.resolution).astype(int),0,g.shape[0]-1)
+        im = ax.imshow(data[rows],extent=(x0,x1,y0,y1),origin='lower',interpolation='nearest',cmap=cmap,\
+        vmin=vmin,vmax=vmax,norm=norm,zorder=zorder)
+        m.set_axes_limits(ax=ax)
+        return im
+
+    def plot(self,key,stat='mean',cmap='viridis',vmin=None,vmax=None,norm=None,title=None,num=None,\
+    stations=True):
+        """
+        Draw a statistic of a dataset on a map of the grid as one image.
+
+        Parameters
+        ----------
+        key : string
+        Dataset.
+
+        stat : string
+        'mean' (default), 'std', 'count', 'min' or 'max'.
+
+        cmap, vmin, vmax, norm
+        Passed to imshow.
+
+        title : string
+        Default is the long name of the dataset and the statistic.
+
+        num : int or string
+        Figure number/name to draw on, see render.figure(). Optional.
+
+        stations : boolean
+        Mark the ORACLES stations and flight track. Default True.
+
+        Returns
+        -------
+        fig : matplotlib Figure
+        """
+        g = self.grid
+        fig = render.figure(num,figsize=(13.33,7.5),name='Composite.plot')
+        ax = fig.add_subplot(1,1,1)
+        font = 'Arial'
+        size = 16
+        lon_max = g.lon_min + g.shape[1]*g.resolution
+        m = render.basemap(llcrnrlon=g.lon_min,llcrnrlat=g.lat_min,urcrnrlon=lon_max,urcrnrlat=g.lat_max,\
+        projection='merc',resolution='l',ax=ax)
+        m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
+        m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
+        render.background(m,ax,stations=stations)
+        im = self.draw(key,m,ax,stat,cmap=cmap,vmin=vmin,vmax=vmax,norm=norm)
+        cbar = fig.colorbar(im,ax=ax)
+        cbar.ax.tick_params(labelsize=size-4)
+        unit = 'pixels' if stat == 'count' else self.units.get(key,'')
+        cbar.set_label('[%s]' % unit,fontname=font,fontsize=size-2)
+        if title is None: title = '%s (%s)' % (self.names.get(key,key),stat)
+        ax.set_title(title,fontname=font,fontsize=size)
+        return fig
+
+"""
+Persisted daily composites
+"""
+
+#Directory of the persisted daily composites, one subdirectory per satellite and day. None disables them.
+daily_dir = None
+
+#Datasets of the daily maps, from the cloud (M?D06_L2) and above-cloud aerosol (M?D06ACAERO) granules
+CLOUD_KEYS = ['ref','COT','Nd','delta_ref16','del_ref16','delta_COT16','del_COT16','delta_Nd16','del_Nd16']
+AEROSOL_KEYS = ['Above_Cloud_AOD','Above_Cloud_AOD_ModAbsAero']
+
+#Datasets accumulated by default in daily composites
+DAILY_KEYS = CLOUD_KEYS + AEROSOL_KEYS
+
+@contextmanager
+def _locked(path):
+    #Exclusive lock on a lock file, shared by every process updating the same composite
+    f = open(path,'a')
+    try:
+        if fcntl is not None: fcntl.flock(f,fcntl.LOCK_EX)
+        yield
+    finally:
+        if fcntl is not None: fcntl.flock(f,fcntl.LOCK_UN)
+        f.close()
+
+class DailyComposite(Composite):
+    """
+    Composite saved in a directory and updated one granule at a time.
+
+    Every save writes a new version of the statistics (one .npy file per dataset and statistic, plus a JSON
+    file with the grid, names, units and ledger) to its own subdirectory, then makes it current by renaming a
+    pointer file, so a reader never sees a half-written composite. The statistics are memory-mapped when
+    loaded. The ledger records the datasets each granule has contributed: adding a granule again (e.g. in
+    ftp_MODIS and again in daily_MODIS) only adds datasets it hasn't added yet. Updates from different
+    processes are serialised with a lock file.
+
+    Parameters
+    ----------
+    directory : string
+    Directory of the composite. Created if needed; an existing composite there is loaded.
+
+    grid : Grid
+    Output grid. Default is the grid of the existing composite, or Grid(*ORACLES) for a new one.
+
+    keys : list
+    Datasets to accumulate. Default is the keys of the existing composite, or DAILY_KEYS for a new one.
+
+    array_backend : string
+    'ma' or 'nan32', see arrays. Default is arrays.array_backend.
+
+    Methods
+    -------
+    update: Add the datasets of a granule that aren't in the ledger yet, and save.
+
+    refresh: Load the current version if another process has saved a newer one.
+
+    save: Write the statistics as a new version.
+
+    Attributes
+    ----------
+    ledger : dict
+    Datasets added from each granule, by file name.
+
+    version : int
+    Version of the statistics loaded, 0 for a new composite.
+    """
+
+    def __init__(self,directory,grid=None,keys=None,array_backend=None):
+        self.directory = directory
+        self.ledger = {}
+        self.version = 0
+        self._writable = True
+        if not os.path.isdir(directory): os.makedirs(directory)
+        Composite.__init__(self,grid or Grid(*ORACLES),keys,array_backend)
+        if self._current():
+            self.refresh()
+            if grid is not None and repr(grid) != repr(self.grid):
+                raise ValueError('%s is a composite on %r, not %r' % (directory,self.grid,grid))
+            if keys is not None: self.keys = list(keys)
+        elif keys is None: self.keys = list(DAILY_KEYS)
+
+    def _current(self):
+        path = os.path.join(self.directory,'CURRENT')
+        if not os.path.exists(path): return 0
+        with open(path) as f: return int(f.read())
+
+    def _path(self,version,name=None):
+        path = os.path.join(self.directory,'v%06d' % version)
+        if name is None: return path
+        return os.path.join(path,name)
+
+    def refresh(self,writable=False):
+        """
+        Load the current version saved in the directory, if newer than the one loaded. The statistics are
+        read-only memory maps unless writable is True.
+        """
+        version = self._current()
+        if version == 0 or (version == self.version and (self._writable or not writable)): return
+        with open(self._path(version,'composite.json')) as f: meta = json.load(f)
+        self.grid = Grid(*meta['grid'])
+        self.keys = meta['keys']
+        self.names = meta['names']
+        self.units = meta['units']
+        self.ledger = meta['ledger']
+        self.granules = sorted(self.ledger)
+        mode = None if writable else 'r'
+        self.stats = {}
+        for key in meta['stats']:
+            self.stats[key] = dict((stat,np.load(self._path(version,'%s.%s.npy' % (key,stat)),mmap_mode=mode))\
+            for stat in self.STATS)
+        self.version = version
+        self._writable = writable
+
+    def save(self):
+        """
+        Write the statistics as a new version and make it current. Versions older than the previous one are
+        deleted. Use update() to add granules, which also saves.
+        """
+        with _locked(os.path.join(self.directory,'lock')):
+            self._save()
+
+    def _save(self):
+        version = max(self._current(),self.version) + 1
+        tmp = '%s.%d.tmp' % (self._path(version),os.getpid())
+        if os.path.isdir(tmp): shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        for key, stats in self.stats.items():
+            for stat in self.STATS: np.save(os.path.join(tmp,'%s.%s.npy' % (key,stat)),stats[stat])
+        g = self.grid
+        meta = {'grid' : [g.lon_min,g.lat_min,g.lon_max,g.lat_max,g.resolution], 'keys' : self.keys,\
+        'names' : self.names, 'units' : self.units, 'ledger' : self.ledger, 'stats' : sorted(self.stats)}
+        with open(os.path.join(tmp,'composite.json'),'w') as f: json.dump(meta,f,indent=1,sort_keys=True)
+        os.rename(tmp,self._path(version))
+        pointer = os.path.join(self.directory,'CURRENT.%d.tmp' % os.getpid())
+        with open(pointer,'w') as f: f.write('%d' % version)
+        os.rename(pointer,os.path.join(self.directory,'CURRENT'))
+        self.version = version
+        #Keep the previous version for readers that are still loading it
+        for name in os.listdir(self.directory):
+            if name.startswith('v') and name[1:].isdigit() and int(name[1:]) < version - 1:
+                shutil.rmtree(os.path.join(self.directory,name),ignore_errors=True)
+
+    def update(self,granule,keys=None):
+        """
+        Add the datasets of a granule that it hasn't contributed yet, and save. Safe to call again for the same
+        granule, from any process.
+
+        Parameters
+        ----------
+        granule : reader object
+        Object with file, ds, lon and lat, see Composite.add().
+
+        keys : list
+        Datasets to add. Default is the keys of the composite that the granule has. Give CLOUD_KEYS or
+        AEROSOL_KEYS when both products have a dataset (e.g. Nd) that should only come from one of them.
+
+        Returns
+        -------
+        added : list
+        Datasets added, empty if the granule had already contributed them all.
+        """
+        name = os.path.basename(getattr(granule,'file',None) or getattr(granule,'filename',None) or '')
+        if not name: raise ValueError('Granule has no file name to record in the ledger')
+        if keys is None:
+            ds = granule.ds
+            available = ds.available() if hasattr(ds,'available') else ds.keys()
+            keys = [key for key in self.keys if key in available]
+        with _locked(os.path.join(self.directory,'lock')):
+            self.refresh(writable=True)
+            added = [key for key in keys if key not in self.ledger.get(name,[])]
+            if not added: return added
+            self.add(granule,added)
+            self.ledger[name] = self.ledger.get(name,[]) + added
+            self.granules = sorted(self.ledger)
+            self._save()
+        return added
+
+def daily(satellite,year,jday,directory=None,grid=None,keys=None,array_backend=None):
+    """
+    Get the DailyComposite of a satellite and day, in a subdirectory of directory (default daily_dir).
+
+    Parameters
+    ----------
+    satellite : string
+    'Terra' or 'Aqua'.
+
+    year, jday : int
+    Year and Julian day.
+
+    directory, grid, keys, array_backend
+    See DailyComposite.
+
+    Returns
+    -------
+    composite : DailyComposite
+    """
+    if directory is None: directory = daily_dir
+    if directory is None: raise ValueError('Set grid.daily_dir or give a directory for daily composites')
+    return DailyComposite(os.path.join(directory,'%s.%d%03d' % (satellite,int(year),int(jday))),grid,keys,\
+    array_backend)
+
+"""
+Daily maps
+"""
+
+class DailyMaps(object):
+    """
+    Maps of a Composite on figures that are already set up (map, background, colorbar and title), each drawn
+    and saved once after all the granules are added instead of after every granule.
+
+    Parameters
+    ----------
+    composite : Composite
+    Composite the granules are added to. For a DailyComposite, granules already in its ledger aren't
+    decoded or added again.
+
+    m : Basemap
+    Map projection of the figures.
+
+    directory : string
+    Where the images are saved. Default is the current directory.
+
+    save_every : int
+    Also draw and save every map after each save_every granules, so partial maps are available during a long
+    run. Default None only saves when render() is called.
+
+    dpi : int
+    Resolution of the saved images. Default is 150.
+
+    Methods
+    -------
+    map: Add a map of a dataset.
+
+    add: Add the datasets of a granule to the composite.
+
+    render: Draw every map from the composite and save it.
+    """
+
+    def __init__(self,composite,m,directory=None,save_every=None,dpi=150):
+        self.composite = composite
+        self.m = m
+        self.directory = directory
+        self.save_every = save_every
+        self.dpi = dpi
+        self.maps = [] #(figure, key, filename, stat, imshow keywords)
+        self.images = {} #Image last drawn on each figure
+        self.added = 0
+
+    def map(self,fig,key,filename,stat='mean',**kwargs):
+        """
+        Add a map of dataset key, drawn on the first axes of matplotlib Figure fig and saved to filename.
+        kwargs (cmap, vmin, vmax, norm...) are passed to Composite.draw(), and should match the colorbar of fig.
+        """
+        self.maps.append((fig,key,filename,stat,kwargs))
+
+    def add(self,granule,keys=None):
+        """
+        Add the datasets of a granule (default the keys of the composite that it has) to the composite.
+        """
+        if isinstance(self.composite,DailyComposite): self.composite.update(granule,keys)
+        else:
+            if keys is None:
+                ds = granule.ds
+                available = ds.available() if hasattr(ds,'available') else ds.keys()
+                keys = [key for key in self.composite.keys if key in available]
+            self.composite.add(granule,keys)
+        self.added += 1
+        if self.save_every and self.added % self.save_every == 0: self.render()
+
+    def render(self):
+        """
+        Draw every map from the current statistics of the composite, replacing the previous drawing, and save
+        it. Maps of datasets without data yet are skipped.
+        """
+        for fig, key, filename, stat, kwargs in self.maps:
+            if key not in self.composite.stats: continue
+            ax = fig.axes[0]
+            if id(fig) in self.images: self.images[id(fig)].remove()
+            self.images[id(fig)] = self.composite.draw(key,self.m,ax,stat,**kwargs)
+            if self.directory is not None: filename = os.path.join(self.directory,filename)
+            fig.savefig(filename,dpi=self.dpi)
@@ -16,14 +16,26 @@ Modified (v.0.4): Michael Diamond, 11/23/2016, Hawthorne, NY
 """
 
 #Import libraries
+import os
+import re
+import zlib
+import struct
+import shutil
+import hashlib
+import threading
+import weakref
+try: import queue
+except ImportError: import Queue as queue
+from collections import OrderedDict
 from pyhdf import SD
 from pyhdf.SD import SDC
 import numpy as np
 import numpy.ma as ma
-import matplotlib.pylab as plt
-from mpl_toolkits.basemap import Basemap
 from scipy.ndimage.interpolation import zoom
 from matplotlib.colors import LogNorm
+import render
+import arrays
+import archive
 
 """
 General purpose functions
@@ -200,6 +212,55 @@ def julian_day(month, day, year):
             offset = 336-1
     return offset + day
 
+#Band metadata table
+"""
+One row per MODIS spectral band (row band-1):
+band : band number
+sds : name of the scientific dataset holding the band in MOD021KM/MYD021KM files
+index : index along the first dimension of sds (-1 for band 26, which is its own 2D dataset)
+index_hi : same as index but for hi-gain (only differs for bands 13 and 14)
+lo, hi : band edges, in nm for bands 1-19 and in microns for bands 20-36
+wavelength : center wavelength in m
+wavenumber : center wavenumber in cm-1
+c1, c2 : effective Planck constants so that Tb = c2/ln(1 + c1/radiance) for radiance in W/m2/micron/sr
+cmap : default matplotlib colormap
+"""
+_band_edges = [(620,670),(841,876),(459,479),(545,565),(1230,1250),(1628,1652),(2105,2155),(405,420),\
+(438,448),(483,493),(526,536),(546,556),(662,672),(673,683),(743,753),(862,877),(890,920),(931,941),\
+(915,965),(3.660,3.840),(3.929,3.989),(3.929,3.989),(4.020,4.080),(4.433,4.498),(4.482,4.549),\
+(1.360,1.390),(6.535,6.895),(7.175,7.475),(8.400,8.700),(9.580,9.880),(10.780,11.280),(11.770,12.270),\
+(13.185,13.485),(13.485,13.785),(13.785,14.085),(14.085,14.385)]
+
+BANDS = np.zeros(36, dtype=[('band','i2'),('sds','U20'),('index','i2'),('index_hi','i2'),('lo','f8'),\
+('hi','f8'),('wavelength','f8'),('wavenumber','f8'),('c1','f8'),('c2','f8'),('cmap','U10')])
+BANDS['band'] = np.arange(1,37)
+BANDS['sds'][0:2], BANDS['index'][0:2] = 'EV_250_Aggr1km_RefSB', np.arange(0,2)
+BANDS['sds'][2:7], BANDS['index'][2:7] = 'EV_500_Aggr1km_RefSB', np.arange(0,5)
+BANDS['sds'][7:19], BANDS['index'][7:19] = 'EV_1KM_RefSB', [0,1,2,3,4,5,7,9,10,11,12,13]
+BANDS['sds'][19:25], BANDS['index'][19:25] = 'EV_1KM_Emissive', np.arange(0,6)
+BANDS['sds'][25], BANDS['index'][25] = 'EV_Band26', -1
+BANDS['sds'][26:36], BANDS['index'][26:36] = 'EV_1KM_Emissive', np.arange(6,16)
+BANDS['index_hi'] = BANDS['index']
+BANDS['index_hi'][12], BANDS['index_hi'][13] = 6, 8
+BANDS['lo'] = [e[0] for e in _band_edges]
+BANDS['hi'] = [e[1] for e in _band_edges]
+BANDS['wavelength'][:19] = (BANDS['lo'][:19] + BANDS['hi'][:19])/2./10.**9
+BANDS['wavelength'][19:] = (BANDS['lo'][19:] + BANDS['hi'][19:])/2./10.**6
+BANDS['wavenumber'] = 1./(BANDS['wavelength']*100.)
+BANDS['cmap'] = 'cubehelix'
+BANDS['cmap'][[0,12,13,14]] = 'OrRd'
+BANDS['cmap'][[1,4,5,6,15,16,17,18]] = 'YlOrRd'
+BANDS['cmap'][[2,7,8,9]] = 'PuBu'
+BANDS['cmap'][[3,10,11]] = 'YlGn'
+_h = 6.62607004*10**-34 #m2 kg / s
+_c = 299792458. #m/s
+_k = 1.38064852*10**-23 #m2 kg s-2 K-1
+BANDS['c1'] = 2.*_h*_c**2/BANDS['wavelength']**5/10.**6 #In W/m2/micron/sr
+BANDS['c2'] = _h*_c/(_k*BANDS['wavelength']) #In K
+
+#Emissive bands
+EMISSIVE = [20,21,22,23,24,25,27,28,29,30,31,32,33,34,35,36]
+
 #Average wavelength and wavelength spread for each spectral band
 def avg_wavelength(band):
     """
@@ -219,80 +280,11 @@ def avg_wavelength(band):
     --------------------
     Written: Michael Diamond, 8/3/16, Seattle, WA
     """
-    if band == 1:
-        return (670 + 620)/2. 
-    elif band == 2:
-        return (841 + 876)/2. 
-    elif band == 3:
-        return (459 + 479)/2. 
-    elif band == 4:
-        return (545 + 565)/2. 
-    elif band == 5:
-        return (1230 + 1250)/2. 
-    elif band == 6:
-        return (1628 + 1652)/2. 
-    elif band == 7:
-        return (2105 + 2155)/2. 
-    elif band == 8:
-        return (405 + 420)/2. 
-    elif band == 9:
-        return (438 + 448)/2. 
-    elif band == 10:
-        return (483 + 493)/2. 
-    elif band == 11:
-        return (526 + 536)/2. 
-    elif band == 12:
-        return (546 + 556)/2. 
-    elif band == 13:
-        return (662 + 672)/2. 
-    elif band == 14:
-        return (673 + 683)/2. 
-    elif band == 15:
-        return (743 + 753)/2. 
-    elif band == 16:
-        return (862 + 877)/2. 
-    elif band == 17:
-        return (890 + 920)/2. 
-    elif band == 18:
-        return (931 + 941)/2. 
-    elif band == 19:
-        return (915 + 965)/2. 
-    elif band == 20:
-        return (3.660 + 3.840)/2. 
-    elif band == 21:
-        return (3.929 + 3.989)/2. 
-    elif band == 22:
-        return (3.929 + 3.989)/2. 
-    elif band == 23:
-        return (4.020 + 4.080)/2. 
-    elif band == 24:
-        return (4.433 + 4.498)/2. 
-    elif band == 25:
-        return (4.482 + 4.549)/2. 
-    elif band == 26:
-        return (1.360 + 1.390)/2. 
-    elif band == 27:
-        return (6.535 + 6.895)/2. 
-    elif band == 28:
-        return (7.175 + 7.475)/2. 
-    elif band == 29:
-        return (8.400 + 8.700)/2. 
-    elif band == 30:
-        return (9.580 + 9.880)/2. 
-    elif band == 31:
-        return (10.780 + 11.280)/2. 
-    elif band == 32:
-        return (11.770 + 12.270)/2. 
-    elif band == 33:
-        return (13.185 + 13.485)/2. 
-    elif band == 34:
-        return (13.485 + 13.785)/2. 
-    elif band == 35:
-        return (13.785 + 14.085)/2. 
-    elif band == 36:
-        return (14.085 + 14.385)/2. 
-    else:
+    if not 1 <= band <= 36:
         print('Error: Band must be an integer between 1-36.')
+        return
+    row = BANDS[band-1]
+    return (row['lo'] + row['hi'])/2.
 
 def channel_width(band):
     """
@@ -312,80 +304,11 @@ def channel_width(band):
     --------------------
     Written: Michael Diamond, 8/3/16, Seattle, WA
     """
-    if band == 1:
-        return np.abs(670 - 620) 
-    elif band == 2:
-        return np.abs(841 - 876) 
-    elif band == 3:
-        return np.abs(459 - 479) 
-    elif band == 4:
-        return np.abs(545 - 565) 
-    elif band == 5:
-        return np.abs(1230 - 1250) 
-    elif band == 6:
-        return np.abs(1628 - 1652) 
-    elif band == 7:
-        return np.abs(2105 - 2155) 
-    elif band == 8:
-        return np.abs(405 - 420) 
-    elif band == 9:
-        return np.abs(438 - 448) 
-    elif band == 10:
-        return np.abs(483 - 493) 
-    elif band == 11:
-        return np.abs(526 - 536) 
-    elif band == 12:
-        return np.abs(546 - 556) 
-    elif band == 13:
-        return np.abs(662 - 672) 
-    elif band == 14:
-        return np.abs(673 - 683) 
-    elif band == 15:
-        return np.abs(743 - 753) 
-    elif band == 16:
-        return np.abs(862 - 877) 
-    elif band == 17:
-        return np.abs(890 - 920) 
-    elif band == 18:
-        return np.abs(931 - 941) 
-    elif band == 19:
-        return np.abs(915 - 965) 
-    elif band == 20:
-        return np.abs(3.660 - 3.840) 
-    elif band == 21:
-        return np.abs(3.929 - 3.989) 
-    elif band == 22:
-        return np.abs(3.929 - 3.989) 
-    elif band == 23:
-        return np.abs(4.020 - 4.080) 
-    elif band == 24:
-        return np.abs(4.433 - 4.498) 
-    elif band == 25:
-        return np.abs(4.482 - 4.549) 
-    elif band == 26:
-        return np.abs(1.360 - 1.390) 
-    elif band == 27:
-        return np.abs(6.535 - 6.895) 
-    elif band == 28:
-        return np.abs(7.175 - 7.475) 
-    elif band == 29:
-        return np.abs(8.400 - 8.700) 
-    elif band == 30:
-        return np.abs(9.580 - 9.880) 
-    elif band == 31:
-        return np.abs(10.780 - 11.280) 
-    elif band == 32:
-        return np.abs(11.770 - 12.270) 
-    elif band == 33:
-        return np.abs(13.185 - 13.485) 
-    elif band == 34:
-        return np.abs(13.485 - 13.785) 
-    elif band == 35:
-        return np.abs(13.785 - 14.085) 
-    elif band == 36:
-        return np.abs(14.085 - 14.385) 
-    else:
+    if not 1 <= band <= 36:
         print('Error: Band must be an integer between 1-36.')
+        return
+    row = BANDS[band-1]
+    return np.abs(row['lo'] - row['hi'])
 
 #Characteristic colorbar set by band
 def colorbar(band):
@@ -405,16 +328,109 @@ def colorbar(band):
     --------------------
     Written: Michael Diamond, 08/04/2016, Seattle, WA
     """
-    if band == 1 or 13 <= band <= 15:
-        return 'OrRd'
-    elif band == 2 or 5 <= band <= 7 or 16 <= band <= 19:
-        return 'YlOrRd'
-    elif band == 3 or 8 <= band <= 10:
-        return 'PuBu'
-    elif band == 4 or 11 <= band <= 12:
-        return 'YlGn'
-    else:
-        return 'cubehelix'
+    if not 1 <= band <= 36: return 'cubehelix'
+    return str(BANDS['cmap'][band-1])
+
+#Location of each band in the MOD021KM/MYD021KM file
+def band_location(band,hi=False):
+    """
+    Find where a MODIS spectral band is stored in a MOD021KM/MYD021KM file.
+    
+    Parameters
+    ----------
+    band : int
+    MODIS band, from 1 to 36.
+    
+    hi : boolean
+    Hi- or lo-gain bands for bands 13 and 14. Set to True for hi-gain. Default is lo-gain.
+    
+    Returns
+    -------
+    sds, ind : string, int
+    Name of the scientific dataset holding the band and index of the band along its first dimension.
+    ind is None for band 26, which is stored as its own 2D dataset.
+    """
+    if not 1 <= band <= 36:
+        raise ValueError('Band must be an integer between 1 and 36.')
+    row = BANDS[band-1]
+    if band == 26: return str(row['sds']), None
+    if hi: return str(row['sds']), int(row['index_hi'])
+    return str(row['sds']), int(row['index'])
+
+#Invert the Planck function
+def planck_Tb(radiance,band,out=None):
+    """
+    Convert radiance to brightness temperature at the average wavelength of a MODIS band.
+    
+    Parameters
+    ----------
+    radiance : array
+    Radiance in W/meters^2/micron/steradian.
+    
+    band : int or list of int
+    MODIS band, from 1 to 36. If a list, it gives the band of each slice along the first axis of radiance.
+    
+    out : array
+    If given (e.g. radiance itself), the result is written into it in place. Optional.
+    
+    Returns
+    -------
+    Tb : array
+    Brightness temperature in Kelvin.
+    """
+    band = np.asarray(band)
+    if np.any(band < 1) or np.any(band > 36):
+        print('Error: Band must be an integer between 1 and 36.')
+    c1 = BANDS['c1'][band-1]
+    c2 = BANDS['c2'][band-1]
+    if band.ndim:
+        shape = (-1,) + (1,)*(np.ndim(radiance)-1)
+        c1, c2 = c1.reshape(shape), c2.reshape(shape)
+    if out is None:
+        return c2/np.log(1+c1/radiance) #In K
+    c1 = np.asarray(c1,dtype=out.dtype)
+    c2 = np.asarray(c2,dtype=out.dtype)
+    np.divide(c1,radiance,out=out)
+    np.log1p(out,out=out)
+    np.divide(c2,out,out=out) #In K
+    return out
+
+#Radiance to Tb look-up table indexed by stored counts
+def planck_Tb_lut(offset,scale,band,vmax=32767,dtype=np.float32):
+    """
+    Brightness temperature for every possible stored count of an emissive band.
+    
+    Radiance is linear in the stored counts, so Tb(counts) can be tabulated once per band and granule
+    and looked up with the raw data as index.
+    
+    Parameters
+    ----------
+    offset, scale : float or array
+    radiance_offsets and radiance_scales of the band(s).
+    
+    band : int or list of int
+    MODIS band(s).
+    
+    vmax : int
+    Largest valid count. Default is 32767.
+    
+    Returns
+    -------
+    lut : array
+    (vmax+1,) or (nband, vmax+1) array of brightness temperatures in Kelvin.
+    """
+    counts = np.arange(vmax+1,dtype=dtype)
+    offset = np.asarray(offset,dtype=dtype)
+    scale = np.asarray(scale,dtype=dtype)
+    if offset.ndim:
+        offset, scale = offset[:,np.newaxis], scale[:,np.newaxis]
+    lut = (counts - offset)*scale
+    old = np.seterr(divide='ignore',invalid='ignore')
+    try:
+        planck_Tb(lut,band,out=lut)
+    finally:
+        np.seterr(**old)
+    return lut
 
 #Canonical Sc box locations from Klein & Hartmann, 1993
 KH93 = {}
@@ -424,201 +440,1126 @@ KH93['Californian'] = {'N' : 30, 'S' : 20, 'E' : -120, 'W' : -130}
 KH93['Canarian'] = {'N' : 25, 'S' : 15, 'E' : -25, 'W' : -35}
 KH93['Australian'] = {'N' : -25, 'S' : -35, 'E' : 105, 'W' : 95}
 
+#Block average of masked data
+def block_mean(data,invalid,n):
+    """
+    Average n x n blocks over the last two axes, ignoring invalid pixels.
+    
+    Parameters
+    ----------
+    data : array
+    (..., rows, cols) array. A trailing partial block of rows or columns is averaged over the pixels it has.
+    
+    invalid : array of bool
+    True where data should be ignored.
+    
+    n : int
+    Block size.
+    
+    Returns
+    -------
+    mean, invalid : array
+    Block averages (float) and a mask of blocks with no valid pixels.
+    """
+    rows, cols = np.shape(data)[-2], np.shape(data)[-1]
+    lead = np.shape(data)[:-2]
+    #Pad to whole blocks with invalid pixels
+    pad = [(0,0)]*len(lead) + [(0,-rows % n),(0,-cols % n)]
+    valid = np.pad(~invalid,pad,'constant',constant_values=False)
+    shape = lead + (valid.shape[-2]//n, n, valid.shape[-1]//n, n)
+    total = np.pad(np.where(~invalid, data, 0).astype(float),pad,'constant').reshape(shape).sum(axis=-1).sum(axis=-2)
+    count = valid.reshape(shape).sum(axis=-1).sum(axis=-2)
+    empty = count == 0
+    return total/np.where(empty,1,count), empty
+
+#Swath window covering a lon/lat box
+def bbox_window(lon,lat,bbox,factor=5,shape=None):
+    """
+    Find the smallest block of swath rows and columns with geolocation inside a lon/lat box.
+    
+    Parameters
+    ----------
+    lon, lat : array
+    Geolocation of the swath, e.g. the 5 km x 5 km Longitude/Latitude datasets.
+    
+    bbox : tuple or dict
+    (lon_min, lat_min, lon_max, lat_max) in degrees, or a dict with 'N', 'S', 'E', 'W' keys as in KH93.
+    If lon_min > lon_max, the box crosses the antimeridian.
+    
+    factor : int
+    Number of data pixels per geolocation pixel along each dimension (5 for 1 km data on the 5 km grid).
+    
+    shape : tuple
+    Shape of the data arrays. Used to extend the window to the last rows/columns, which have no
+    geolocation pixel of their own (1354 = 5*270 + 4 for MODIS 1 km data). Optional.
+    
+    Returns
+    -------
+    geo_rows, geo_cols, rows, cols : slice
+    Window on the geolocation grid and on the data grid. None if no pixel falls in the box.
+    """
+    if type(bbox) == dict:
+        bbox = (bbox['W'], bbox['S'], bbox['E'], bbox['N'])
+    lon_min, lat_min, lon_max, lat_max = bbox
+    valid = np.logical_and(np.abs(lat) <= 90, np.abs(lon) <= 180)
+    inside = np.logical_and(lat >= lat_min, lat <= lat_max)
+    if lon_min <= lon_max:
+        inside &= np.logical_and(lon >= lon_min, lon <= lon_max)
+    else:
+        inside &= np.logical_or(lon >= lon_min, lon <= lon_max)
+    inside &= valid
+    rows = np.where(inside.any(axis=1))[0]
+    cols = np.where(inside.any(axis=0))[0]
+    if len(rows) == 0: return None
+    r0, r1, c0, c1 = int(rows[0]), int(rows[-1])+1, int(cols[0]), int(cols[-1])+1
+    R1, C1 = r1*factor, c1*factor
+    if shape is not None:
+        if r1 == np.shape(lat)[0]: R1 = shape[0]
+        if c1 == np.shape(lat)[1]: C1 = shape[1]
+    return slice(r0,r1), slice(c0,c1), slice(r0*factor,R1), slice(c0*factor,C1)
+
+def window_tag(window):
+    """
+    Short name of a bbox_window() window on the data grid, e.g. 'r100-350.c0-135'. None for no window.
+    """
+    if window is None: return None
+    rows, cols = window[2:]
+    return 'r%d-%d.c%d-%d' % (rows.start, rows.stop, cols.start, cols.stop)
+
+def granule_bounds(filename):
+    """
+    Bounding rectangle of a granule from its ECS core metadata, without reading any data.
+    
+    Parameters
+    ----------
+    filename : string
+    MODIS HDF file, or the .met file downloaded with it.
+    
+    Returns
+    -------
+    bounds : tuple
+    (lon_min, lat_min, lon_max, lat_max) from WEST/SOUTH/EAST/NORTHBOUNDINGCOORDINATE, or None if the
+    file has no bounding rectangle.
+    """
+    if filename.endswith('.met'):
+        with open(filename,'r') as f: text = f.read()
+    else: text = handle_pool.handle(filename).attributes().get('CoreMetadata.0')
+    if not text: return None
+    bounds = []
+    for side in ['WEST','SOUTH','EAST','NORTH']:
+        match = re.search(r'OBJECT\s*=\s*%sBOUNDINGCOORDINATE\s.*?VALUE\s*=\s*([-+.0-9Ee]+)' % side,text,re.S)
+        if match is None: return None
+        bounds.append(float(match.group(1)))
+    return tuple(bounds)
+
+def _lon_ranges(lon_min,lon_max):
+    if lon_min <= lon_max: return [(lon_min,lon_max)]
+    return [(lon_min,180.),(-180.,lon_max)] #Crosses the antimeridian
+
+def intersects(filename,bbox):
+    """
+    Check whether a granule may have pixels inside a lon/lat box, from its metadata bounding rectangle (see
+    granule_bounds()), so granules outside a region can be skipped before any data is read. Files without
+    a bounding rectangle (e.g. MOD06ACAERO) are checked with their geolocation instead.
+    
+    Parameters
+    ----------
+    filename : string
+    MODIS HDF file or .met file.
+    
+    bbox : tuple or dict
+    (lon_min, lat_min, lon_max, lat_max) or a KH93-style {'N','S','E','W'} box, as in bbox_window().
+    
+    Returns
+    -------
+    intersects : boolean
+    False if the granule is certainly outside bbox. The bounding rectangle is larger than the swath, so
+    True doesn't guarantee any pixel falls inside.
+    """
+    if type(bbox) == dict:
+        bbox = (bbox['W'], bbox['S'], bbox['E'], bbox['N'])
+    bounds = granule_bounds(filename)
+    if bounds is None:
+        lon = handle_pool.select(filename,'Longitude')[:,:]
+        lat = handle_pool.select(filename,'Latitude')[:,:]
+        return bbox_window(lon,lat,bbox) is not None
+    if bounds[1] > bbox[3] or bounds[3] < bbox[1]: return False
+    return any(a0 <= b1 and b0 <= a1 for a0, a1 in _lon_ranges(bounds[0],bounds[2]) \
+    for b0, b1 in _lon_ranges(bbox[0],bbox[2]))
+
+def l2_window(filename,bbox,factor=5,shape_sds='Cloud_Optical_Thickness'):
+    """
+    bbox_window() of an L2 granule from its Longitude/Latitude datasets.
+    
+    Parameters
+    ----------
+    filename : string
+    HDF file.
+    
+    bbox : tuple or dict
+    Lon/lat box, see bbox_window().
+    
+    factor : int
+    Data pixels per geolocation pixel. 5 for MOD06_L2 (5 km geolocation). For 1 km geolocation (MOD06ACAERO),
+    the window is found from the pixels at the centers of 5x5 blocks, so it lines up with that of the MOD06_L2
+    granule.
+    
+    shape_sds : string
+    SDS giving the shape of the data grid.
+    
+    Returns
+    -------
+    window : tuple
+    See bbox_window(). Raises ValueError if no pixel is inside bbox.
+    """
+    lon = handle_pool.select(filename,'Longitude')[:,:]
+    lat = handle_pool.select(filename,'Latitude')[:,:]
+    shape = handle_pool.select(filename,shape_sds).info()[2][:2]
+    if factor == 1:
+        window = bbox_window(lon[2::5,2::5],lat[2::5,2::5],bbox,5,shape)
+        if window is not None: window = window[2:] + window[2:]
+    else: window = bbox_window(lon,lat,bbox,factor,shape)
+    if window is None:
+        raise ValueError('No pixels of %s inside bbox %s' % (filename, str(bbox)))
+    return window
+
+def sds_window(filename,name,window):
+    """
+    Index of the part of SDS name inside a bbox_window() window: the geolocation window for SDS on the
+    geolocation grid (e.g. 5 km Cloud_Top_Temperature), the data window otherwise. None for no window.
+    """
+    if window is None: return None
+    geo_rows = handle_pool.select(filename,'Longitude').info()[2][0]
+    if np.atleast_1d(handle_pool.select(filename,name).info()[2])[0] == geo_rows: return window[:2]
+    return window[2:]
+
 """
-Class for MOD021KM/MYD021KM calibrated radiance/reflectance files from LAADS Web (https://ladsweb.nascom.nasa.gov/)
+Pooled HDF file handles
 """
 
-class MOD021KM(object):
+class HandlePool(object):
     """
-    Create object to analyze a MOD021KM/MYD021KM calibrated radiance/reflectance file from LAADS Web (https://ladsweb.nascom.nasa.gov/).
+    Process-wide pool of open HDF4 file handles with least-recently-used eviction.
+    
+    Keeps one SD handle per file, together with the SDS objects already selected from it, so repeated
+    reads from the same granule don't reopen the file. At most max_handles files are held open at once;
+    the least recently used file is closed when the budget is exceeded and transparently reopened if
+    it is needed again.
     
     Parameters
     ----------
-    filename : string
-    Name of MOD021KM/MYD021KM file to analyze.
+    max_handles : int
+    Maximum number of files kept open at the same time. Default is 32.
     
     Methods
     -------
-    radiance: Get array of calibrated radiances.
+    handle: Get the open SD handle for a file.
     
-    reflectance: Get array of calibrated reflectances.
+    select: Get a (cached) SDS object from a file.
     
-    brightness_temperature: Get array of brightness temperature.
-        Also, Tb() returns equivalent array.
+    close: Close a single file, or every pooled file if no filename is given.
+    """
     
-    quick_plot: Fast plot of data. Intended as a check/first look at the data.
+    def __init__(self,max_handles=32):
+        self.max_handles = max_handles
+        self._files = OrderedDict() #Absolute path -> (SD handle, {SDS name : SDS object})
+        self._lock = threading.RLock()
     
-    plot: Plot of data at 1 km x 1 km resolution.
+    def _entry(self,filename):
+        key = os.path.abspath(filename)
+        entry = self._files.pop(key, None)
+        if entry is None:
+            entry = (SD.SD(key, SDC.READ), {})
+        self._files[key] = entry #Most recently used goes last
+        while len(self._files) > max(self.max_handles,1):
+            old_key = next(iter(self._files))
+            self._end(self._files.pop(old_key))
+        return entry
     
-    blend: Plot a non-projected RGB blend of 3 solar bands.
+    def _end(self,entry):
+        h, sds = entry
+        for s in sds.values():
+            try: s.endaccess()
+            except: pass
+        h.end()
     
-    standard_blends: Plots three standard true and false color blends (non-projected).
+    def handle(self,filename):
+        """
+        Get the open SD handle for filename, opening it if necessary.
+        """
+        with self._lock:
+            return self._entry(filename)[0]
     
-    Returns
+    def select(self,filename,name):
+        """
+        Get SDS object name from filename. SDS objects are selected once and reused until the file is closed.
+        """
+        with self._lock:
+            h, sds = self._entry(filename)
+            if name not in sds:
+                sds[name] = h.select(name)
+            return sds[name]
+    
+    def close(self,filename=None):
+        """
+        Close filename, or every pooled file if filename is None.
+        """
+        with self._lock:
+            if filename is None:
+                keys = list(self._files.keys())
+            else:
+                keys = [os.path.abspath(filename)]
+            for key in keys:
+                entry = self._files.pop(key, None)
+                if entry is not None: self._end(entry)
+    
+    def __len__(self):
+        return len(self._files)
+
+#Shared pool used by all readers in this module (change handle_pool.max_handles to adjust the descriptor budget)
+handle_pool = HandlePool()
+
+"""
+On-disk cache of decoded granules
+"""
+
+class GranuleCache(object):
+    """
+    Persistent cache of decoded datasets, one directory per granule, so a granule decoded once (e.g. by
+    ftp_MODIS) is memory-mapped instead of decoded again when it is reopened (e.g. by daily_MODIS or nrt_comp).
+
+    Granules are identified by file name, size, modification time and a hash of the first and last MiB of the
+    file, so a re-downloaded or reprocessed file gets a new entry. Each dataset is saved as .npy (plus a
+    .mask.npy for masked arrays) under a subdirectory for the array backend. When the total size goes over
+    budget, the least recently opened granules are deleted.
+
+    Parameters
+    ----------
+    directory : string
+    Cache directory. None (default) disables the cache.
+
+    budget : int
+    Maximum size of the cache in bytes. Default is 2 GiB.
+
+    Methods
     -------
-    filename, month, time, satellite: string
-    Name of MOD021KM/MYD021KM file used, month, time of retrieval, satellite (Terra or Aqua).
+    store: Get the GranuleStore of a file, or None if the cache is disabled.
+
+    evict: Delete least recently used granules until the cache fits its budget.
+
+    clear: Delete every cached granule.
+    """
+
+    def __init__(self,directory=None,budget=2*1024**3):
+        self.directory = directory
+        self.budget = budget
+        self._keys = {} #(path, size, mtime) -> granule directory name
+        self._size = None #Total bytes, counted on first write
+        self._lock = threading.RLock()
+
+    def _name(self,path):
+        st = os.stat(path)
+        stat_key = (path, st.st_size, st.st_mtime)
+        if stat_key not in self._keys:
+            h = hashlib.sha1(('%s %d %r' % (os.path.basename(path),st.st_size,st.st_mtime)).encode('utf-8'))
+            with open(path,'rb') as f:
+                h.update(f.read(1024**2))
+                if st.st_size > 2*1024**2:
+                    f.seek(-1024**2,2)
+                    h.update(f.read())
+            self._keys[stat_key] = '%s.%s' % (os.path.basename(path),h.hexdigest()[:16])
+        return self._keys[stat_key]
+
+    def store(self,filename,array_backend=None,tag=None):
+        """
+        Get the GranuleStore for filename and array_backend (see arrays), marking the granule as recently used.
+        tag separates datasets computed with different settings (e.g. nd_gamma). Returns None if directory is None.
+        """
+        if self.directory is None: return None
+        path = os.path.abspath(filename)
+        granule = os.path.join(self.directory,self._name(path))
+        if os.path.isdir(granule): os.utime(granule,None)
+        name = arrays.backend(array_backend)
+        if tag is not None: name = '%s.%s' % (name,tag)
+        return GranuleStore(self,granule,name)
+
+    def _granules(self):
+        out = []
+        if not os.path.isdir(self.directory): return out
+        for name in os.listdir(self.directory):
+            granule = os.path.join(self.directory,name)
+            if not os.path.isdir(granule): continue
+            size = 0
+            for root, dirs, files in os.walk(granule):
+                size += sum(os.path.getsize(os.path.join(root,f)) for f in files)
+            out.append((os.path.getmtime(granule),granule,size))
+        return out
+
+    def _added(self,nbytes,keep=None):
+        with self._lock:
+            if self._size is None: self._size = sum(size for t, g, size in self._granules())
+            else: self._size += nbytes
+            if self._size > self.budget: self.evict(keep)
+
+    def evict(self,keep=None):
+        """
+        Delete the least recently used granules (except keep) until the cache fits in budget.
+        """
+        with self._lock:
+            granules = sorted(self._granules())
+            self._size = sum(size for t, g, size in granules)
+            for t, granule, size in granules:
+                if self._size <= self.budget: break
+                if granule == keep: continue
+                shutil.rmtree(granule,ignore_errors=True)
+                self._size -= size
+
+    def clear(self):
+        """
+        Delete every cached granule.
+        """
+        with self._lock:
+            for t, granule, size in self._granules(): shutil.rmtree(granule,ignore_errors=True)
+            self._size = 0
+
+class GranuleStore(object):
+    """
+    Cached datasets of one granule, see GranuleCache.
+
+    Methods
+    -------
+    get: Memory-map a cached dataset, or None if it isn't cached.
+
+    put: Save a dataset.
+    """
+
+    def __init__(self,cache,granule,name):
+        self.cache = cache
+        self.granule = granule
+        self.directory = os.path.join(granule,name)
+
+    def _path(self,key,mask=False):
+        return os.path.join(self.directory,'%s.%s' % (key,'mask.npy' if mask else 'npy'))
+
+    def get(self,key):
+        """
+        Copy-on-write memory map of dataset key (a masked array if it was saved masked), or None. It can be
+        modified in place like a freshly decoded array; changes are never written back to the cache.
+        """
+        path = self._path(key)
+        if not os.path.exists(path): return None
+        data = np.load(path,mmap_mode='c')
+        if os.path.exists(self._path(key,True)):
+            data = ma.MaskedArray(data, mask=np.load(self._path(key,True),mmap_mode='c'))
+        return data
+
+    def put(self,key,value):
+        """
+        Save dataset key if it is an array and isn't saved yet.
+        """
+        if not isinstance(value,np.ndarray) or value.dtype.hasobject: return
+        if os.path.exists(self._path(key)): return
+        if not os.path.isdir(self.directory): os.makedirs(self.directory)
+        nbytes = 0
+        #Mask first, so a data file always has its mask
+        parts = [(self._path(key),ma.getdata(value))]
+        if ma.isMaskedArray(value): parts.insert(0,(self._path(key,True),ma.getmaskarray(value)))
+        for path, data in parts:
+            tmp = '%s.%d.tmp.npy' % (path[:-4],os.getpid())
+            np.save(tmp,np.ascontiguousarray(data))
+            os.rename(tmp,path)
+            nbytes += os.path.getsize(path)
+        self.cache._added(nbytes,self.granule)
+
+#Shared cache used by the L2 readers. Set granule_cache.directory to enable it.
+granule_cache = GranuleCache()
+
+"""
+Geolocation interpolation
+"""
+
+#Directory for on-disk 1 km geolocation caches. None to only cache in memory.
+geo_cache_dir = None
+
+#Bilinear interpolation from the 5 km tie-point grid to 1 km
+def interp_geo(lon,lat,factor=5,shape=None):
+    """
+    Interpolate 5 km x 5 km MODIS geolocation to 1 km x 1 km.
     
-    jday, year, day : int
-    Julian day, year, and calendar day.
+    The 5 km pixels are the centers (pixel 5i+2) of 5x5 blocks of 1 km pixels. Positions are interpolated
+    bilinearly between these tie points (and extrapolated past the outer ones) as unit vectors on the
+    sphere, so swaths crossing the antimeridian or passing near the poles come out right.
+    
+    Parameters
+    ----------
+    lon, lat : array
+    Longitude and latitude on the tie-point grid, in degrees.
+    
+    factor : int
+    1 km pixels per tie point along each dimension. Default is 5.
+    
+    shape : tuple
+    Shape of the output. Default is factor times the shape of lat, like zoom(lat,5.).
     
+    Returns
+    -------
     lon, lat : array
-    Longitude and latitude (Note: 5 km x 5 km).
+    Interpolated longitude and latitude, same dtype as the input.
+    """
+    if shape is None: shape = (np.shape(lat)[0]*factor, np.shape(lat)[1]*factor)
+    rlat = np.radians(np.asarray(lat,dtype=float))
+    rlon = np.radians(np.asarray(lon,dtype=float))
+    xyz = np.array([np.cos(rlat)*np.cos(rlon), np.cos(rlat)*np.sin(rlon), np.sin(rlat)])
+    for axis in (1,2):
+        n = xyz.shape[axis]
+        t = (np.arange(shape[axis-1]) - (factor-1)/2.)/factor #Position in tie-point units
+        i0 = np.clip(np.floor(t).astype(int), 0, max(n-2,0))
+        i1 = np.minimum(i0+1, n-1)
+        w = t - i0
+        if n == 1: w = np.zeros(len(t))
+        if axis == 1:
+            w = w[np.newaxis,:,np.newaxis]
+            xyz = xyz[:,i0,:]*(1-w) + xyz[:,i1,:]*w
+        else:
+            w = w[np.newaxis,np.newaxis,:]
+            xyz = xyz[:,:,i0]*(1-w) + xyz[:,:,i1]*w
+    x, y, z = xyz
+    lat1 = np.degrees(np.arctan2(z, np.hypot(x,y))).astype(np.asarray(lat).dtype)
+    lon1 = np.degrees(np.arctan2(y, x)).astype(np.asarray(lon).dtype)
+    return lon1, lat1
+
+#Nearest neighbor from a 5 km product grid to 1 km
+def expand_5km(data,factor=5,shape=None):
+    """
+    Give each 1 km pixel the value of the 5 km pixel (5x5 block) it falls in, e.g. Cloud_Top_Temperature on the
+    grid of Cloud_Optical_Thickness. Edge pixels past the last full block take the last 5 km pixel.
+
+    Parameters
+    ----------
+    data : array or masked array
+    Data on the 5 km grid.
+
+    factor : int
+    1 km pixels per 5 km pixel along each dimension. Default is 5.
+
+    shape : tuple
+    Shape of the output. Default is factor times the shape of data.
+
+    Returns
+    -------
+    data : array or masked array
+    Data on the 1 km grid.
+    """
+    if shape is None: shape = (np.shape(data)[0]*factor, np.shape(data)[1]*factor)
+    #Number of 1 km rows/columns taken from each 5 km row/column
+    counts = [np.bincount(np.minimum(np.arange(shape[axis])//factor, np.shape(data)[axis]-1), \
+    minlength=np.shape(data)[axis]) for axis in (0,1)]
+    expand = (lambda x: np.repeat(np.repeat(x,counts[0],axis=0),counts[1],axis=1))
+    if ma.isMaskedArray(data):
+        return ma.MaskedArray(expand(ma.getdata(data)), mask=expand(ma.getmaskarray(data)))
+    return expand(data)
+
+class _Swath(object):
+    """
+    Shared 1 km geolocation for objects with 5 km lon/lat attributes.
     
-    Modification history
-    --------------------
-    Written (v.1.0): Michael Diamond, 08/04/2016, Seattle, WA
-    Modified (v.1.1): Michael Diamond, 08/08/2016, Seattle, WA
-        -Fixed bug in brightness temperature
-        -Changed aesthetics of plotting methods
-        -Masks invalid data before applying scale and offset
-    Modified (v.1.2): Michael Diamond, 09/14/2016, Swakopmund, Namibia
-        -Added full resolution plot option and true/false color blend plots
+    Datasets in a lazily loaded self.ds are also available as attributes, e.g. self.ref is self.ds['ref'].
     """
     
-    def __init__(self,filename):
-        self.filename= filename
-        #Get geospatial information
-        self.jday = int(filename[14:16+1]) #Julian day
-        self.year = int(filename[10:14])
-        self.month = cal_day(self.jday,self.year).split()[0]
-        self.day = int(cal_day(self.jday,self.year).split()[1]) #Calendar day
-        self.time = filename[18:19+1]+':'+filename[20:21+1]+' UTC'
-        if filename[1] == 'O':
-            self.satellite = 'Terra'
-        elif filename[1] == 'Y':
-            self.satellite = 'Aqua'
-        h = SD.SD(self.filename, SDC.READ)
-        self.lon = h.select('Longitude')[:,:]
-        self.lat = h.select('Latitude')[:,:]
-        SD.SD(self.filename).end()
-        
-    #Get radiances at different bands, account for scale and offsets
-    def radiance(self,b, hi = False):
+    def __getattr__(self,name):
+        ds = self.__dict__.get('ds')
+        if isinstance(ds,LazyDict) and (name in ds or name in ds.loaders): return ds[name]
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__,name))
+    
+    def close(self):
         """
-        Get radiances from MODIS level 1b file.
+        Release the pooled file handle for this granule. It will be reopened if more data is read.
+        """
+        handle_pool.close(self.path)
+    
+    def geo_1km(self,shape=None,cache_dir=None):
+        """
+        Get 1 km x 1 km longitude and latitude, interpolated from the 5 km grid with interp_geo().
+        
+        The result is computed once per object and shared by all plotting methods. If cache_dir (or the
+        module-level geo_cache_dir) is set, it is also saved there as a .npy file named after the granule
+        and memory-mapped on later runs.
         
         Parameters
         ----------
-        b : int
-        Band number, between 1-36.
+        shape : tuple
+        Shape of the output. Default is 5 times the shape of the 5 km grid.
         
-        hi : boolean
-        Hi- or lo-gain bands for bands 13 and 14. Set to True for hi-gain. Default is lo-gain.
+        cache_dir : string
+        Directory for the on-disk cache. Optional.
         
         Returns
         -------
-        data : masked array
-        1 km x 1 km array of radiance values in W/meters^2/micron/steradian. Invalid measurements are masked.
-        
-        Modification history
-        --------------------
-        Written: Michael Diamond, 08/04/2016, Seattle, WA
-        Modified: Michael Diamond, 08/08/2016, Seattle, WA
-            -Mask invalid data before scaling
+        lon, lat : array
         """
-        if not type(b) == int:
-            return 'Error: Band must be an integer between 1 and 36'
-        if not 1 <= b <= 36:
-            return 'Error: Band must be an integer between 1 and 36'
-        h = SD.SD(self.filename, SDC.READ)
-        if 1 <= b <= 2:
-            ind = b-1
-            rawdata = h.select('EV_250_Aggr1km_RefSB')
-            data = rawdata[ind,:,:]
-            attrs = rawdata.attributes(full=1)
-            #Mask invalid data
-            valid_min = attrs["valid_range"][0][0]        
-            valid_max = attrs["valid_range"][0][1]
-            _FillValue = attrs["_FillValue"][0]
-            invalid = np.logical_or(data > valid_max, data < valid_min)
-            data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-            #Apply scale and offset
-            offset = attrs["radiance_offsets"][0][ind]
-            scale = attrs["radiance_scales"][0][ind]
-            data = (data - offset) * scale
-            return data
-        elif 3 <= b <= 7:
-            ind = b-3
-            rawdata = h.select('EV_500_Aggr1km_RefSB')
-            data = rawdata[ind,:,:]
-            attrs = rawdata.attributes(full=1)
-            #Mask invalid data
-            valid_min = attrs["valid_range"][0][0]        
-            valid_max = attrs["valid_range"][0][1]
-            _FillValue = attrs["_FillValue"][0]
-            invalid = np.logical_or(data > valid_max,data < valid_min)
-            data = ma.MaskedArray(data,mask=invalid,fill_value=_FillValue)
-            #Apply scale and offset
-            offset = attrs["radiance_offsets"][0][ind]
-            scale = attrs["radiance_scales"][0][ind]
-            data = (data - offset) * scale
-            return data
-        elif 8 <= b <= 19:
-            if 8 <= b <= 12:
-                ind = b-8
-            elif b == 13:
-                if hi == False:
-                    ind = 5
-                elif hi == True:
-                    ind = 6
-            elif b == 14:
-                if hi == False:
-                    ind = 7
-                elif hi == True:
-                    ind = 8
-            elif 15 <= b <= 19:
-                ind = b-6
-            rawdata = h.select('EV_1KM_RefSB')
-            data = rawdata[ind,:,:]
-            attrs = rawdata.attributes(full=1)
-            #Mask invalid data
-            valid_min = attrs["valid_range"][0][0]        
-            valid_max = attrs["valid_range"][0][1]
-            _FillValue = attrs["_FillValue"][0]
-            invalid = np.logical_or(data > valid_max, data < valid_min)
-            data = ma.MaskedArray(data,mask=invalid,fill_value=_FillValue)
-            #Apply offset and scale
-            offset = attrs["radiance_offsets"][0][ind]
-            scale = attrs["radiance_scales"][0][ind]
-            data = (data - offset) * scale
-            return data
-        elif 20 <= b <= 36 and b != 26:
-            if 20 <= b <= 25:
-                ind = b-20
-            elif 27 <= b <= 36:
-                ind = b-21
-            rawdata = h.select('EV_1KM_Emissive')
-            data = rawdata[ind,:,:]
-            attrs = rawdata.attributes(full=1)
-            #Mask invalid data
-            valid_min = attrs["valid_range"][0][0]        
-            valid_max = attrs["valid_range"][0][1]
-            _FillValue = attrs["_FillValue"][0]
-            invalid = np.logical_or(data > valid_max, data < valid_min)
-            data = ma.MaskedArray(data,mask=invalid,fill_value=_FillValue)
-            #Apply offset and scale
-            offset = attrs["radiance_offsets"][0][ind]
-            scale = attrs["radiance_scales"][0][ind]
-            data = (data - offset) * scale
-            return data
-        elif b == 26:
-            ind = 0
-            rawdata = h.select('EV_Band26')
-            data = rawdata[:,:]
-            attrs = rawdata.attributes(full=1)
-            #Mask invalid data
-            valid_min = attrs["valid_range"][0][0]        
-            valid_max = attrs["valid_range"][0][1]
-            _FillValue = attrs["_FillValue"][0]
-            invalid = np.logical_or(data > valid_max, data < valid_min)
-            data = ma.MaskedArray(data,mask=invalid,fill_value=_FillValue)
-            #Apply offset and scale
-            offset = attrs["radiance_offsets"][0]
-            scale = attrs["radiance_scales"][0]
-            data = (data - offset) * scale
+        if shape is None: shape = (np.shape(self.lat)[0]*5, np.shape(self.lat)[1]*5)
+        shape = tuple(shape)
+        if not hasattr(self,'_geo'): self._geo = {}
+        if shape in self._geo: return self._geo[shape]
+        if cache_dir is None: cache_dir = geo_cache_dir
+        path = None
+        if cache_dir is not None:
+            key = hashlib.sha1(np.ascontiguousarray(self.lon).tobytes() + \
+            np.ascontiguousarray(self.lat).tobytes()).hexdigest()[:12]
+            path = os.path.join(cache_dir, '%s.%s.%dx%d.geo.npy' % (os.path.basename(getattr(self,'filename',None) or self.file), key, shape[0], shape[1]))
+        if path is not None and os.path.exists(path):
+            geo = np.load(path, mmap_mode='r')
+            self._geo[shape] = geo[0], geo[1]
+            return self._geo[shape]
+        lon, lat = interp_geo(self.lon,self.lat,5,shape)
+        if path is not None:
+            if not os.path.isdir(cache_dir): os.makedirs(cache_dir)
+            tmp = '%s.%d.tmp' % (path, os.getpid())
+            with open(tmp,'wb') as f: np.save(f, np.array([lon,lat]))
+            os.rename(tmp, path)
+        self._geo[shape] = lon, lat
+        return self._geo[shape]
+
+"""
+Lazy views of MOD021KM bands
+"""
+
+class BandView(object):
+    """
+    Lazy view of one MOD021KM/MYD021KM band kept as the native scaled integers.
+    
+    Masking against valid_range and the scale/offset calibration are only applied to the slice that is
+    accessed, so a full granule can stay in memory at 2 bytes per pixel.
+    
+    Parameters
+    ----------
+    raw : array
+    Stored (uint16) values of the band.
+    
+    offset, scale : float
+    Calibration so that value = (raw - offset) * scale.
+    
+    valid_range : tuple
+    (valid_min, valid_max) of the stored values. Values outside are masked.
+    
+    fill_value : int
+    Fill value used for masked arrays.
+    
+    band : int
+    MODIS band number.
+    
+    kind : string
+    'radiance', 'reflectance', or 'Tb'. Brightness temperatures are computed from the scaled radiances on access.
+    
+    dtype : numpy dtype
+    Output dtype of materialized slices. Default is np.float64.
+    
+    array_backend : string
+    'ma' for masked arrays or 'nan32' for float32 arrays with NaN for invalid values (the dtype is then always
+    float32). Default is arrays.array_backend, see arrays.
+    
+    Examples
+    --------
+    >>> v = granule.band_view(31, kind='Tb', dtype=np.float32)
+    >>> subset = v[500:700, 200:400] #masked float32 array
+    """
+    
+    def __init__(self,raw,offset,scale,valid_range,fill_value,band=None,kind='radiance',dtype=np.float64,\
+    array_backend=None):
+        self.array_backend = arrays.backend(array_backend)
+        if self.array_backend == 'nan32': dtype = np.float32
+        self.raw = raw
+        self.offset = offset
+        self.scale = scale
+        self.valid_range = valid_range
+        self.fill_value = fill_value
+        self.band = band
+        self.kind = kind
+        self.dtype = np.dtype(dtype)
+    
+    @property
+    def shape(self):
+        return self.raw.shape
+    
+    @property
+    def nbytes(self):
+        return self.raw.nbytes
+    
+    def astype(self,dtype):
+        """
+        Same view with a different output dtype (no data are copied).
+        """
+        if np.dtype(dtype) == self.dtype: return self
+        return BandView(self.raw,self.offset,self.scale,self.valid_range,self.fill_value,\
+        band=self.band,kind=self.kind,dtype=dtype,array_backend=self.array_backend)
+    
+    def mask(self,key=Ellipsis):
+        """
+        Invalid-data mask for a slice of the band.
+        """
+        raw = self.raw[key]
+        return np.logical_or(raw > self.valid_range[1], raw < self.valid_range[0])
+    
+    def __getitem__(self,key):
+        raw = self.raw[key]
+        invalid = np.logical_or(raw > self.valid_range[1], raw < self.valid_range[0])
+        data = np.asarray(raw,dtype=self.dtype)
+        if data is raw: data = data.copy()
+        data -= self.dtype.type(self.offset)
+        data *= self.dtype.type(self.scale)
+        if self.kind == 'Tb':
+            planck_Tb(data,self.band,out=data)
+        return arrays.masked(data,invalid,self.fill_value,self.array_backend)
+    
+    def values(self):
+        """
+        Materialize the whole band as a masked (or NaN) array.
+        """
+        return self[...]
+
+"""
+RGB composites
+"""
+
+#Standard true and false color blends, see https://earthdata.nasa.gov/faq#ed-rapid-response-faq
+#Band 6 is replaced by band 5 for Aqua because of striping
+def standard_composites(satellite):
+    """
+    Bands of the standard true and false color blends.
+    
+    Parameters
+    ----------
+    satellite : string
+    'Terra' or 'Aqua'.
+    
+    Returns
+    -------
+    composites : OrderedDict
+    Title: (R, G, B) bands.
+    """
+    if satellite == 'Terra': green_band = 6
+    else: green_band = 5
+    composites = OrderedDict()
+    composites['True color (1-4-3)'] = (1,4,3)
+    composites['False color (3-%s-7)' % green_band] = (3,green_band,7)
+    composites['False color (7-2-1)'] = (7,2,1)
+    return composites
+
+#Stored counts to 8-bit color look-up table
+def rgb_lut(offset,scale,valid_range,factor=0.4,gamma=1.):
+    """
+    Look-up table from the stored 16-bit counts of a reflective band to 8-bit color.
+    
+    Reflectance is linear in the counts, so the brightness stretch (reflectance/factor, clipped to 0-1)
+    and gamma are evaluated once per possible count instead of once per pixel. Invalid counts map to 0.
+    
+    Parameters
+    ----------
+    offset, scale : float
+    reflectance_offsets and reflectance_scales of the band.
+    
+    valid_range : tuple
+    (valid_min, valid_max) of the stored counts.
+    
+    factor : float
+    Reflectance that maps to full brightness. Default is 0.4.
+    
+    gamma : float
+    Gamma correction, applied as x**(1/gamma). Default is 1 (none).
+    
+    Returns
+    -------
+    lut : array
+    (65536,) uint8 array.
+    """
+    x = (np.arange(65536) - offset)*scale/factor
+    np.clip(x,0,1,out=x)
+    if gamma != 1: x **= 1./gamma
+    x *= 255
+    x += .5
+    lut = x.astype(np.uint8)
+    lut[:int(valid_range[0])] = 0
+    lut[int(valid_range[1])+1:] = 0
+    return lut
+
+#Write an 8-bit image to PNG
+def write_png(filename,image):
+    """
+    Write an 8-bit grayscale (rows, cols), RGB (rows, cols, 3), or RGBA (rows, cols, 4) array to a PNG file.
+    The first row of the array is the top of the image.
+    
+    Parameters
+    ----------
+    filename : string
+    Name of PNG file.
+    
+    image : array
+    uint8 array.
+    """
+    image = np.ascontiguousarray(image,dtype=np.uint8)
+    if image.ndim == 2: image = image[:,:,np.newaxis]
+    rows, cols, bands = image.shape
+    color_type = {1 : 0, 3 : 2, 4 : 6}[bands]
+    #Each scanline starts with filter type 0 (none)
+    lines = np.zeros((rows, cols*bands+1),dtype=np.uint8)
+    lines[:,1:] = image.reshape(rows, cols*bands)
+    def chunk(tag,data):
+        return struct.pack('>I',len(data)) + tag + data + struct.pack('>I',zlib.crc32(tag+data) & 0xffffffff)
+    f = open(filename,'wb')
+    try:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR',struct.pack('>IIBBBBB',cols,rows,8,color_type,0,0,0)))
+        f.write(chunk(b'IDAT',zlib.compress(lines.tobytes(),6)))
+        f.write(chunk(b'IEND',b''))
+    finally:
+        f.close()
+
+"""
+Class for MOD021KM/MYD021KM calibrated radiance/reflectance files from LAADS Web (https://ladsweb.nascom.nasa.gov/)
+"""
+
+class MOD021KM(_Swath):
+    """
+    Create object to analyze a MOD021KM/MYD021KM calibrated radiance/reflectance file from LAADS Web (https://ladsweb.nascom.nasa.gov/).
+    
+    Parameters
+    ----------
+    filename : string
+    Name of MOD021KM/MYD021KM file to analyze.
+    
+    bbox : tuple or dict
+    Only read the part of the swath inside (lon_min, lat_min, lon_max, lat_max) or a KH93-style
+    {'N','S','E','W'} box. The window is found on the 5 km geolocation grid and all band reads are
+    limited to it. Optional; default is the whole granule.
+    
+    array_backend : string
+    How invalid measurements are marked: 'ma' for masked arrays, 'nan32' for float32 arrays with NaN.
+    Default is arrays.array_backend, see arrays.
+    
+    Methods
+    -------
+    subset: Get a new object for the same file restricted to a lon/lat box.
+    
+    bands: Get a (nband, rows, cols) cube of several bands, reading each dataset once.
+    
+    emissive_Tb: Get brightness temperatures for a cube of emissive bands in one pass.
+    
+    views, band_view: Get lazy BandView objects that keep the stored integers and scale on access.
+    
+    radiance: Get array of calibrated radiances.
+    
+    reflectance: Get array of calibrated reflectances.
+    
+    brightness_temperature: Get array of brightness temperature.
+        Also, Tb() returns equivalent array.
+    
+    quick_plot: Fast plot of data. Intended as a check/first look at the data.
+    
+    plot: Plot of data at 1 km x 1 km resolution.
+    
+    composites, rgb: Get 8-bit RGB composites of solar bands (e.g. for write_png).
+    
+    blend: Plot a non-projected RGB blend of 3 solar bands.
+    
+    standard_blends: Plots three standard true and false color blends (non-projected).
+    
+    close: Release the pooled file handle. MOD021KM can also be used as a context manager.
+    
+    Returns
+    -------
+    filename, month, time, satellite: string
+    Name of MOD021KM/MYD021KM file used, month, time of retrieval, satellite (Terra or Aqua).
+    
+    jday, year, day : int
+    Julian day, year, and calendar day.
+    
+    lon, lat : array
+    Longitude and latitude (Note: 5 km x 5 km), cropped to the window if bbox is given.
+    
+    rows, cols : slice
+    Window of the 1 km swath that is read.
+    
+    Modification history
+    --------------------
+    Written (v.1.0): Michael Diamond, 08/04/2016, Seattle, WA
+    Modified (v.1.1): Michael Diamond, 08/08/2016, Seattle, WA
+        -Fixed bug in brightness temperature
+        -Changed aesthetics of plotting methods
+        -Masks invalid data before applying scale and offset
+    Modified (v.1.2): Michael Diamond, 09/14/2016, Swakopmund, Namibia
+        -Added full resolution plot option and true/false color blend plots
+    """
+    
+    def __init__(self,filename,bbox=None,array_backend=None):
+        self.filename= filename
+        self.array_backend = arrays.backend(array_backend)
+        #Get geospatial information
+        name = os.path.basename(filename)
+        self.jday = int(name[14:16+1]) #Julian day
+        self.year = int(name[10:14])
+        self.month = cal_day(self.jday,self.year).split()[0]
+        self.day = int(cal_day(self.jday,self.year).split()[1]) #Calendar day
+        self.time = name[18:19+1]+':'+name[20:21+1]+' UTC'
+        if name[1] == 'O':
+            self.satellite = 'Terra'
+        elif name[1] == 'Y':
+            self.satellite = 'Aqua'
+        self.path = os.path.abspath(filename)
+        self._attrs = {} #Parsed SDS attributes
+        self.lon = self._select('Longitude')[:,:]
+        self.lat = self._select('Latitude')[:,:]
+        self.bbox = bbox
+        self.rows = slice(None)
+        self.cols = slice(None)
+        if bbox is not None:
+            window = bbox_window(self.lon,self.lat,bbox,5,self._select('EV_1KM_Emissive').info()[2][1:])
+            if window is None:
+                raise ValueError('No pixels of %s inside bbox %s' % (filename, str(bbox)))
+            geo_rows, geo_cols, self.rows, self.cols = window
+            self.lon = self.lon[geo_rows,geo_cols]
+            self.lat = self.lat[geo_rows,geo_cols]
+    
+    def _select(self,name):
+        return handle_pool.select(self.path, name)
+    
+    def subset(self,bbox):
+        """
+        Get a new MOD021KM object for the same file that only reads the part of the swath inside bbox.
+        
+        Parameters
+        ----------
+        bbox : tuple or dict
+        (lon_min, lat_min, lon_max, lat_max) or a KH93-style {'N','S','E','W'} box.
+        """
+        return MOD021KM(self.filename,bbox=bbox,array_backend=self.array_backend)
+    
+    def _attributes(self,name):
+        if name not in self._attrs:
+            self._attrs[name] = self._select(name).attributes(full=1)
+        return self._attrs[name]
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self,*args):
+        self.close()
+        return False
+        
+    #Read raw scaled integers for several bands, one hyperslab per parent dataset
+    def _read_raw(self,bands,prefix,hi=False,stride=1):
+        """
+        Read the stored integers for a list of bands, grouped by parent dataset.
+        With stride > 1, only every stride-th row and column is read, starting at the center
+        of the first block (pixel 2 for stride 5, the 5 km geolocation points).
+        
+        Returns
+        -------
+        raw, offset, scale, valid_min, valid_max, _FillValue
+        (nband, rows, cols) integer cube and per-band calibration (prefix is 'radiance' or 'reflectance').
+        """
+        groups = OrderedDict()
+        for i, b in enumerate(bands):
+            sds, ind = band_location(b,hi)
+            groups.setdefault(sds,[]).append((i,ind))
+        rows, cols = self.rows, self.cols
+        if stride > 1:
+            rows = slice((rows.start or 0) + stride//2, rows.stop, stride)
+            cols = slice((cols.start or 0) + stride//2, cols.stop, stride)
+        n = len(bands)
+        raw = None
+        offset = np.empty(n)
+        scale = np.empty(n)
+        valid_min = np.empty(n)
+        valid_max = np.empty(n)
+        for sds, members in groups.items():
+            pos = [i for i, ind in members]
+            attrs = self._attributes(sds)
+            if sds == 'EV_Band26':
+                data = self._select(sds)[rows,cols][np.newaxis]
+                data = data[[0]*len(pos)]
+                offset[pos] = np.asarray(attrs["%s_offsets" % prefix][0],dtype=float).ravel()[0]
+                scale[pos] = np.asarray(attrs["%s_scales" % prefix][0],dtype=float).ravel()[0]
+            else:
+                inds = [ind for i, ind in members]
+                lo = min(inds)
+                data = self._select(sds)[lo:max(inds)+1,rows,cols]
+                data = data[[ind-lo for ind in inds]]
+                offset[pos] = np.asarray(attrs["%s_offsets" % prefix][0],dtype=float)[inds]
+                scale[pos] = np.asarray(attrs["%s_scales" % prefix][0],dtype=float)[inds]
+            if raw is None:
+                raw = np.empty((n,)+data.shape[1:],dtype=data.dtype)
+                _FillValue = attrs["_FillValue"][0]
+            raw[pos] = data
+            valid_min[pos] = attrs["valid_range"][0][0]
+            valid_max[pos] = attrs["valid_range"][0][1]
+        return raw, offset, scale, valid_min, valid_max, _FillValue
+    
+    def _check_bands(self,bands,kind):
+        if kind not in ['radiance','reflectance','Tb']:
+            return "Error: kind must be 'radiance', 'reflectance', 'Tb', or 'brightness temperature'"
+        for b in bands:
+            if not type(b) == int or not 1 <= b <= 36:
+                return 'Error: Band must be an integer between 1 and 36'
+            if kind == 'reflectance' and 20 <= b <= 36 and b != 26:
+                return 'Error: Band must be an integer between 1 and 19 or 26'
+    
+    #Read several bands at once, one hyperslab per parent dataset
+    def bands(self,bands,kind='reflectance',hi=False,stride=1,reduce='stride'):
+        """
+        Get a cube of several bands from MODIS level 1b file.
+        
+        Requested bands are grouped by the dataset that holds them (EV_250_Aggr1km_RefSB, EV_500_Aggr1km_RefSB,
+        EV_1KM_RefSB, EV_1KM_Emissive, EV_Band26). Each dataset is read once with a single hyperslab and the
+        per-band scales and offsets are applied in one broadcast.
+        
+        Parameters
+        ----------
+        bands : list of int
+        Band numbers, between 1-36. Order is kept in the output.
+        
+        kind : string
+        Choose 'radiance', 'reflectance', 'Tb', or 'brightness temperature'. Default is reflectance.
+        
+        hi : boolean
+        Hi- or lo-gain bands for bands 13 and 14. Set to True for hi-gain. Default is lo-gain.
+        
+        stride : int
+        Decimation factor, e.g. 5 for the 5 km geolocation grid. Default is 1 (full resolution).
+        
+        reduce : string
+        How to decimate when stride > 1. 'stride' reads only the center pixel of each stride x stride block
+        straight from the file. 'mean' averages the valid stored values in each block before they are scaled;
+        it still reads and decodes every full resolution pixel, so only 'stride' cuts the read cost. Both give
+        one value per block center, the same shape as lon/lat for stride 5. Default is 'stride'.
+        
+        Returns
+        -------
+        data : masked array
+        (nband, rows, cols) array of values in the same units as radiance(), reflectance() or Tb(). Invalid measurements are masked
+        (NaN in a float32 array with array_backend='nan32').
+        """
+        if kind == 'brightness temperature': kind = 'Tb'
+        bands = list(bands)
+        error = self._check_bands(bands,kind)
+        if error: return error
+        if kind == 'reflectance': prefix = 'reflectance'
+        else: prefix = 'radiance'
+        if reduce not in ['stride','mean']:
+            return "Error: reduce must be 'stride' or 'mean'"
+        if reduce == 'stride':
+            raw, offset, scale, valid_min, valid_max, _FillValue = self._read_raw(bands,prefix,hi,stride)
+        else:
+            raw, offset, scale, valid_min, valid_max, _FillValue = self._read_raw(bands,prefix,hi)
+        #Mask invalid data
+        invalid = np.logical_or(raw > valid_max[:,np.newaxis,np.newaxis], raw < valid_min[:,np.newaxis,np.newaxis])
+        if reduce == 'mean' and stride > 1:
+            #Keep the blocks that have a center pixel, the ones 'stride' reads
+            rows = len(range(stride//2,np.shape(raw)[-2],stride))
+            cols = len(range(stride//2,np.shape(raw)[-1],stride))
+            raw, invalid = block_mean(raw,invalid,stride)
+            raw, invalid = raw[...,:rows,:cols], invalid[...,:rows,:cols]
+        #Apply offset and scale
+        if self.array_backend == 'nan32':
+            data = raw.astype(np.float32)
+            data -= offset[:,np.newaxis,np.newaxis].astype(np.float32)
+            data *= scale[:,np.newaxis,np.newaxis].astype(np.float32)
+            if kind == 'Tb':
+                with np.errstate(divide='ignore',invalid='ignore'): planck_Tb(data,bands,out=data)
+            data[invalid] = np.nan
             return data
-        SD.SD(self.filename).end()
+        data = (raw - offset[:,np.newaxis,np.newaxis]) * scale[:,np.newaxis,np.newaxis]
+        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
+        if kind == 'Tb':
+            planck_Tb(data.data,bands,out=data.data)
+        return data
+    
+    #Lazy band views that keep the native scaled integers
+    def views(self,bands,kind='radiance',hi=False,dtype=np.float64,cache=False):
+        """
+        Get lazy views of several bands. Data stay in memory as the stored 16-bit integers and are only
+        masked and scaled when a slice of a view is accessed, which uses about a quarter of the memory of
+        a float64 masked array. Datasets are read as in bands().
+        
+        Parameters
+        ----------
+        bands : list of int
+        Band numbers, between 1-36.
+        
+        kind : string
+        Choose 'radiance', 'reflectance', 'Tb', or 'brightness temperature'. Default is radiance.
+        
+        hi : boolean
+        Hi- or lo-gain bands for bands 13 and 14. Default is lo-gain.
+        
+        dtype : numpy dtype
+        Output dtype of materialized slices, e.g. np.float32. Default is np.float64.
+        
+        cache : boolean
+        If True, keep the views on the object so later calls for the same bands don't read the file again.
+        
+        Returns
+        -------
+        views : list of BandView
+        One view per band, in the requested order.
+        """
+        if kind == 'brightness temperature': kind = 'Tb'
+        bands = list(bands)
+        error = self._check_bands(bands,kind)
+        if error: return error
+        if not hasattr(self,'_views'): self._views = {}
+        missing = [b for b in bands if (b,kind,hi) not in self._views]
+        views = {}
+        if missing:
+            if kind == 'reflectance': prefix = 'reflectance'
+            else: prefix = 'radiance'
+            raw, offset, scale, valid_min, valid_max, _FillValue = self._read_raw(missing,prefix,hi)
+            for i, b in enumerate(missing):
+                views[b] = BandView(raw[i],offset[i],scale[i],(valid_min[i],valid_max[i]),_FillValue,\
+                band=b,kind=kind,dtype=dtype,array_backend=self.array_backend)
+                if cache: self._views[(b,kind,hi)] = views[b]
+        out = []
+        for b in bands:
+            if b in views: out.append(views[b])
+            else: out.append(self._views[(b,kind,hi)].astype(dtype))
+        return out
+    
+    def band_view(self,b,kind='radiance',hi=False,dtype=np.float64,cache=False):
+        """
+        Get a lazy view of a single band. See views().
+        """
+        view = self.views([b],kind,hi,dtype,cache)
+        if type(view) == str: return view
+        return view[0]
+    
+    #Get radiances at different bands, account for scale and offsets
+    def radiance(self,b, hi = False):
+        """
+        Get radiances from MODIS level 1b file.
+        
+        Parameters
+        ----------
+        b : int
+        Band number, between 1-36.
+        
+        hi : boolean
+        Hi- or lo-gain bands for bands 13 and 14. Set to True for hi-gain. Default is lo-gain.
+        
+        Returns
+        -------
+        data : masked array
+        1 km x 1 km array of radiance values in W/meters^2/micron/steradian. Invalid measurements are masked.
+        
+        Modification history
+        --------------------
+        Written: Michael Diamond, 08/04/2016, Seattle, WA
+        Modified: Michael Diamond, 08/08/2016, Seattle, WA
+            -Mask invalid data before scaling
+        """
+        if not type(b) == int:
+            return 'Error: Band must be an integer between 1 and 36'
+        if not 1 <= b <= 36:
+            return 'Error: Band must be an integer between 1 and 36'
+        return self.bands([b],'radiance',hi)[0]
 
     #Get reflectances at different bands, account for scale and offsets
     def reflectance(self, b, hi = False):
@@ -648,87 +1589,9 @@ class MOD021KM(object):
             return 'Error: Band must be an integer between 1 and 19 or 26'
         if not 1 <= b <= 36:
             return 'Error: Band must be an integer between 1 and 19 or 26'
-        h = SD.SD(self.filename, SDC.READ)
-        if 1 <= b <= 2:
-            ind = b-1
-            rawdata = h.select('EV_250_Aggr1km_RefSB')
-            data = rawdata[ind,:,:]
-            attrs = rawdata.attributes(full=1)
-            #Mask invalid data
-            valid_min = attrs["valid_range"][0][0]        
-            valid_max = attrs["valid_range"][0][1]
-            _FillValue = attrs["_FillValue"][0]
-            invalid = np.logical_or(data > valid_max,data < valid_min)
-            data = ma.MaskedArray(data,mask=invalid,fill_value=_FillValue)
-            #Apply offset and scale
-            offset = attrs["reflectance_offsets"][0][ind]
-            scale = attrs["reflectance_scales"][0][ind]
-            data = (data - offset) * scale
-            return data
-        elif 3 <= b <= 7:
-            ind = b-3
-            rawdata = h.select('EV_500_Aggr1km_RefSB')
-            data = rawdata[ind,:,:]
-            attrs = rawdata.attributes(full=1)
-            #Mask invalid data
-            valid_min = attrs["valid_range"][0][0]        
-            valid_max = attrs["valid_range"][0][1]
-            _FillValue = attrs["_FillValue"][0]
-            invalid = np.logical_or(data > valid_max,data < valid_min)
-            data = ma.MaskedArray(data,mask=invalid,fill_value=_FillValue)
-            #Apply offset and scale
-            offset = attrs["reflectance_offsets"][0][ind]
-            scale = attrs["reflectance_scales"][0][ind]
-            data = (data - offset) * scale
-            return data
-        elif 8 <= b <= 19:
-            if 8 <= b <= 12:
-                ind = b-8
-            elif b == 13:
-                if hi == False:
-                    ind = 5
-                elif hi == True:
-                    ind = 6
-            elif b == 14:
-                if hi == False:
-                    ind = 7
-                elif hi == True:
-                    ind = 8
-            elif 15 <= b <= 19:
-                ind = b-6
-            rawdata = h.select('EV_1KM_RefSB')
-            data = rawdata[ind,:,:]
-            attrs = rawdata.attributes(full=1)
-            #Mask invalid data
-            valid_min = attrs["valid_range"][0][0]        
-            valid_max = attrs["valid_range"][0][1]
-            _FillValue = attrs["_FillValue"][0]
-            invalid = np.logical_or(data > valid_max,data < valid_min)
-            data = ma.MaskedArray(data,mask=invalid,fill_value=_FillValue)
-            #Apply offset and scale
-            offset = attrs["reflectance_offsets"][0][ind]
-            scale = attrs["reflectance_scales"][0][ind]
-            data = (data - offset) * scale
-            return data
-        elif 20 <= b <= 36 and b != 26:
+        if 20 <= b <= 36 and b != 26:
             return 'Error: Band must be an integer between 1 and 19 or 26'
-        elif b == 26:
-            ind = 0
-            rawdata = h.select('EV_Band26')
-            data = rawdata[:,:]
-            attrs = rawdata.attributes(full=1)
-            #Mask invalid data
-            valid_min = attrs["valid_range"][0][0]        
-            valid_max = attrs["valid_range"][0][1]
-            _FillValue = attrs["_FillValue"][0]
-            invalid = np.logical_or(data > valid_max,data < valid_min)
-            #Apply offset and scale
-            offset = attrs["reflectance_offsets"][0]
-            scale = attrs["reflectance_scales"][0]
-            data = (data - offset) * scale
-            data = ma.MaskedArray(data,mask=invalid,fill_value=_FillValue)
-            return data
-        SD.SD(self.filename).end()
+        return self.bands([b],'reflectance',hi)[0]
 
     #Calculate brightness temperature
     def Tb(self,band,hi=False):
@@ -754,18 +1617,10 @@ class MOD021KM(object):
         Modified: Michael Diamond, 08/08/2016, Seattle, WA
             -Fixed syntax error in constants
         """
-        h = 6.62607004*10**-34 #m2 kg / s
-        c = 299792458. #m/s
-        k = 1.38064852*10**-23 #m2 kg s-2 K-1
-        B = self.radiance(band,hi)*10.**6 #In W/m2/m/sr
-        if 1 <= band <= 19:
-            wvl = avg_wavelength(band)/10.**9 #In m
-        elif 20 <= band <= 36:
-            wvl = avg_wavelength(band)/10.**6 #In m
-        else:
-            print('Error: Band must be an integer between 1 and 36.')
-        Tb = (h*c/(k*wvl)/(np.log(1+2.*h*c**2/(B*wvl**5)))) #In K
-        return Tb
+        radiance = self.radiance(band,hi)
+        if self.array_backend == 'nan32':
+            with np.errstate(divide='ignore',invalid='ignore'): return planck_Tb(radiance,band,out=radiance)
+        return planck_Tb(radiance,band)
     
     def brightness_temperature(self,band,hi=False):
         """
@@ -789,9 +1644,57 @@ class MOD021KM(object):
         Written: Michael Diamond, 08/04/2016, Seattle, WA
         """
         return self.Tb(band,hi)
+    
+    #Brightness temperature for a whole cube of emissive bands
+    def emissive_Tb(self,bands=EMISSIVE,dtype=np.float32,lut=False):
+        """
+        Brightness temperatures for several emissive bands in one vectorized pass.
+        
+        Parameters
+        ----------
+        bands : list of int
+        Emissive bands (20-25, 27-36). Default is all 16.
+        
+        dtype : numpy dtype
+        Output dtype. Default is np.float32; the conversion is done in place in an array of this dtype.
+        
+        lut : boolean
+        If True, look up Tb from a table indexed by the stored counts (see planck_Tb_lut) instead of
+        evaluating the Planck function at every pixel. Tables are kept on the object for later calls.
+        
+        Returns
+        -------
+        Tb : masked array
+        (nband, rows, cols) array of brightness temperatures in Kelvin. Invalid measurements are masked
+        (NaN with array_backend='nan32').
+        """
+        bands = list(bands)
+        for b in bands:
+            if not type(b) == int or not (20 <= b <= 25 or 27 <= b <= 36):
+                return 'Error: Band must be an integer between 20 and 25 or 27 and 36'
+        raw, offset, scale, valid_min, valid_max, _FillValue = self._read_raw(bands,'radiance')
+        invalid = np.logical_or(raw > valid_max[:,np.newaxis,np.newaxis], raw < valid_min[:,np.newaxis,np.newaxis])
+        old = np.seterr(divide='ignore',invalid='ignore')
+        try:
+            if lut:
+                if not hasattr(self,'_Tb_lut'): self._Tb_lut = {}
+                data = np.empty(raw.shape,dtype=dtype)
+                for i, b in enumerate(bands):
+                    key = (b,np.dtype(dtype).str)
+                    if key not in self._Tb_lut:
+                        self._Tb_lut[key] = planck_Tb_lut(offset[i],scale[i],b,int(valid_max[i]),dtype)
+                    np.take(self._Tb_lut[key],raw[i],mode='clip',out=data[i])
+            else:
+                data = raw.astype(dtype)
+                data -= offset[:,np.newaxis,np.newaxis].astype(dtype)
+                data *= scale[:,np.newaxis,np.newaxis].astype(dtype)
+                planck_Tb(data,bands,out=data)
+        finally:
+            np.seterr(**old)
+        return arrays.masked(data,invalid,_FillValue,self.array_backend)
 
     #Quickly plot data as check/first pass
-    def quick_plot(self,band,hi=False,data='radiance',projection='merc'):
+    def quick_plot(self,band,hi=False,data='radiance',projection='merc',num=None):
         """
         Quick plot data for a single MOD021KM or MYD021KM file. Intended as a check or first pass at data.
         
@@ -809,9 +1712,12 @@ class MOD021KM(object):
         projection : string
         Use 'merc' for mercator, 'global' for global plot (kav7), 'satellite' for Terra/Aqua's eye view.
         
+        num : int or string
+        Figure number/name to draw on, see render.figure(). Optional.
+        
         Returns
         -------
-        Plot of data subsampled to 5 km x 5 km resolution.
+        Plot of data subsampled to 5 km x 5 km resolution. Only the subsampled pixels are read from the file. Returns the matplotlib figure.
         
         Modification history
         --------------------
@@ -822,8 +1728,8 @@ class MOD021KM(object):
         if not type(band) == int or band > 36:
             print('Error: Band must be an integer from 1-36')
             return
-        plt.figure()
-        plt.clf()
+        fig = render.figure(num,name='MOD021KM.quick_plot')
+        ax = fig.add_subplot(1,1,1)
         font = 'Arial'
         size = 20
         max_lon = self.lon.max()
@@ -831,52 +1737,52 @@ class MOD021KM(object):
         min_lon = self.lon.min()
         min_lat = self.lat.min()
         if projection == 'merc':
-            m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-            urcrnrlat=max_lat+1,projection='merc',resolution='l')
+            m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+            urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
             m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0])
             m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1])
         elif projection == 'global':
-            m = Basemap(lon_0=0,projection='kav7',resolution='c')
+            m = render.basemap(lon_0=0,projection='kav7',resolution='c',ax=ax)
             m.drawparallels(np.arange(-180,180,15),labels=[1,0,0,0])
             m.drawmeridians(np.arange(0,360,45),labels=[1,1,0,1])
         elif projection == 'satellite':
-            m = Basemap(projection='nsper',lon_0=self.lon.mean(),lat_0=self.lat.mean(),\
-            resolution='l',satellite_height=705000)
+            m = render.basemap(projection='nsper',lon_0=self.lon.mean(),lat_0=self.lat.mean(),\
+            resolution='l',satellite_height=705000,ax=ax)
             m.bluemarble(alpha=.75)
         else:
             print("Error: Projection must be 'merc', 'global', or 'satellite'.")
             return
-        m.drawcoastlines()
-        m.drawcountries()
+        render.background(m,ax,land=None)
         if data == 'radiance': 
-            d = self.radiance(band,hi)[::5,::5]
+            d = self.bands([band],'radiance',hi,stride=5)[0]
             vmin = 0
-            vmax = d.max()
+            vmax = arrays.nanmax(d)
             cmap = colorbar(band)
         elif data == 'reflectance': 
-            d = self.reflectance(band,hi)[::5,::5]
+            d = self.bands([band],'reflectance',hi,stride=5)[0]
             vmin = 0
             vmax = 1
             cmap = colorbar(band)
         elif data == 'brightness temperature' or data == 'Tb':
-            d = self.Tb(band,hi)[::5,::5]
-            vmin = d.min()
-            vmax = d.max()
+            d = self.bands([band],'Tb',hi,stride=5)[0]
+            vmin = arrays.nanmin(d)
+            vmax = arrays.nanmax(d)
             cmap = colorbar(band)
-        m.pcolormesh(self.lon,self.lat,d[:np.shape(self.lon)[0],:np.shape(self.lat)[1]],\
+        im = m.pcolormesh(self.lon,self.lat,d[:np.shape(self.lon)[0],:np.shape(self.lat)[1]],\
         shading='gouraud',cmap=cmap,latlon=True,vmin=vmin,vmax=vmax)
-        cbar = m.colorbar()
+        cbar = m.colorbar(im,fig=fig)
         cbar.ax.tick_params(labelsize=size-4) 
         label = {'radiance' : '[W/m^2/micron/sr]', 'reflectance' : '[unitless]',\
         'brightness temperature' : '[K]', 'Tb' : '[K]'}
         cbar.set_label(label['%s' % data],fontname=font,fontsize=size-2)
-        plt.title('Band %s %s for %s %s, %s, from %s' % \
+        ax.set_title('Band %s %s for %s %s, %s, from %s' % \
         (band,data,self.month,self.day,self.year,self.satellite), fontname=font,fontsize=size)
+        return fig
         
     #Plot data at full resolution
     def plot(self,band,hi=False,data='radiance',projection='merc',\
         cm=None,coastlines=True,countries=True,land_color=None,lake_color=None,\
-        ocean_color=None):
+        ocean_color=None,num=None):
         """
         Plot data for a single MOD021KM or MYD021KM file. Gives more control than quick_plot().
         
@@ -903,9 +1809,12 @@ class MOD021KM(object):
         land_color, lake_color, ocean_color : string
         Set solid color for land, lake, and ocean surfaces in background. Optional.
         
+        num : int or string
+        Figure number/name to draw on, see render.figure(). Optional.
+        
         Returns
         -------
-        Plot of data at "full" 1 km x 1 km resolution.
+        Plot of data at "full" 1 km x 1 km resolution. Returns the matplotlib figure.
         
         Modification history
         --------------------
@@ -919,28 +1828,27 @@ class MOD021KM(object):
         if data == 'reflectance' and band not in ref_valid:
             print('Error: Band must be an integer between 1 and 19 or 26 for reflectance')
             return
-        plt.figure()
-        plt.clf()
+        fig = render.figure(num,name='MOD021KM.plot')
+        ax = fig.add_subplot(1,1,1)
         font = 'Arial'
         size = 20
-        lat = zoom(self.lat,5.)
-        lon = zoom(self.lon,5.)
+        lon, lat = self.geo_1km()
         max_lon = lon.max()
         max_lat = lat.max()
         min_lon = lon.min()
         min_lat = lat.min()
         if projection == 'merc':
-            m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-            urcrnrlat=max_lat+1,projection='merc',resolution='l')
+            m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+            urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
             m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0])
             m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1])
         elif projection == 'global':
-            m = Basemap(lon_0=0,projection='kav7',resolution='c')
+            m = render.basemap(lon_0=0,projection='kav7',resolution='c',ax=ax)
             m.drawparallels(np.arange(-180,180,15),labels=[1,0,0,0])
             m.drawmeridians(np.arange(0,360,45),labels=[1,1,0,1])
         elif projection == 'satellite':
-            m = Basemap(projection='nsper',lon_0=self.lon.mean(),lat_0=self.lat.mean(),\
-            resolution='l',satellite_height=705000)
+            m = render.basemap(projection='nsper',lon_0=self.lon.mean(),lat_0=self.lat.mean(),\
+            resolution='l',satellite_height=705000,ax=ax)
             m.bluemarble(alpha=.75)
         else:
             print("Error: Projection must be 'merc', 'global', or 'satellite'")
@@ -966,71 +1874,122 @@ class MOD021KM(object):
         if data == 'radiance': 
             d = self.radiance(band,hi)
             vmin = 0
-            vmax = d.max()
+            vmax = arrays.nanmax(d)
         elif data == 'reflectance': 
             d = self.reflectance(band,hi)
             vmin = 0
             vmax = 1
         elif data == 'brightness temperature' or data == 'Tb':
             d = self.Tb(band,hi)
-            vmin = d.min()
-            vmax = d.max()
+            vmin = arrays.nanmin(d)
+            vmax = arrays.nanmax(d)
         if cm == None:
-            m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+            im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
             cmap=colorbar(band),latlon=True,vmin=vmin,vmax=vmax)
         else:
             try:
-                m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+                im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
                 cmap=cm,latlon=True,vmin=vmin,vmax=vmax)
             except:
                 print("Woops, that doesn't look like a valid colormap. Using default.")
-                m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+                im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
                 cmap=colorbar(band),latlon=True,vmin=vmin,vmax=vmax)
-        cbar = m.colorbar()
+        cbar = m.colorbar(im,fig=fig)
         cbar.ax.tick_params(labelsize=size-4) 
         label = {'radiance' : '[W/m^2/micron/sr]', 'reflectance' : '[unitless]',\
         'brightness temperature' : '[K]', 'Tb' : '[K]'}
         cbar.set_label(label['%s' % data],fontname=font,fontsize=size-2)
-        plt.title('Band %s %s for %s %s, %s, from %s' % \
+        ax.set_title('Band %s %s for %s %s, %s, from %s' % \
         (band,data,self.month,self.day,self.year,self.satellite), fontname=font,fontsize=size)
+        return fig
 
-    def blend(self,R,G,B):
+    #8-bit RGB composites from one read of the needed bands
+    def composites(self,composites=None,factor=0.4,gamma=1.,stride=1):
         """
-        Plot a non-projected blend based on 3 solar bands.
+        Make 8-bit RGB composites of solar bands. Every band needed by any of the composites is read once,
+        and the stretch is applied through per-band look-up tables on the stored counts (see rgb_lut).
         
         Parameters
         ----------
-        R, G, B : int
-        Band number for red, green, and blue component, respectivlely, of blended RGB image.
+        composites : dict
+        Name: (R, G, B) bands. Default is the three standard blends from standard_composites().
+        
+        factor : float
+        Reflectance that maps to full brightness. Default is 0.4.
+        
+        gamma : float
+        Gamma correction. Default is 1 (none).
+        
+        stride : int
+        Decimation factor, see bands(). Default is 1.
         
         Returns
         -------
-        Unprojected plot of RGB blend.
+        rgbs : OrderedDict
+        Name: (rows, cols, 3) uint8 array in swath order. Invalid pixels are black.
+        Use write_png() to save one directly; rgb[::-1,::-1] gives the orientation of blend().
+        """
+        if composites is None: composites = standard_composites(self.satellite)
+        bands = []
+        for rgb in composites.values():
+            for b in rgb:
+                if b not in bands: bands.append(b)
+        error = self._check_bands(bands,'reflectance')
+        if error: return error
+        raw, offset, scale, valid_min, valid_max, _FillValue = self._read_raw(bands,'reflectance',stride=stride)
+        luts = {}
+        rgbs = OrderedDict()
+        for name, rgb in composites.items():
+            image = np.empty(raw.shape[1:]+(3,),dtype=np.uint8)
+            for k, b in enumerate(rgb):
+                i = bands.index(b)
+                if b not in luts:
+                    luts[b] = rgb_lut(offset[i],scale[i],(valid_min[i],valid_max[i]),factor,gamma)
+                np.take(luts[b],raw[i],mode='clip',out=image[:,:,k])
+            rgbs[name] = image
+        return rgbs
+    
+    def rgb(self,R,G,B,factor=0.4,gamma=1.,stride=1):
+        """
+        8-bit RGB composite of 3 solar bands. See composites().
+        """
+        rgbs = self.composites({'rgb' : (R,G,B)},factor,gamma,stride)
+        if type(rgbs) == str: return rgbs
+        return rgbs['rgb']
+    
+    def blend(self,R,G,B,num=None):
+        """
+        Plot a non-projected blend based on 3 solar bands.
+        
+        Parameters
+        ----------
+        R, G, B : int
+        Band number for red, green, and blue component, respectivlely, of blended RGB image.
+        
+        num : int or string
+        Figure number/name to draw on, see render.figure(). Optional.
+        
+        Returns
+        -------
+        Unprojected plot of RGB blend. Returns the matplotlib figure.
         
         Modification history
         --------------------
         Written: Michael Diamond, 09/14/2016, Swakopmund, Namibia
         """
-        plt.figure()
+        fig = render.figure(num,name='MOD021KM.blend')
+        ax = fig.add_subplot(1,1,1)
         fontname = 'Arial'
         fontsize = 20
-        red = self.reflectance(R)
-        green = self.reflectance(G)
-        blue = self.reflectance(B)
-        factor = 0.4 # factor to increase the brightness
-        rgb = np.zeros((2030, 1354,3))
-        rgb[:,:,0] = red/factor
-        rgb[:,:,1] = green/factor
-        rgb[:,:,2] = blue/factor
-        rgb[ rgb > 1 ] = 1.0
-        rgb[ rgb < 0 ] = 0.0
-        rgb = np.fliplr(rgb)
-        plt.imshow(rgb,origin='lower')
-        plt.xticks([])
-        plt.yticks([])
-        plt.title('Blend: RGB = %s-%s-%s' % (R,G,B),fontname=fontname,fontsize=fontsize)
-    
-    def standard_blends(self):
+        rgb = self.rgb(R,G,B)
+        if type(rgb) == str: return rgb
+        ax.imshow(rgb[:,::-1],origin='lower')
+        ax.set_xticks([])
+        ax.set_yticks([])
+        ax.set_title('Blend: RGB = %s-%s-%s' % (R,G,B),fontname=fontname,fontsize=fontsize)
+        return fig
+    
+    def standard_blends(self,num="blends"):
         """
         Plot one true color and two false color blends. 
         
@@ -1038,1387 +1997,1030 @@ class MOD021KM(object):
         
         ***Note: Due to striping issues with Aqua band 6, band 5 is used instead for Aqua only.***
         
+        Parameters
+        ----------
+        num : int or string
+        Figure number/name to draw on, see render.figure(). Optional.
+        
         Returns
         -------
-        Three unprojected plots of standard true and false color blends.
+        Three unprojected plots of standard true and false color blends. Returns the matplotlib figure.
         
         Modification history
         --------------------
         Written: Michael Diamond, 09/14/2016, Swakopmund, Namibia
         """
-        plt.figure("blends")
-        plt.clf()
+        fig = render.figure(num,name='MOD021KM.standard_blends')
         fontname = 'Arial'
         fontsize = 16
-        #True color (1-4-3)
-        plt.subplot(1,3,1)
-        red = self.reflectance(1)
-        green = self.reflectance(4)
-        blue = self.reflectance(3)
-        factor = 0.4 # factor to increase the brightness
-        rgb = np.zeros((2030, 1354,3))
-        rgb[:,:,0] = red/factor
-        rgb[:,:,1] = green/factor
-        rgb[:,:,2] = blue/factor
-        rgb[ rgb > 1 ] = 1.0
-        rgb[ rgb < 0 ] = 0.0
-        rgb = np.fliplr(rgb)
-        plt.imshow(rgb,origin='lower')
-        plt.xticks([])
-        plt.yticks([])
-        plt.title('True color (1-4-3)',fontname=fontname,fontsize=fontsize)
-        #False color (3-5/6-7)
-        plt.subplot(1,3,2)
-        red = self.reflectance(3)
-        if self.satellite == 'Terra': green_band = 6
-        else: green_band = 5
-        green = self.reflectance(green_band)
-        blue = self.reflectance(7)
-        factor = .4 # factor to increase the brightness
-        rgb = np.zeros((2030, 1354,3))
-        rgb[:,:,0] = red/factor
-        rgb[:,:,1] = green/factor
-        rgb[:,:,2] = blue/factor
-        rgb[ rgb > 1 ] = 1.0
-        rgb[ rgb < 0 ] = 0.0
-        rgb = np.fliplr(rgb)
-        plt.imshow(rgb,origin='lower')
-        plt.xticks([])
-        plt.yticks([])
-        plt.title('False color (3-%s-7)' % green_band,fontname=fontname,fontsize=fontsize)
-        #False color (7-2-1)
-        plt.subplot(1,3,3)
-        red = self.reflectance(7)
-        green = self.reflectance(2)
-        blue = self.reflectance(1)
-        factor = 0.4 # factor to increase the brightness
-        rgb = np.zeros((2030, 1354,3))
-        rgb[:,:,0] = red/factor
-        rgb[:,:,1] = green/factor
-        rgb[:,:,2] = blue/factor
-        rgb[ rgb > 1 ] = 1.0
-        rgb[ rgb < 0 ] = 0.0
-        rgb = np.fliplr(rgb)
-        plt.imshow(rgb,origin='lower')
-        plt.xticks([])
-        plt.yticks([])
-        plt.title('False color (7-2-1)',fontname=fontname,fontsize=fontsize)
-        
+        #All three blends from one read of the six bands
+        rgbs = self.composites()
+        for i, title in enumerate(rgbs):
+            ax = fig.add_subplot(1,3,i+1)
+            ax.imshow(rgbs[title][:,::-1],origin='lower')
+            ax.set_xticks([])
+            ax.set_yticks([])
+            ax.set_title(title,fontname=fontname,fontsize=fontsize)
+        return fig
 
 
 """
-Functions for MOD06_L2/MYD06_L2 files downloaded from from LAADS Web (https://ladsweb.nascom.nasa.gov/).
+Lazy MOD06_L2 datasets
 """
 
-class MOD06(object):
+class LazyDict(dict):
     """
-    Create object to analyze from MOD06_L2/MYD06_L2 cloud file downloaded from LAADS Web (https://ladsweb.nascom.nasa.gov/).
+    Dictionary that loads missing keys on first access and keeps them.
     
     Parameters
     ----------
-    cfile : string
-    M-D06_L2 cloud file.
+    loaders : dict
+    Function without arguments returning the value, for each key that can be loaded.
     
-    Returns
+    store : GranuleStore
+    On-disk cache (see GranuleCache). Loadable keys are memory-mapped from it if saved there, and arrays set
+    in the dictionary are saved to it. Optional.
+    
+    Methods
     -------
-    day, year, time, satellite : int, int, int, float
-    Satellite properties.
+    available: List keys that are loaded or can be loaded.
+    """
     
-    lat, lon : array, array
-    Latitude and longitude for plotting.
+    def __init__(self,loaders,store=None):
+        dict.__init__(self)
+        self.loaders = loaders
+        self.store = store
     
+    def __missing__(self,key):
+        if key not in self.loaders: raise KeyError(key)
+        if self.store is not None:
+            value = self.store.get(key)
+            if value is not None:
+                dict.__setitem__(self,key,value)
+                return value
+        value = self.loaders[key]()
+        #Loaders may set several keys at once, including this one
+        if key in self: return dict.__getitem__(self,key)
+        self[key] = value
+        return value
     
-    """
+    def __setitem__(self,key,value):
+        dict.__setitem__(self,key,value)
+        if self.store is not None: self.store.put(key,value)
     
-    def __init__(self,cfile):
-        self.day = cfile[14:16+1]
-        self.year = cfile[10:13+1]
-        self.time = cfile[18:21+1]
-        if cfile[1] == 'Y':
-            self.satellite = 'Aqua'
-        elif cfile[1] == 'O':
-            self.satellite = 'Terra'
-        
-        #Read in file
-        self.file = cfile
-        c = SD.SD(self.file, SDC.READ)
-        
-        #Dictionaries of all defined datasets in MOD06 object
-        ds_name = {} #Get full name from abbreviation
-        ds = {} #Get dataset from abbreviation
-        units = {} #To check units
-        
-        #
-        ###Get geolocation data and date
-        #
-        self.lon = c.select('Longitude')[:,:]
-        ds_name['lon'] = 'Longitude'
-        ds['lon'] = self.lon
-        units['lon'] = 'degrees'
-        self.lat = c.select('Latitude')[:,:]
-        ds_name['lat'] = 'Latitude'
-        ds['lat'] = self.lat
-        units['lat'] = 'degrees'
-        
-        #
-        ###Effective radius
-        #
-        data = c.select('Cloud_Effective_Radius')[:]
-        attrs = c.select('Cloud_Effective_Radius').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref = scale*(data - offset)
-        ds_name['ref'] = 'Cloud effective radius'
-        ds['ref'] = self.ref
-        units['ref'] = '%sm' % u"\u03BC"
-        
-        #
-        ###Effective radius uncertainty
-        #
-        data = c.select('Cloud_Effective_Radius_Uncertainty')[:]
-        attrs = c.select('Cloud_Effective_Radius_Uncertainty').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref_unc = scale*(data - offset)
-        ds_name['ref_unc'] = 'Cloud effective radius uncertainty'
-        ds['ref_unc'] = self.ref_unc
-        units['ref_unc'] = '%'
-        
-        #
-        ###Effective radius at 1.63 micron
-        #
-        data = c.select('Cloud_Effective_Radius_16')[:]
-        attrs = c.select('Cloud_Effective_Radius_16').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref16 = scale*(data - offset)
-        ds_name['ref16'] = 'Cloud effective radius (1.6 micron)'
-        ds['ref16'] = self.ref16
-        units['ref16'] = '%sm' % u"\u03BC"
-        
-        #
-        ###Effective radius uncertainty at 1.63 micron
-        #
-        data = c.select('Cloud_Effective_Radius_Uncertainty_16')[:]
-        attrs = c.select('Cloud_Effective_Radius_Uncertainty_16').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref16_unc = scale*(data - offset)
-        ds_name['ref16_unc'] = 'Cloud effective radius uncertainty (1.6 micron)'
-        ds['ref16_unc'] = self.ref16_unc
-        units['ref16_unc'] = '%'
-        
-        #
-        ###Effective radius at 3.7 micron
-        #
-        data = c.select('Cloud_Effective_Radius_37')[:]
-        attrs = c.select('Cloud_Effective_Radius_37').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref37 = scale*(data - offset)
-        ds_name['ref37'] = 'Cloud effective radius (3.7 micron)'
-        ds['ref37'] = self.ref37
-        units['ref37'] = '%sm' % u"\u03BC"
-        
-        #
-        ###Effective radius uncertainty at 3.7 micron
-        #
-        data = c.select('Cloud_Effective_Radius_Uncertainty_37')[:]
-        attrs = c.select('Cloud_Effective_Radius_Uncertainty_37').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref37_unc = scale*(data - offset)
-        ds_name['ref37_unc'] = 'Cloud effective radius uncertainty (3.7 micron)'
-        ds['ref37_unc'] = self.ref37_unc
-        units['ref37_unc'] = '%'
-        
-        #
-        ###Effective radius (1621)
-        #
-        data = c.select('Cloud_Effective_Radius_1621')[:]
-        attrs = c.select('Cloud_Effective_Radius_1621').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref1621 = scale*(data - offset)
-        ds_name['ref1621'] = 'Cloud effective radius (1621)'
-        ds['ref1621'] = self.ref1621
-        units['ref1621'] = '%sm' % u"\u03BC"
-        
-        #
-        ###Effective radius uncertainty (1621)
-        #
-        data = c.select('Cloud_Effective_Radius_Uncertainty_1621')[:]
-        attrs = c.select('Cloud_Effective_Radius_Uncertainty_1621').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref1621_unc = scale*(data - offset)
-        ds_name['ref1621_unc'] = 'Cloud effective radius uncertainty (1621)'
-        ds['ref1621_unc'] = self.ref1621_unc
-        units['ref1621_unc'] = '%'
-        
-        #
-        ###Cloud fraction
-        #
-        data = c.select('Cloud_Fraction')[:]
-        attrs = c.select('Cloud_Fraction').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.cf = scale*(data - offset)
-        ds_name['cf'] = 'Cloud fraction'
-        ds['cf'] = self.cf
-        units['cf'] = 'unitless'
-        
-        #
-        ###Cloud optical thickness
-        #
-        data = c.select('Cloud_Optical_Thickness')[:]
-        attrs = c.select('Cloud_Optical_Thickness').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT = scale*(data - offset)
-        ds_name['COT'] = 'Cloud optical thickness'
-        ds['COT'] = self.COT
-        units['COT'] = 'unitless'
-        
-        #
-        ###Cloud optical thickness uncertainty
-        #
-        data = c.select('Cloud_Optical_Thickness_Uncertainty')[:]
-        attrs = c.select('Cloud_Optical_Thickness_Uncertainty').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT_unc = scale*(data - offset)
-        ds_name['COT_unc'] = 'Cloud optical thickness uncertainty'
-        ds['COT_unc'] = self.COT_unc
-        units['COT_unc'] = '%'
-        
-        #
-        ###Cloud optical thickness at 1.6 micron
-        #
-        data = c.select('Cloud_Optical_Thickness_16')[:]
-        attrs = c.select('Cloud_Optical_Thickness_16').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT16 = scale*(data - offset)
-        ds_name['COT16'] = 'Cloud optical thickness (1.6 micron)'
-        ds['COT16'] = self.COT16
-        units['COT16'] = 'unitless'
-        
-        #
-        ###Cloud optical thickness uncertainty at 1.6 micron
-        #
-        data = c.select('Cloud_Optical_Thickness_Uncertainty_16')[:]
-        attrs = c.select('Cloud_Optical_Thickness_Uncertainty_16').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT16_unc = scale*(data - offset)
-        ds_name['COT16_unc'] = 'Cloud optical thickness uncertainty (1.6 micron)'
-        ds['COT16_unc'] = self.COT16_unc
-        units['COT16_unc'] = '%'
-        
-        #
-        ###Cloud optical thickness at 3.7 micron
-        #
-        data = c.select('Cloud_Optical_Thickness_37')[:]
-        attrs = c.select('Cloud_Optical_Thickness_37').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT37 = scale*(data - offset)
-        ds_name['COT37'] = 'Cloud optical thickness (3.7 micron)'
-        ds['COT37'] = self.COT37
-        units['COT37'] = 'unitless'
-        
-        #
-        ###Cloud optical thickness uncertainty at 3.7 micron
-        #
-        data = c.select('Cloud_Optical_Thickness_Uncertainty_37')[:]
-        attrs = c.select('Cloud_Optical_Thickness_Uncertainty_37').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT37_unc = scale*(data - offset)
-        ds_name['COT37_unc'] = 'Cloud optical thickness uncertainty (3.7 micron)'
-        ds['COT37_unc'] = self.COT37_unc
-        units['COT37_unc'] = '%'
-        
-        #
-        ###Cloud optical thickness (1621)
-        #
-        data = c.select('Cloud_Optical_Thickness_1621')[:]
-        attrs = c.select('Cloud_Optical_Thickness_1621').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT1621 = scale*(data - offset)
-        ds_name['COT1621'] = 'Cloud optical thickness (1621)'
-        ds['COT1621'] = self.COT1621
-        units['COT1621'] = 'unitless'
-        
-        #
-        ###Cloud optical thickness uncertainty (1621)
-        #
-        data = c.select('Cloud_Optical_Thickness_Uncertainty_1621')[:]
-        attrs = c.select('Cloud_Optical_Thickness_Uncertainty_1621').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT1621_unc = scale*(data - offset)
-        ds_name['COT1621_unc'] = 'Cloud optical thickness uncertainty (1621)'
-        ds['COT1621_unc'] = self.COT1621_unc
-        units['COT1621_unc'] = '%'
-        
-        #
-        ###Cloud phase (optical properties)
-        #
-        data = c.select('Cloud_Phase_Optical_Properties')[:]
-        attrs = c.select('Cloud_Phase_Optical_Properties').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.phase = scale*(data - offset)
-        ds_name['phase'] = 'Cloud phase'
-        ds['phase'] = self.phase
-        units['phase'] = 'none'
-        
-        #
-        ###Cloud top pressure
-        #
-        data = c.select('Cloud_Top_Pressure')[:]
-        attrs = c.select('Cloud_Top_Pressure').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.CTP = scale*(data - offset)
-        ds_name['CTP'] = 'Cloud top pressure'
-        ds['CTP'] = self.CTP
-        units['CTP'] = 'hPa'
-        
-        #
-        ###Cloud top temperature
-        #
-        data = c.select('Cloud_Top_Temperature')[:]
-        attrs = c.select('Cloud_Top_Temperature').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.CTT = scale*(data - offset)
-        ds_name['CTT'] = 'Cloud top temperature'
-        ds['CTT'] = self.CTT
-        units['CTT'] = 'K'
-        
-        #
-        ###Cloud water path
-        #
-        data = c.select('Cloud_Water_Path')[:]
-        attrs = c.select('Cloud_Water_Path').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.CWP = scale*(data - offset)
-        ds_name['CWP'] = 'Cloud water path'
-        ds['CWP'] = self.CWP
-        units['CWP'] = 'g/m^2'
-        
-        #
-        ###Cloud water path uncertainty
-        #
-        data = c.select('Cloud_Water_Path_Uncertainty')[:]
-        attrs = c.select('Cloud_Water_Path_Uncertainty').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.CWP_unc = scale*(data - offset)
-        ds_name['CWP_unc'] = 'Cloud water path uncertainty'
-        ds['CWP_unc'] = self.CWP_unc
-        units['CWP_unc'] = '%'
-        
-        #
-        ###Cloud water path (1621)
-        #
-        data = c.select('Cloud_Water_Path_1621')[:]
-        attrs = c.select('Cloud_Water_Path_1621').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.CWP1621 = scale*(data - offset)
-        ds_name['CWP1621'] = 'Cloud water path (1621)'
-        ds['CWP1621'] = self.CWP1621
-        units['CWP1621'] = 'g/m^2'
-        
-        #
-        ###Cloud water path uncertainty (1621)
-        #
-        data = c.select('Cloud_Water_Path_Uncertainty_1621')[:]
-        attrs = c.select('Cloud_Water_Path_Uncertainty_1621').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.CWP1621_unc = scale*(data - offset)
-        ds_name['CWP1621_unc'] = 'Cloud water path uncertainty (1621)'
-        ds['CWP1621_unc'] = self.CWP1621_unc
-        units['CWP1621_unc'] = '%'
-        
-        #
-        ###Nd at 2.13 micron
-        #
-        k = .8
-        gam_ad = 2.E-6 #kg/m^4
-        frac_ad = 1
-        gam_eff = gam_ad*frac_ad
-        self.Nd = 10**.5/(4*np.pi*1000**.5)*gam_eff**.5*self.COT**.5/(self.ref*10**-6)**2.5/k/100.**3
-        ds_name['Nd'] = 'Droplet concentration'
-        ds['Nd'] = self.Nd
-        units['Nd'] = '$\mathregular{cm^{-3}}$'
-        
-        #
-        ###Nd at 1.6 micron
-        #
-        k = .8
-        gam_ad = 2.E-6 #kg/m^4
-        frac_ad = 1
-        gam_eff = gam_ad*frac_ad
-        self.Nd16 = 10**.5/(4*np.pi*1000**.5)*gam_eff**.5*self.COT16**.5/(self.ref16*10**-6)**2.5/k/100.**3
-        ds_name['Nd16'] = 'Droplet concentration at 1.6 micron'
-        ds['Nd16'] = self.Nd16
-        units['Nd16'] = '$\mathregular{cm^{-3}}$'
-        
-        #
-        ###Nd at 3.7 micron
-        #
-        k = .8
-        gam_ad = 2.E-6 #kg/m^4
-        frac_ad = 1
-        gam_eff = gam_ad*frac_ad
-        self.Nd37 = 10**.5/(4*np.pi*1000**.5)*gam_eff**.5*self.COT37**.5/(self.ref37*10**-6)**2.5/k/100.**3
-        ds_name['Nd37'] = 'Droplet concentration at 3.7 micron'
-        ds['Nd37'] = self.Nd37
-        units['Nd37'] = '$\mathregular{cm^{-3}}$'
-        
-        self.ds_name = ds_name
-        self.ds = ds
-        self.units = units
-        c.end()
-               
-    def view_Re(self):
+    def available(self):
         """
-        Plot the view as seen from the satellite for Re bias
+        List every key that is already loaded or can be loaded.
         """
-        plt.clf()
-        m = Basemap(projection='nsper',lon_0=self.lon.mean(),lat_0=self.lat.mean(),resolution='l',satellite_height=705000)
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
-        m.drawparallels(np.arange(-180,180,10))
-        m.drawmeridians(np.arange(0,360,10))
-        m.pcolormesh(self.lon,self.lat,self.median[:np.shape(self.lat)[0],:np.shape(self.lat)[1]],shading='gouraud',cmap='YlGnBu_r',latlon=True,vmin=-5,vmax=0)
-        cbar = m.colorbar()
-        cbar.set_label('Bias (%sm)' % (u"\u03BC"))
-        plt.title('View from %s (%s, %s, at %s)' % \
-        (self.satellite,cal_day(int(self.day),int(self.year)),self.year,self.time))
-        plt.show()
-
-"""
-Class for NRT MOD06_L2/MYD06_L2 files downloaded from from LANCE (https://lance.modaps.eosdis.nasa.gov/data_products/).
-"""
+        return sorted(set(self.keys()) | set(self.loaders.keys()))
 
-class nrtMOD06(object):
+#Read an SDS and apply its valid range, scale and offset
+def read_scaled(filename,name,array_backend=None,window=None):
     """
-    Create object to analyze from MOD06_L2/MYD06_L2 cloud file downloaded from LANCE (https://lance.modaps.eosdis.nasa.gov/data_products/).
+    Read a scaled integer SDS from a pooled HDF file.
     
-    ***Created for ORACLES campaign (https://espo.nasa.gov/home/oracles/)***
-        
     Parameters
     ----------
-    cfile : string
-    M-D06_L2 cloud file.
-    
-    Methods
-    -------
-    get_ds: Get previously unaccessed dataset from file and save in dictionaries.
+    filename : string
+    HDF file.
     
-    quick_plot: Plot variables quickly as a check/first look at the data.
+    name : string
+    SDS name.
     
-    tri_plot: Pre-defined groupings of three plots meant for use on the ORACLES field campaign.
+    array_backend : string
+    'ma' or 'nan32', see arrays. Default is arrays.array_backend.
     
-    five_plot: Pre-defined groupings of five plots meant for use on the ORACLES field campaign.
-        -value at each channel plus delta and del biases
+    window : tuple
+    Only read the part inside a bbox_window() window, see sds_window(). Optional.
     
     Returns
     -------
-    jday, year, day : int
-    Julian day, year, calendar day
+    data : masked array
+    scale*(data - offset) with values outside valid_range masked, or a float32 array with NaN there for 'nan32'.
     
-    month, time, satellite : string
-    Month, time of passage, satellite (Terra or Aqua)
+    attrs : dict
+    SDS attributes.
+    """
+    s = handle_pool.select(filename,name)
+    attrs = s.attributes(full=1)
+    index = sds_window(filename,name,window)
+    return scale_sds(s[:] if index is None else s[index],attrs,array_backend), attrs
+
+def read_raw(filename,names,prefetch=False,window=None):
+    """
+    Read several SDS from a pooled HDF file, one select each.
     
-    lat, lon : array, array
-    5 km x 5 km latitude and longitude arrays.
+    Parameters
+    ----------
+    filename : string
+    HDF file.
     
-    ds_name : dict
-    Dictionary of named datasets available.
+    names : list
+    SDS names.
     
-    ds : dict
-    Dictionary of dataset arrays. Check ds_name for available parameters.
+    prefetch : boolean
+    Read (and decompress) the next SDS in a background thread while the caller works on the current one.
+    Default False. The thread is stopped and joined when the generator is closed or the caller raises.
     
-    units : dict
-    Dictionary of units for each dataset array.
+    window : tuple
+    Only read the part inside a bbox_window() window, see sds_window(). Optional.
     
-    Modification history
-    --------------------
-    Written: Michael Diamond, 08/08-09/2016, Seattle, WA
-    Modified: Michael Diamond, 08/22/2016, Seattle, WA
-    Modified: Michael Diamond, 08/29/2016, Swakopmund, Namibia
-        -Collection 6 NRT processing now available!!!
-        -Updates to make compatible with C6 (mostly to ref, also added COT differences)
+    Yields
+    ------
+    name, data, attrs : string, array, dict
+    Raw values and attributes of each SDS, in the order of names.
     """
-    
-    def __init__(self,cfile):
-        #Read in file
-        self.file = cfile
-        c = SD.SD(self.file, SDC.READ)
-        #Dictionaries of all defined datasets in nrtMOD06 object
-        ds_name = {} #Get full name from abbreviation
-        ds = {} #Get dataset from abbreviation
-        units = {} #To check units
-        
-        #
-        ###Get geolocation data and date
-        #
-        self.jday = int(self.file[14:16+1])
-        self.year = int(self.file[10:13+1])
-        self.month = cal_day(self.jday,self.year).split()[0]
-        self.day = int(cal_day(self.jday,self.year).split()[1])
-        self.time = self.file[18:21+1]
-        if self.file[1] == 'Y':
-            self.satellite = 'Aqua'
-        elif self.file[1] == 'O':
-            self.satellite = 'Terra'
-        self.lon = c.select('Longitude')[:,:]
-        ds_name['lon'] = 'Longitude'
-        ds['lon'] = self.lon
-        units['lon'] = 'degrees'
-        self.lat = c.select('Latitude')[:,:]
-        ds_name['lat'] = 'Latitude'
-        ds['lat'] = self.lat
-        units['lat'] = 'degrees'
-        
-        #
-        ###Effective radius
-        #
-        data = c.select('Cloud_Effective_Radius')[:]
-        attrs = c.select('Cloud_Effective_Radius').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref = scale*(data - offset)
-        ds_name['ref'] = 'Cloud effective radius'
-        ds['ref'] = self.ref
-        units['ref'] = '%sm' % u"\u03BC"
-        
-        #
-        ###Effective radius uncertainty
-        #
-        data = c.select('Cloud_Effective_Radius_Uncertainty')[:]
-        attrs = c.select('Cloud_Effective_Radius_Uncertainty').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref_unc = scale*(data - offset)
-        ds_name['ref_unc'] = 'Cloud effective radius uncertainty'
-        ds['ref_unc'] = self.ref_unc
-        units['ref_unc'] = '%'
-        
-        #
-        ###Effective radius at 1.63 micron
-        #
-        data = c.select('Cloud_Effective_Radius_16')[:]
-        attrs = c.select('Cloud_Effective_Radius_16').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref16 = scale*(data - offset)
-        ds_name['ref16'] = 'Cloud effective radius (1.6 micron)'
-        ds['ref16'] = self.ref16
-        units['ref16'] = '%sm' % u"\u03BC"
-        
-        #
-        ###Effective radius uncertainty at 1.63 micron
-        #
-        data = c.select('Cloud_Effective_Radius_Uncertainty_16')[:]
-        attrs = c.select('Cloud_Effective_Radius_Uncertainty_16').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref16_unc = scale*(data - offset)
-        ds_name['ref16_unc'] = 'Cloud effective radius uncertainty (1.6 micron)'
-        ds['ref16_unc'] = self.ref16_unc
-        units['ref16_unc'] = '%'
-        
-        #
-        ###Effective radius at 3.7 micron
-        #
-        data = c.select('Cloud_Effective_Radius_37')[:]
-        attrs = c.select('Cloud_Effective_Radius_37').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref37 = scale*(data - offset)
-        ds_name['ref37'] = 'Cloud effective radius (3.7 micron)'
-        ds['ref37'] = self.ref37
-        units['ref37'] = '%sm' % u"\u03BC"
-        
-        #
-        ###Effective radius uncertainty at 3.7 micron
-        #
-        data = c.select('Cloud_Effective_Radius_Uncertainty_37')[:]
-        attrs = c.select('Cloud_Effective_Radius_Uncertainty_37').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref37_unc = scale*(data - offset)
-        ds_name['ref37_unc'] = 'Cloud effective radius uncertainty (3.7 micron)'
-        ds['ref37_unc'] = self.ref37_unc
-        units['ref37_unc'] = '%'
-        
-        #
-        ###Effective radius (1621)
-        #
-        data = c.select('Cloud_Effective_Radius_1621')[:]
-        attrs = c.select('Cloud_Effective_Radius_1621').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref1621 = scale*(data - offset)
-        ds_name['ref1621'] = 'Cloud effective radius (1621)'
-        ds['ref1621'] = self.ref1621
-        units['ref1621'] = '%sm' % u"\u03BC"
-        
-        #
-        ###Effective radius uncertainty (1621)
-        #
-        data = c.select('Cloud_Effective_Radius_Uncertainty_1621')[:]
-        attrs = c.select('Cloud_Effective_Radius_Uncertainty_1621').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.ref1621_unc = scale*(data - offset)
-        ds_name['ref1621_unc'] = 'Cloud effective radius uncertainty (1621)'
-        ds['ref1621_unc'] = self.ref1621_unc
-        units['ref1621_unc'] = '%'
-        
-        #
-        ###Cloud fraction
-        #
-        data = c.select('Cloud_Fraction')[:]
-        attrs = c.select('Cloud_Fraction').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.cf = scale*(data - offset)
-        ds_name['cf'] = 'Cloud fraction'
-        ds['cf'] = self.cf
-        units['cf'] = 'unitless'
-        
-        #
-        ###Cloud optical thickness
-        #
-        data = c.select('Cloud_Optical_Thickness')[:]
-        attrs = c.select('Cloud_Optical_Thickness').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT = scale*(data - offset)
-        ds_name['COT'] = 'Cloud optical thickness'
-        ds['COT'] = self.COT
-        units['COT'] = 'unitless'
-        
-        #
-        ###Cloud optical thickness uncertainty
-        #
-        data = c.select('Cloud_Optical_Thickness_Uncertainty')[:]
-        attrs = c.select('Cloud_Optical_Thickness_Uncertainty').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT_unc = scale*(data - offset)
-        ds_name['COT_unc'] = 'Cloud optical thickness uncertainty'
-        ds['COT_unc'] = self.COT_unc
-        units['COT_unc'] = '%'
-        
-        #
-        ###Cloud optical thickness at 1.6 micron
-        #
-        data = c.select('Cloud_Optical_Thickness_16')[:]
-        attrs = c.select('Cloud_Optical_Thickness_16').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT16 = scale*(data - offset)
-        ds_name['COT16'] = 'Cloud optical thickness (1.6 micron)'
-        ds['COT16'] = self.COT16
-        units['COT16'] = 'unitless'
-        
-        #
-        ###Cloud optical thickness uncertainty at 1.6 micron
-        #
-        data = c.select('Cloud_Optical_Thickness_Uncertainty_16')[:]
-        attrs = c.select('Cloud_Optical_Thickness_Uncertainty_16').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT16_unc = scale*(data - offset)
-        ds_name['COT16_unc'] = 'Cloud optical thickness uncertainty (1.6 micron)'
-        ds['COT16_unc'] = self.COT16_unc
-        units['COT16_unc'] = '%'
-        
-        #
-        ###Cloud optical thickness at 3.7 micron
-        #
-        data = c.select('Cloud_Optical_Thickness_37')[:]
-        attrs = c.select('Cloud_Optical_Thickness_37').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT37 = scale*(data - offset)
-        ds_name['COT37'] = 'Cloud optical thickness (3.7 micron)'
-        ds['COT37'] = self.COT37
-        units['COT37'] = 'unitless'
-        
-        #
-        ###Cloud optical thickness uncertainty at 3.7 micron
-        #
-        data = c.select('Cloud_Optical_Thickness_Uncertainty_37')[:]
-        attrs = c.select('Cloud_Optical_Thickness_Uncertainty_37').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT37_unc = scale*(data - offset)
-        ds_name['COT37_unc'] = 'Cloud optical thickness uncertainty (3.7 micron)'
-        ds['COT37_unc'] = self.COT37_unc
-        units['COT37_unc'] = '%'
-        
-        #
-        ###Cloud optical thickness (1621)
-        #
-        data = c.select('Cloud_Optical_Thickness_1621')[:]
-        attrs = c.select('Cloud_Optical_Thickness_1621').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT1621 = scale*(data - offset)
-        ds_name['COT1621'] = 'Cloud optical thickness (1621)'
-        ds['COT1621'] = self.COT1621
-        units['COT1621'] = 'unitless'
-        
-        #
-        ###Cloud optical thickness uncertainty (1621)
-        #
-        data = c.select('Cloud_Optical_Thickness_Uncertainty_1621')[:]
-        attrs = c.select('Cloud_Optical_Thickness_Uncertainty_1621').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.COT1621_unc = scale*(data - offset)
-        ds_name['COT1621_unc'] = 'Cloud optical thickness uncertainty (1621)'
-        ds['COT1621_unc'] = self.COT1621_unc
-        units['COT1621_unc'] = '%'
-        
-        #
-        ###Cloud phase (optical properties)
-        #
-        data = c.select('Cloud_Phase_Optical_Properties')[:]
-        attrs = c.select('Cloud_Phase_Optical_Properties').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.phase = scale*(data - offset)
-        ds_name['phase'] = 'Cloud phase'
-        ds['phase'] = self.phase
-        units['phase'] = 'none'
-        
-        #
-        ###Cloud top pressure
-        #
-        data = c.select('Cloud_Top_Pressure')[:]
-        attrs = c.select('Cloud_Top_Pressure').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.CTP = scale*(data - offset)
-        ds_name['CTP'] = 'Cloud top pressure'
-        ds['CTP'] = self.CTP
-        units['CTP'] = 'hPa'
-        
-        #
-        ###Cloud top temperature
-        #
-        data = c.select('Cloud_Top_Temperature')[:]
-        attrs = c.select('Cloud_Top_Temperature').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.CTT = scale*(data - offset)
-        ds_name['CTT'] = 'Cloud top temperature'
-        ds['CTT'] = self.CTT
-        units['CTT'] = 'K'
-        
-        #
-        ###Cloud water path
-        #
-        data = c.select('Cloud_Water_Path')[:]
-        attrs = c.select('Cloud_Water_Path').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.CWP = scale*(data - offset)
-        ds_name['CWP'] = 'Cloud water path'
-        ds['CWP'] = self.CWP
-        units['CWP'] = 'g/m^2'
-        
-        #
-        ###Cloud water path uncertainty
-        #
-        data = c.select('Cloud_Water_Path_Uncertainty')[:]
-        attrs = c.select('Cloud_Water_Path_Uncertainty').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.CWP_unc = scale*(data - offset)
-        ds_name['CWP_unc'] = 'Cloud water path uncertainty'
-        ds['CWP_unc'] = self.CWP_unc
-        units['CWP_unc'] = '%'
-        
-        #
-        ###Cloud water path (1621)
-        #
-        data = c.select('Cloud_Water_Path_1621')[:]
-        attrs = c.select('Cloud_Water_Path_1621').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.CWP1621 = scale*(data - offset)
-        ds_name['CWP1621'] = 'Cloud water path (1621)'
-        ds['CWP1621'] = self.CWP1621
-        units['CWP1621'] = 'g/m^2'
-        
-        #
-        ###Cloud water path uncertainty (1621)
-        #
-        data = c.select('Cloud_Water_Path_Uncertainty_1621')[:]
-        attrs = c.select('Cloud_Water_Path_Uncertainty_1621').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.CWP1621_unc = scale*(data - offset)
-        ds_name['CWP1621_unc'] = 'Cloud water path uncertainty (1621)'
-        ds['CWP1621_unc'] = self.CWP1621_unc
-        units['CWP1621_unc'] = '%'
-        
-        #
-        ###Difference between ref(2.1) - ref(1.6)
-        #
-        self.delta_ref16 = self.ref - self.ref16
-        ds_name['delta_ref16'] = 'Effective radius difference (2.1-1.6 %sm)' % u"\u03BC"
-        ds['delta_ref16'] = self.delta_ref16
-        units['delta_ref16'] = '%sm' % u"\u03BC"
-        #Normalized difference
-        self.del_ref16 = 1000.*(self.delta_ref16)/self.ref
-        ds_name['del_ref16'] = 'Normalized effective radius difference (2.1-1.6 %sm)' % u"\u03BC"
-        ds['del_ref16'] = self.del_ref16
-        units['del_ref16'] = 'per mil'
-        
-        #
-        ###Difference between ref(2.1) - ref(3.7)
-        #
-        self.delta_ref37 = self.ref - self.ref37
-        ds_name['delta_ref37'] = 'Effective radius difference (2.1-3.7 %sm)' % u"\u03BC"
-        ds['delta_ref37'] = self.delta_ref37
-        units['delta_ref37'] = '%sm' % u"\u03BC"
-        #Normalized difference
-        self.del_ref37 = 1000.*(self.delta_ref37)/self.ref
-        ds_name['del_ref37'] = 'Normalized effective radius difference (2.1-3.7 %sm)' % u"\u03BC"
-        ds['del_ref37'] = self.del_ref37
-        units['del_ref37'] = 'per mil'
-        
-        #
-        ###Difference between COT(2.1) - COT(1.6)
-        #
-        self.delta_COT16 = self.COT - self.COT16
-        ds_name['delta_COT16'] = 'Cloud optical thickness difference (2.1-1.6 %sm)' % u"\u03BC"
-        ds['delta_COT16'] = self.delta_COT16
-        units['delta_COT16'] = 'unitless'
-        #Normalized difference
-        self.del_COT16 = 1000.*(self.delta_COT16)/self.COT
-        ds_name['del_COT16'] = 'Normalized cloud optical thickness difference (2.1-1.6 %sm)' % u"\u03BC"
-        ds['del_COT16'] = self.del_COT16
-        units['del_COT16'] = 'per mil'
-        
-        #
-        ###Difference between COT(2.1) - COT(3.7)
-        #
-        self.delta_COT37 = self.COT - self.COT37
-        ds_name['delta_COT37'] = 'Cloud optical thickness difference (2.1-3.7 %sm)' % u"\u03BC"
-        ds['delta_COT37'] = self.delta_COT37
-        units['delta_COT37'] = 'unitless'
-        #Normalized difference
-        self.del_COT37 = 1000.*(self.delta_COT37)/self.COT
-        ds_name['del_COT37'] = 'Normalized cloud optical thickness difference (2.1-3.7 %sm)' % u"\u03BC"
-        ds['del_COT37'] = self.del_COT37
-        units['del_COT37'] = 'per mil'
-        
-        #
-        ###Sensor/view azimuth angle
-        #
-        data = c.select('Sensor_Azimuth')[:]
-        attrs = c.select('Sensor_Azimuth').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.vaa = scale*(data - offset)
-        ds_name['vaa'] = 'Sensor azimuth angle'
-        ds['vaa'] = self.vaa
-        units['vaa'] = 'degrees'
-        
-        #
-        ###Sensor/view zenith angle
-        #
-        data = c.select('Sensor_Zenith')[:]
-        attrs = c.select('Sensor_Zenith').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.vza = scale*(data - offset)
-        ds_name['vza'] = 'Sensor zenith angle'
-        ds['vza'] = self.vza
-        units['vza'] = 'degrees'
-        
-        #
-        ###Solar azimuth angle
-        #
-        data = c.select('Solar_Azimuth')[:]
-        attrs = c.select('Solar_Azimuth').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.saa = scale*(data - offset)
-        ds_name['saa'] = 'Solar azimuth angle'
-        ds['saa'] = self.saa
-        units['saa'] = 'degrees'
-        
-        #
-        ###Solar zenith angle
-        #
-        data = c.select('Solar_Zenith')[:]
-        attrs = c.select('Solar_Zenith').attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
+    def read(name):
+        s = handle_pool.select(filename,name)
+        index = sds_window(filename,name,window)
+        return name, s[:] if index is None else s[index], s.attributes(full=1)
+    if not prefetch or len(names) < 2:
+        for name in names: yield read(name)
+        return
+    results = queue.Queue(maxsize=1)
+    stop = threading.Event()
+    def put(item):
+        #Give up if the consumer has stopped
+        while not stop.is_set():
+            try:
+                results.put(item,timeout=.1)
+                return True
+            except queue.Full: pass
+        return False
+    def work():
+        try:
+            for name in names:
+                if stop.is_set() or not put((True,read(name))): return
+        except Exception as e:
+            put((False,e))
+    worker = threading.Thread(target=work)
+    worker.daemon = True
+    worker.start()
+    try:
+        for i in range(len(names)):
+            ok, value = results.get()
+            if not ok: raise value
+            yield value
+    finally:
+        stop.set()
+        while worker.is_alive():
+            try: results.get_nowait()
+            except queue.Empty: pass
+            worker.join(.1)
+
+def scale_sds(data,attrs,array_backend=None):
+    """
+    Apply the valid range, scale and offset of an SDS to its raw values.
+    
+    Attributes that are missing are skipped: no scale_factor/add_offset means a scale of 1 and offset of 0, and
+    without valid_range (or valid_min/valid_max) only _FillValue, if any, is masked.
+    
+    Parameters
+    ----------
+    data : array
+    Raw SDS values.
+    
+    attrs : dict
+    SDS attributes, from attributes(full=1).
+    
+    array_backend : string
+    'ma' or 'nan32', see arrays. Default is arrays.array_backend.
+    
+    Returns
+    -------
+    data : masked array or float32 array
+    """
+    scale = attrs['scale_factor'][0] if 'scale_factor' in attrs else 1.
+    offset = attrs['add_offset'][0] if 'add_offset' in attrs else 0.
+    _FillValue = attrs['_FillValue'][0] if '_FillValue' in attrs else None
+    #Mask invalid data
+    if 'valid_range' in attrs:
+        valid_min, valid_max = attrs['valid_range'][0][:2]
         invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        self.sza = scale*(data - offset)
-        ds_name['sza'] = 'Solar zenith angle'
-        ds['sza'] = self.sza
-        units['sza'] = 'degrees'
+    elif 'valid_min' in attrs or 'valid_max' in attrs:
+        invalid = np.zeros(data.shape,bool)
+        if 'valid_min' in attrs: invalid |= data < attrs['valid_min'][0]
+        if 'valid_max' in attrs: invalid |= data > attrs['valid_max'][0]
+    elif _FillValue is not None: invalid = data == _FillValue
+    else: invalid = np.zeros(data.shape,bool)
+    if arrays.backend(array_backend) == 'nan32':
+        data = data.astype(np.float32)
+        data -= offset
+        data *= scale
+        data[invalid] = np.nan
+        return data
+    data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
+    return scale*(data - offset)
+
+#Elements per block in droplet_number() and evaluate(), small enough for the temporaries of a block to stay in cache
+block_size = 65536
+
+def nd_factor(k=.8,gamma=2.E-6,frac_ad=1):
+    """
+    Constant in Nd = nd_factor*COT**.5*ref**-2.5 (Nd per cc, ref in micron) for an adiabatic cloud.
+    
+    Parameters
+    ----------
+    k : float
+    Ratio of volume mean to effective radius cubed. Default .8.
+    
+    gamma : float
+    Adiabatic condensation rate (kg/m^4). Default 2E-6.
+    
+    frac_ad : float
+    Adiabatic fraction. Default 1.
+    """
+    return 10**.5/(4*np.pi*1000**.5)*(gamma*frac_ad)**.5/(10**-6)**2.5/k/100.**3
+
+#Folded constant for the default k, gamma and adiabatic fraction
+ND_FACTOR = nd_factor()
+
+#Adiabatic condensation rate
+def gamma_ad(T,P):
+    """
+    Adiabatic condensation rate, i.e. the rate of increase of liquid water content with height in a rising
+    saturated parcel, rho*(c_p/L)*(dry - moist adiabatic lapse rate). Saturation vapor pressure over liquid
+    water from Bolton (1980), moist adiabatic lapse rate as in the AMS Glossary of Meteorology.
+
+    Parameters
+    ----------
+    T : array
+    Temperature (K).
+
+    P : array
+    Pressure (hPa).
+
+    Returns
+    -------
+    gamma : array
+    Adiabatic condensation rate (kg/m^4), about 2E-6 for a marine stratocumulus top (280 K, 900 hPa).
+    """
+    g = 9.81 #m/s^2
+    R_d = 287.04 #J/kg/K
+    c_p = 1005.7 #J/kg/K
+    eps = .622 #R_d/R_v
+    T = np.asarray(T,dtype=float)
+    P = np.asarray(P,dtype=float)
+    L = 2.501E6 - 2370.*(T - 273.15) #J/kg
+    e_s = 6.112*np.exp(17.67*(T - 273.15)/(T - 29.65)) #hPa
+    r_s = eps*e_s/(P - e_s)
+    moist = g*(1 + L*r_s/(R_d*T))/(c_p + L**2*r_s*eps/(R_d*T**2))
+    rho = 100.*P/(R_d*T*(1 + .61*r_s))
+    return rho*c_p/L*(g/c_p - moist)
+
+#Temperature (K) and pressure (hPa) grid of the condensation rate lookup table, covering liquid cloud tops
+GAMMA_T = np.arange(200.,310.01,.5)
+GAMMA_P = np.arange(150.,1100.01,5.)
+GAMMA_LUT = gamma_ad(GAMMA_T[:,np.newaxis],GAMMA_P[np.newaxis,:])
+
+def gamma_lut(T,P):
+    """
+    Adiabatic condensation rate by bilinear interpolation in GAMMA_LUT, a precomputed gamma_ad() table.
+    Temperatures and pressures outside the table are clipped to its edges.
+
+    Parameters
+    ----------
+    T : array
+    Temperature (K), e.g. Cloud_Top_Temperature.
+
+    P : array
+    Pressure (hPa), same shape as T, e.g. Cloud_Top_Pressure.
+
+    Returns
+    -------
+    gamma : array
+    Adiabatic condensation rate (kg/m^4), NaN where T or P is NaN. Masked where T or P is masked if either is
+    a masked array.
+    """
+    weights = []
+    nan = np.zeros(np.shape(T),bool)
+    for x, grid in [(T,GAMMA_T),(P,GAMMA_P)]:
+        x = ma.getdata(x).astype(float)
+        nan |= np.isnan(x)
+        x = (np.clip(np.where(np.isnan(x),grid[0],x),grid[0],grid[-1]) - grid[0])/(grid[1] - grid[0])
+        i = np.minimum(x.astype(int),len(grid)-2)
+        weights.append((i,x - i))
+    (i, u), (j, v) = weights
+    gamma = (1 - u)*((1 - v)*GAMMA_LUT[i,j] + v*GAMMA_LUT[i,j+1]) + u*((1 - v)*GAMMA_LUT[i+1,j] + v*GAMMA_LUT[i+1,j+1])
+    gamma[nan] = np.nan
+    if ma.isMaskedArray(T) or ma.isMaskedArray(P):
+        gamma = ma.MaskedArray(gamma, mask=ma.getmaskarray(T) | ma.getmaskarray(P))
+    return gamma
+
+#Droplet number concentration
+def droplet_number(COT,ref,k=.8,gamma=2.E-6,frac_ad=1,out=None,dtype=None):
+    """
+    Adiabatic cloud droplet number concentration Nd (per cc) from cloud optical thickness and effective radius.
+    
+    Computed in a single pass over blocks of block_size pixels as nd_factor*sqrt(COT)/(ref*ref*sqrt(ref)),
+    reusing two small float64 buffers, so no full-size temporaries are made.
+    
+    Parameters
+    ----------
+    COT, ref : array or list of arrays
+    Cloud optical thickness and effective radius (micron). Lists of arrays (e.g. one pair per wavelength) are
+    computed in one call into a stacked output.
+    
+    k, gamma, frac_ad : float
+    See nd_factor(). Default .8, 2E-6 kg/m^4 and 1.
+    gamma can also be an array with the shape of COT (e.g. from gamma_lut()), shared by all pairs in a list.
+    
+    out : array
+    Preallocated contiguous output with the shape of COT (or of the stack). Optional.
+    
+    dtype : numpy dtype
+    Output type if out is not given. Default float64, or float32 for float32 input.
+    
+    Returns
+    -------
+    Nd : array
+    Masked where COT, ref or gamma is masked or Nd is not finite if any input is a masked array. Otherwise a
+    plain array, NaN where COT or ref is negative.
+    """
+    stacked = isinstance(COT,(list,tuple))
+    if stacked:
+        pairs = list(zip(COT,ref))
+    else:
+        pairs = [(COT,ref)]
+    masked = any(ma.isMaskedArray(c) or ma.isMaskedArray(r) for c, r in pairs) or ma.isMaskedArray(gamma)
+    shape = np.shape(pairs[0][0])
+    if out is None:
+        if dtype is None: dtype = np.result_type(ma.getdata(pairs[0][0]).dtype,np.float32)
+        out = np.empty(((len(pairs),) if stacked else ())+shape,dtype)
+    stack = out.reshape((len(pairs),-1)) #View, so out must be contiguous
+    per_pixel = np.ndim(gamma) > 0
+    if per_pixel:
+        factor = nd_factor(k,1.,frac_ad)
+        g = ma.getdata(gamma).ravel()
+    elif (k,gamma,frac_ad) == (.8,2.E-6,1):
+        factor = ND_FACTOR
+    else:
+        factor = nd_factor(k,gamma,frac_ad)
+    n = int(np.prod(shape))
+    a = np.empty(min(block_size,n))
+    t = np.empty(min(block_size,n))
+    with np.errstate(all='ignore'):
+        for i, (c, r) in enumerate(pairs):
+            c = ma.getdata(c).ravel()
+            r = ma.getdata(r).ravel()
+            for start in range(0,n,block_size):
+                b = slice(start,min(start+block_size,n))
+                m = b.stop - b.start
+                np.sqrt(c[b],out=a[:m])
+                np.sqrt(r[b],out=t[:m])
+                t[:m] *= r[b]
+                t[:m] *= r[b]
+                np.divide(a[:m],t[:m],out=a[:m])
+                if per_pixel:
+                    np.sqrt(g[b],out=t[:m])
+                    a[:m] *= t[:m]
+                np.multiply(a[:m],factor,out=stack[i,b])
+    if masked:
+        invalid = ~np.isfinite(stack)
+        for i, (c, r) in enumerate(pairs):
+            invalid[i] |= ma.getmaskarray(c).ravel() | ma.getmaskarray(r).ravel()
+            if per_pixel: invalid[i] |= ma.getmaskarray(gamma).ravel()
+        out = ma.MaskedArray(out, mask=invalid.reshape(out.shape))
+    return out
+
+def evaluate(graph,ds,keys,dtype=np.float32,block=None,array_backend=None):
+    """
+    Compute derived datasets from a dependency graph, in one blocked pass.
+    
+    Derived datasets only depend on the same pixel of their inputs, so the graph is evaluated over flat
+    blocks of pixels. Every node needed, including intermediates shared by several outputs (e.g. Nd for the
+    Nd biases), is computed once per block in float64 and the requested datasets are written straight into preallocated arrays of dtype.
+    No full-size temporaries are made.
+    
+    Parameters
+    ----------
+    graph : dict
+    key : (inputs, function) for each node. function takes the blocks of inputs, in order, as float64 arrays.
+    
+    ds : dict
+    Datasets. Inputs that aren't nodes of graph are taken from here. Nodes are always recomputed in float64,
+    even when a (rounded) copy is already in ds.
+    
+    keys : list
+    Datasets to compute. Keys already in ds are not computed again.
+    
+    dtype : numpy dtype
+    Output type. Default is float32.
+    
+    block : int
+    Pixels per block. Default is block_size.
+    
+    array_backend : string
+    'ma' or 'nan32', see arrays. Default is arrays.array_backend. With 'nan32', invalid inputs are NaN and
+    NaN propagates through the functions, so no masks are built or combined.
+    
+    Returns
+    -------
+    out : dict
+    Masked array for each key, masked where any input read from ds is masked or the result is not finite.
+    For 'nan32', float32 arrays with NaN there instead. New arrays are also added to ds.
+    """
+    if block is None: block = block_size
+    nan = arrays.backend(array_backend) == 'nan32'
+    todo = [k for k in keys if k in graph and k not in ds]
+    #Order the nodes so inputs come first, and find the datasets each one depends on
+    order = []
+    sources = {}
+    def visit(k):
+        if k in sources: return
+        if k not in graph:
+            sources[k] = set([k])
+            return
+        for i in graph[k][0]: visit(i)
+        sources[k] = set().union(*[sources[i] for i in graph[k][0]])
+        order.append(k)
+    for k in todo: visit(k)
+    if todo:
+        src = sorted(set().union(*[sources[k] for k in todo]))
+        shape = np.shape(ds[src[0]])
+        if nan:
+            dtype = np.float32
+            data = dict((k,arrays.as_nan(ds[k]).ravel()) for k in src)
+        else:
+            data = dict((k,ma.getdata(ds[k]).ravel()) for k in src)
+            masks = dict((k,ma.getmaskarray(ds[k]).ravel()) for k in src)
+        n = data[src[0]].size
+        out = dict((k,np.empty(n,dtype)) for k in todo)
+        if not nan: invalid = dict((k,np.empty(n,bool)) for k in todo)
+        with np.errstate(all='ignore'):
+            for start in range(0,n,block):
+                b = slice(start,min(start+block,n))
+                v = dict((k,data[k][b].astype(np.float64)) for k in src)
+                for k in order:
+                    v[k] = graph[k][1](*[v[i] for i in graph[k][0]])
+                for k in todo:
+                    out[k][b] = v[k]
+                    if nan: continue
+                    m = ~np.isfinite(out[k][b])
+                    for i in sources[k]: m |= masks[i][b]
+                    invalid[k][b] = m
+        for k in todo:
+            if nan:
+                out[k][np.isinf(out[k])] = np.nan
+                ds[k] = out[k].reshape(shape)
+            else: ds[k] = ma.MaskedArray(out[k].reshape(shape), mask=invalid[k].reshape(shape))
+    return dict((k,ds[k]) for k in keys)
+
+"""
+MOD06_L2 datasets read from file: key, SDS name, long name, units
+"""
+MOD06_SDS = [('ref','Cloud_Effective_Radius','Cloud effective radius','%sm' % u"\u03BC"),
+('ref_unc','Cloud_Effective_Radius_Uncertainty','Cloud effective radius uncertainty','%'),
+('ref16','Cloud_Effective_Radius_16','Cloud effective radius (1.6 micron)','%sm' % u"\u03BC"),
+('ref16_unc','Cloud_Effective_Radius_Uncertainty_16','Cloud effective radius uncertainty (1.6 micron)','%'),
+('ref37','Cloud_Effective_Radius_37','Cloud effective radius (3.7 micron)','%sm' % u"\u03BC"),
+('ref37_unc','Cloud_Effective_Radius_Uncertainty_37','Cloud effective radius uncertainty (3.7 micron)','%'),
+('ref1621','Cloud_Effective_Radius_1621','Cloud effective radius (1621)','%sm' % u"\u03BC"),
+('ref1621_unc','Cloud_Effective_Radius_Uncertainty_1621','Cloud effective radius uncertainty (1621)','%'),
+('cf','Cloud_Fraction','Cloud fraction','unitless'),
+('COT','Cloud_Optical_Thickness','Cloud optical thickness','unitless'),
+('COT_unc','Cloud_Optical_Thickness_Uncertainty','Cloud optical thickness uncertainty','%'),
+('COT16','Cloud_Optical_Thickness_16','Cloud optical thickness (1.6 micron)','unitless'),
+('COT16_unc','Cloud_Optical_Thickness_Uncertainty_16','Cloud optical thickness uncertainty (1.6 micron)','%'),
+('COT37','Cloud_Optical_Thickness_37','Cloud optical thickness (3.7 micron)','unitless'),
+('COT37_unc','Cloud_Optical_Thickness_Uncertainty_37','Cloud optical thickness uncertainty (3.7 micron)','%'),
+('COT1621','Cloud_Optical_Thickness_1621','Cloud optical thickness (1621)','unitless'),
+('COT1621_unc','Cloud_Optical_Thickness_Uncertainty_1621','Cloud optical thickness uncertainty (1621)','%'),
+('phase','Cloud_Phase_Optical_Properties','Cloud phase','none'),
+('CTP','Cloud_Top_Pressure','Cloud top pressure','hPa'),
+('CTT','Cloud_Top_Temperature','Cloud top temperature','K'),
+('CWP','Cloud_Water_Path','Cloud water path','g/m^2'),
+('CWP_unc','Cloud_Water_Path_Uncertainty','Cloud water path uncertainty','%'),
+('CWP1621','Cloud_Water_Path_1621','Cloud water path (1621)','g/m^2'),
+('CWP1621_unc','Cloud_Water_Path_Uncertainty_1621','Cloud water path uncertainty (1621)','%')]
+
+#Viewing geometry (NRT files)
+MOD06_GEOMETRY = [('vaa','Sensor_Azimuth','Sensor azimuth angle','degrees'),
+('vza','Sensor_Zenith','Sensor zenith angle','degrees'),
+('saa','Solar_Azimuth','Solar azimuth angle','degrees'),
+('sza','Solar_Zenith','Solar zenith angle','degrees')]
+
+"""
+MOD06_L2 cloud mask and QA bit fields: key, SDS name, byte, first bit, number of bits, value that means True
+(None for categorical fields), long name, category names. Cloud_Mask_1km/5km hold the first two bytes of the
+MOD35 cloud mask, where most one-bit tests use 0 for yes. See the MOD35 and MOD06 user guides.
+"""
+_CM = [('determined',0,0,1,1,'Cloud mask determined',('not determined','determined')),
+('cloudiness',0,1,2,None,'Cloud mask cloudiness',('confident cloudy','probably cloudy','probably clear','confident clear')),
+('day',0,3,1,1,'Day',('night','day')),
+('sunglint',0,4,1,0,'Sunglint',('yes','no')),
+('snow_ice',0,5,1,0,'Snow/ice background',('yes','no')),
+('surface',0,6,2,None,'Surface type',('water','coastal','desert','land')),
+('heavy_aerosol',1,0,1,0,'Non-cloud obstruction (heavy aerosol)',('yes','no')),
+('thin_cirrus_solar',1,1,1,0,'Thin cirrus detected (solar)',('yes','no')),
+('shadow',1,2,1,0,'Shadow found',('yes','no')),
+('thin_cirrus_ir',1,3,1,0,'Thin cirrus detected (infrared)',('yes','no')),
+('adjacent_cloud',1,4,1,0,'Adjacent cloud detected',('yes','no')),
+('ir_cloud',1,5,1,0,'Cloud flag (IR threshold)',('yes','no')),
+('high_cloud_co2',1,6,1,0,'High cloud flag (CO2 test)',('yes','no')),
+('high_cloud_67',1,7,1,0,'High cloud flag (6.7 micron test)',('yes','no'))]
+_CONFIDENCE = ('no confidence','marginal','good','very good')
+MOD06_BITS = [('cm_'+key,'Cloud_Mask_1km') + row for key, row in [(r[0],r[1:]) for r in _CM]] + \
+[('cm5_'+key,'Cloud_Mask_5km') + row for key, row in [(r[0],r[1:]) for r in _CM]] + \
+[('qa_cot_useful','Quality_Assurance_1km',0,0,1,1,'Cloud optical thickness useful',('not useful','useful')),
+('qa_cot_confidence','Quality_Assurance_1km',0,1,2,None,'Cloud optical thickness confidence',_CONFIDENCE),
+('qa_cot_bounds','Quality_Assurance_1km',0,3,2,None,'Cloud optical thickness out of bounds',\
+('within bounds','COT > 150','100 < COT < 150','surface reflectance too large')),
+('qa_ref_useful','Quality_Assurance_1km',0,5,1,1,'Cloud effective radius useful',('not useful','useful')),
+('qa_ref_confidence','Quality_Assurance_1km',0,6,2,None,'Cloud effective radius confidence',_CONFIDENCE),
+('qa_cwp_useful','Quality_Assurance_1km',1,0,1,1,'Cloud water path useful',('not useful','useful')),
+('qa_cwp_confidence','Quality_Assurance_1km',1,1,2,None,'Cloud water path confidence',_CONFIDENCE),
+('qa_phase','Quality_Assurance_1km',1,3,3,None,'Primary cloud retrieval phase',\
+('cloud mask undetermined','not processed','liquid water','ice','undetermined phase')),
+('qa_outcome','Quality_Assurance_1km',1,6,1,1,'Primary cloud retrieval successful',('failed','successful'))]
+del _CM, _CONFIDENCE
+
+#Named QA filters: field: accepted value(s), see qa_mask()
+MOD06_FILTERS = {'confident_cloudy' : {'cm_cloudiness' : 0},
+'cloudy' : {'cm_cloudiness' : (0,1)},
+'day' : {'cm_day' : True},
+'no_sunglint' : {'cm_sunglint' : False},
+'liquid' : {'qa_phase' : 2},
+'ice' : {'qa_phase' : 3},
+'successful' : {'qa_outcome' : True},
+'useful' : {'qa_cot_useful' : True, 'qa_ref_useful' : True}}
+
+def bit_lut(fields):
+    """
+    Look-up table from a byte value to every bit field stored in that byte.
+
+    Parameters
+    ----------
+    fields : list
+    Rows of MOD06_BITS from the same SDS and byte.
+
+    Returns
+    -------
+    lut : structured array
+    256 records, one boolean (flags) or uint8 (categories) member per field. Records are padded to 8 bytes
+    so the table can be indexed as uint64 (see decode_bits).
+    """
+    v = np.arange(256)
+    dtype = np.dtype({'names':[r[0] for r in fields],'formats':[bool if r[5] is not None else np.uint8 for r in fields],\
+    'offsets':list(range(len(fields))),'itemsize':8})
+    lut = np.zeros(256,dtype=dtype)
+    for key, name, byte, bit, n, true_value, long_name, categories in fields:
+        value = (v >> bit) & (2**n - 1)
+        if true_value is None: lut[key] = value
+        else: lut[key] = value == true_value
+    return lut
+
+#Look-up tables for each (SDS, byte) of MOD06_BITS
+_fields = OrderedDict()
+for _row in MOD06_BITS:
+    _fields.setdefault((_row[1],_row[2]),[]).append(_row)
+BIT_LUTS = {}
+for _key in _fields:
+    BIT_LUTS[_key] = bit_lut(_fields[_key])
+del _fields, _row, _key
+
+#Decode cloud mask/QA bytes
+def decode_bits(plane,name,byte):
+    """
+    Decode all the bit fields in one byte of a cloud mask/QA SDS with a single table look-up per pixel.
+
+    Parameters
+    ----------
+    plane : array
+    Byte plane, e.g. Cloud_Mask_1km[:,:,0] (int8 or uint8).
+
+    name : string
+    SDS name, e.g. 'Cloud_Mask_1km'.
+
+    byte : int
+    Byte of the SDS that plane holds.
+
+    Returns
+    -------
+    fields : dict
+    Key: boolean or uint8 array for each field of the byte in MOD06_BITS. These are views of one record array.
+    """
+    lut = BIT_LUTS[(name,byte)]
+    #Index the table as plain 8-byte integers (much faster than copying records) and view the result as records
+    records = lut.view(np.uint64)[np.asarray(plane).view(np.uint8)].view(lut.dtype)
+    return dict((key,records[key]) for key in lut.dtype.names)
+
+def qa_mask(ds,filters,shape=None):
+    """
+    Combine QA filters into one mask of the pixels to keep.
+
+    Parameters
+    ----------
+    ds : dict
+    Datasets with the decoded bit fields, e.g. nrtMOD06().ds.
+
+    filters : list
+    Names from MOD06_FILTERS and/or {field : accepted value(s)} dictionaries, e.g.
+    ['confident_cloudy','liquid','successful'].
+
+    shape : tuple
+    Shape of the mask. 5 km fields (cm5_) are expanded to it with expand_5km(). Default is the shape of the
+    first field.
+
+    Returns
+    -------
+    keep : boolean array
+    True where every filter passes.
+    """
+    keep = None
+    for f in filters:
+        if not isinstance(f,dict): f = MOD06_FILTERS[f]
+        for key, accepted in sorted(f.items()):
+            field = ds[key]
+            if shape is None: shape = np.shape(field)
+            if np.shape(field) != tuple(shape): field = expand_5km(field,shape=shape)
+            table = np.zeros(256,bool)
+            table[np.atleast_1d(accepted).astype(int)] = True
+            ok = table[field.view(np.uint8)]
+            if keep is None: keep = ok
+            else: keep &= ok
+    return keep
+
+def filtered(ds,key,filters):
+    """
+    Dataset with every pixel that fails the QA filters masked (or set to NaN for the 'nan32' backend).
+
+    Parameters
+    ----------
+    ds : dict
+    Datasets with the decoded bit fields, e.g. nrtMOD06().ds.
+
+    key : string
+    Dataset to filter, e.g. 'Nd'.
+
+    filters : list
+    See qa_mask().
+
+    Returns
+    -------
+    data : masked array or float array
+    Filtered copy of ds[key]; ds[key] itself is not changed.
+    """
+    data = ds[key]
+    invalid = ~qa_mask(ds,filters,np.shape(data))
+    if ma.isMaskedArray(data): return ma.MaskedArray(data, mask=invalid | ma.getmaskarray(data))
+    data = arrays.as_nan(data).copy()
+    data[invalid] = np.nan
+    return data
+
+"""
+Derived MOD06_L2 datasets: key, inputs, function of the inputs, long name, units. Entries without a long name
+are intermediates that aren't kept as datasets. See evaluate().
+"""
+MOD06_ND = [('Nd',('COT','ref'),droplet_number,'Droplet concentration','$\mathregular{cm^{-3}}$'),
+('Nd16',('COT16','ref16'),droplet_number,'Droplet concentration at 1.6 micron','$\mathregular{cm^{-3}}$'),
+('Nd37',('COT37','ref37'),droplet_number,'Droplet concentration at 3.7 micron','$\mathregular{cm^{-3}}$')]
+
+#Same, with the adiabatic condensation rate from cloud top temperature and pressure (gamma_lut()) for each pixel
+_nd_tp = (lambda c, r, g: droplet_number(c,r,gamma=g))
+MOD06_ND_TP = [('Nd',('COT','ref','gamma_ad'),_nd_tp,'Droplet concentration','$\mathregular{cm^{-3}}$'),
+('Nd16',('COT16','ref16','gamma_ad'),_nd_tp,'Droplet concentration at 1.6 micron','$\mathregular{cm^{-3}}$'),
+('Nd37',('COT37','ref37','gamma_ad'),_nd_tp,'Droplet concentration at 3.7 micron','$\mathregular{cm^{-3}}$')]
+
+#Condensation rate used for Nd by MOD06 and nrtMOD06: 'constant' (2E-6 kg/m^4, MOD06_ND) or 'lut' (MOD06_ND_TP)
+nd_gamma = 'constant'
+
+def mod06_nd():
+    """
+    Nd datasets for the current nd_gamma setting, MOD06_ND or MOD06_ND_TP.
+    """
+    if nd_gamma == 'constant': return MOD06_ND
+    if nd_gamma == 'lut': return MOD06_ND_TP
+    raise ValueError("nd_gamma must be 'constant' or 'lut', not %r" % (nd_gamma,))
+
+#Differences (2.1 micron - other channel) and normalized differences (per mil) for the NRT files
+MOD06_BIASES = []
+for _v, _name, _unit in [('ref','Effective radius','%sm' % u"\u03BC"),('COT','Cloud optical thickness','unitless'),\
+('Nd','Cloud optical thickness','unitless')]:
+    for _c, _wl in [('16','1.6'),('37','3.7')]:
+        MOD06_BIASES.append(('delta_%s%s' % (_v,_c),(_v,_v+_c),(lambda a, b: a - b),\
+        '%s difference (2.1-%s %sm)' % (_name,_wl,u"\u03BC"),_unit))
+        MOD06_BIASES.append(('del_%s%s' % (_v,_c),('delta_'+_v+_c,_v),(lambda d, a: 1000.*d/a),\
+        'Normalized %s difference (2.1-%s %sm)' % (_name[0].lower()+_name[1:],_wl,u"\u03BC"),'per mil'))
+del _v, _name, _unit, _c, _wl
+
+class DerivedDict(LazyDict):
+    """
+    LazyDict whose derived datasets are computed with evaluate() from a dependency graph.
+    
+    Parameters
+    ----------
+    loaders : dict
+    As for LazyDict.
+    
+    derived : list
+    (key, inputs, function, long name, units) for each derived dataset, e.g. MOD06_ND.
+    
+    array_backend : string
+    Backend of the derived datasets, 'ma' or 'nan32'. Default is arrays.array_backend.
+    
+    store : GranuleStore
+    On-disk cache, see LazyDict. Optional.
+    
+    Methods
+    -------
+    derive: Compute several derived datasets together.
+    """
+    
+    def __init__(self,loaders,derived,array_backend=None,store=None):
+        LazyDict.__init__(self,loaders,store)
+        self.array_backend = arrays.backend(array_backend)
+        self.graph = dict((key,(inputs,f)) for key, inputs, f, long_name, unit in derived)
+        for key, inputs, f, long_name, unit in derived:
+            if long_name is not None: self.loaders[key] = (lambda key=key: self.derive([key])[key])
+    
+    def derive(self,keys):
+        """
+        Compute derived datasets (e.g. the whole bias suite) in one pass, sharing their inputs and
+        intermediates. Returns a dictionary of the requested datasets.
+        """
+        return evaluate(self.graph,self,keys,array_backend=self.array_backend)
+
+def mod06_datasets(filename,sds=MOD06_SDS,derived=MOD06_ND,array_backend=None,store=None,window=None):
+    """
+    Set up lazily loaded MOD06_L2 datasets.
+    
+    Parameters
+    ----------
+    filename : string
+    M-D06_L2 file.
+    
+    sds : list
+    (key, SDS name, long name, units) of datasets read from file. Default MOD06_SDS.
+    
+    derived : list
+    (key, inputs, function, long name, units) of datasets computed from other datasets. Default MOD06_ND.
+    
+    array_backend : string
+    'ma' for masked arrays or 'nan32' for float32 arrays with NaN, see arrays. Default is arrays.array_backend.
+    
+    store : GranuleStore
+    On-disk cache of the decoded datasets, e.g. granule_cache.store(filename). Optional.
+    
+    window : tuple
+    Only read (and derive) datasets inside a bbox_window() window, e.g. from l2_window(). Optional.
+    
+    Returns
+    -------
+    ds_name, ds, units : dict, DerivedDict, dict
+    Long names, datasets and units. Datasets are read or computed on first access and then kept.
+    The cloud mask/QA bit fields of MOD06_BITS are included: accessing one reads and decodes its byte plane
+    once and keeps every field of that byte.
+    """
+    ds_name = {'lon' : 'Longitude', 'lat' : 'Latitude'} #Get full name from abbreviation
+    units = {'lon' : 'degrees', 'lat' : 'degrees'} #To check units
+    geo = window[:2] if window is not None else (slice(None),slice(None))
+    loaders = {'lon' : (lambda: handle_pool.select(filename,'Longitude')[geo]),\
+    'lat' : (lambda: handle_pool.select(filename,'Latitude')[geo])}
+    for key, name, long_name, unit in sds:
+        loaders[key] = (lambda name=name: read_scaled(filename,name,array_backend,window)[0])
+        ds_name[key] = long_name
+        units[key] = unit
+    if 'CTT' in loaders and 'CTP' in loaders and 'COT' in loaders:
+        #Condensation rate from the 5 km cloud top temperature and pressure, on the 1 km grid
+        loaders['gamma_ad'] = (lambda: expand_5km(gamma_lut(ds['CTT'],ds['CTP']).astype(np.float32),\
+        shape=np.shape(ds['COT'])))
+        ds_name['gamma_ad'] = 'Adiabatic condensation rate'
+        units['gamma_ad'] = 'kg/m^4'
+    def load_bits(key,name,byte):
+        rows, cols = sds_window(filename,name,window) or (slice(None),slice(None))
+        fields = decode_bits(handle_pool.select(filename,name)[rows,cols,byte],name,byte)
+        for k in fields:
+            if k not in ds: ds[k] = fields[k]
+        return fields[key]
+    for key, name, byte, bit, n, true_value, long_name, categories in MOD06_BITS:
+        loaders[key] = (lambda key=key, name=name, byte=byte: load_bits(key,name,byte))
+        ds_name[key] = long_name
+        if true_value is None: units[key] = 'category'
+        else: units[key] = 'flag'
+    ds = DerivedDict(loaders,derived,array_backend,store) #Get dataset from abbreviation
+    for key, inputs, f, long_name, unit in derived:
+        if long_name is None: continue
+        ds_name[key] = long_name
+        units[key] = unit
+    return ds_name, ds, units
+
+"""
+Functions for MOD06_L2/MYD06_L2 files downloaded from from LAADS Web (https://ladsweb.nascom.nasa.gov/).
+"""
+
+class MOD06(_Swath):
+    """
+    Create object to analyze from MOD06_L2/MYD06_L2 cloud file downloaded from LAADS Web (https://ladsweb.nascom.nasa.gov/).
+    
+    Parameters
+    ----------
+    cfile : string
+    M-D06_L2 cloud file.
+    
+    array_backend : string
+    'ma' for masked arrays or 'nan32' for float32 arrays with NaN for invalid pixels, see arrays.
+    Default is arrays.array_backend.
+    
+    bbox : tuple or dict
+    Only read the part of the swath inside (lon_min, lat_min, lon_max, lat_max) or a KH93-style
+    {'N','S','E','W'} box, see l2_window(). Derived datasets are only computed there too. Optional; default is
+    the whole granule. Use intersects() to skip granules outside the box without reading them.
+    
+    Returns
+    -------
+    day, year, time, satellite : int, int, int, float
+    Satellite properties.
+    
+    lat, lon : array, array
+    Latitude and longitude for plotting, cropped to the window if bbox is given.
+    
+    rows, cols : slice
+    Window of the 1 km swath that is read.
+    
+    ds_name, ds, units : dict, DerivedDict, dict
+    Dataset long names, arrays (read from file or computed on first access) and units. Datasets are also
+    attributes, e.g. self.ref is self.ds['ref'].
+    """
+    
+    def __init__(self,cfile,array_backend=None,bbox=None):
+        self.array_backend = arrays.backend(array_backend)
+        name = os.path.basename(cfile)
+        self.day = name[14:16+1]
+        self.year = name[10:13+1]
+        self.time = name[18:21+1]
+        if name[1] == 'Y':
+            self.satellite = 'Aqua'
+        elif name[1] == 'O':
+            self.satellite = 'Terra'
         
-        #
-        ###Relative azimuth angle
-        #
-        self.raa = self.vaa - self.saa
-        ds_name['raa'] = 'Relative azimuth angle'
-        ds['raa'] = self.raa
-        units['raa'] = 'degrees'
+        #Read in file
+        self.file = cfile
+        self.path = os.path.abspath(cfile)
         
         #
-        ###Nd at 2.13 micron
+        ###Get geolocation data and date
         #
-        k = .8
-        gam_ad = 2.E-6 #kg/m^4
-        frac_ad = 1
-        gam_eff = gam_ad*frac_ad
-        self.Nd = 10**.5/(4*np.pi*1000**.5)*gam_eff**.5*self.COT**.5/(self.ref*10**-6)**2.5/k/100.**3
-        ds_name['Nd'] = 'Droplet concentration'
-        ds['Nd'] = self.Nd
-        units['Nd'] = '$\mathregular{cm^{-3}}$'
+        self.bbox = bbox
+        self.window = l2_window(self.path,bbox) if bbox is not None else None
+        self.rows, self.cols = self.window[2:] if self.window is not None else (slice(None), slice(None))
+        
+        #Datasets are read from file (or derived) when first used, or memory-mapped from granule_cache
+        tag = nd_gamma if self.window is None else '%s.%s' % (nd_gamma,window_tag(self.window))
+        store = granule_cache.store(self.path,self.array_backend,tag)
+        self.ds_name, self.ds, self.units = mod06_datasets(self.path,MOD06_SDS,mod06_nd(),self.array_backend,store,\
+        self.window)
+        self.lon = self.ds['lon']
+        self.lat = self.ds['lat']
+               
+    def filtered(self,key,filters=('confident_cloudy','liquid','successful')):
+        """
+        Dataset with the pixels that fail QA filters masked, e.g. self.filtered('Nd'). See qa_mask() and
+        MOD06_FILTERS. Default keeps confident cloudy, liquid phase, successful retrievals.
+        """
+        return filtered(self.ds,key,filters)
+    
+    def to_store(self,path,variables=None,chunks=None,compression='zlib',pack=False):
+        """
+        Save datasets to a chunked, compressed netCDF4 file, see archive.write(). Open it again with
+        archive.read(path).
+        """
+        archive.write(path,self,variables,chunks,compression,pack=pack)
+    
+    def view_Re(self,num=None):
+        """
+        Plot the view as seen from the satellite for Re bias
         
-        #
-        ###Nd at 1.6 micron
-        #
-        k = .8
-        gam_ad = 2.E-6 #kg/m^4
-        frac_ad = 1
-        gam_eff = gam_ad*frac_ad
-        self.Nd16 = 10**.5/(4*np.pi*1000**.5)*gam_eff**.5*self.COT16**.5/(self.ref16*10**-6)**2.5/k/100.**3
-        ds_name['Nd16'] = 'Droplet concentration at 1.6 micron'
-        ds['Nd16'] = self.Nd16
-        units['Nd16'] = '$\mathregular{cm^{-3}}$'
+        Parameters
+        ----------
+        num : int or string
+        Figure number/name to draw on, see render.figure(). Optional.
         
-        #
-        ###Nd at 3.7 micron
-        #
-        k = .8
-        gam_ad = 2.E-6 #kg/m^4
-        frac_ad = 1
-        gam_eff = gam_ad*frac_ad
-        self.Nd37 = 10**.5/(4*np.pi*1000**.5)*gam_eff**.5*self.COT37**.5/(self.ref37*10**-6)**2.5/k/100.**3
-        ds_name['Nd37'] = 'Droplet concentration at 3.7 micron'
-        ds['Nd37'] = self.Nd37
-        units['Nd37'] = '$\mathregular{cm^{-3}}$'
+        Returns
+        -------
+        fig : matplotlib Figure
+        Figure with the plot(s).
+        """
+        fig = render.figure(num,name='MOD06.view_Re')
+        ax = fig.add_subplot(1,1,1)
+        m = render.basemap(projection='nsper',lon_0=self.lon.mean(),lat_0=self.lat.mean(),resolution='l',satellite_height=705000,ax=ax)
+        render.background(m,ax)
+        m.drawparallels(np.arange(-180,180,10))
+        m.drawmeridians(np.arange(0,360,10))
+        im = m.pcolormesh(self.lon,self.lat,self.median[:np.shape(self.lat)[0],:np.shape(self.lat)[1]],shading='gouraud',cmap='YlGnBu_r',latlon=True,vmin=-5,vmax=0)
+        cbar = m.colorbar(im,fig=fig)
+        cbar.set_label('Bias (%sm)' % (u"\u03BC"))
+        ax.set_title('View from %s (%s, %s, at %s)' % \
+        (self.satellite,cal_day(int(self.day),int(self.year)),self.year,self.time))
+        render.show(fig)
+        return fig
+
+"""
+Class for NRT MOD06_L2/MYD06_L2 files downloaded from from LANCE (https://lance.modaps.eosdis.nasa.gov/data_products/).
+"""
+
+class nrtMOD06(_Swath):
+    """
+    Create object to analyze from MOD06_L2/MYD06_L2 cloud file downloaded from LANCE (https://lance.modaps.eosdis.nasa.gov/data_products/).
+    
+    ***Created for ORACLES campaign (https://espo.nasa.gov/home/oracles/)***
         
-        #
-        ###Difference between Nd(2.1) - Nd(1.6)
-        #
-        self.delta_Nd16 = self.Nd - self.Nd16
-        ds_name['delta_Nd16'] = 'Cloud optical thickness difference (2.1-1.6 %sm)' % u"\u03BC"
-        ds['delta_Nd16'] = self.delta_Nd16
-        units['delta_Nd16'] = 'unitless'
-        #Normalized difference
-        self.del_Nd16 = 1000.*(self.delta_Nd16)/self.Nd
-        ds_name['del_Nd16'] = 'Normalized cloud optical thickness difference (2.1-1.6 %sm)' % u"\u03BC"
-        ds['del_Nd16'] = self.del_Nd16
-        units['del_Nd16'] = 'per mil'
+    Parameters
+    ----------
+    cfile : string
+    M-D06_L2 cloud file.
+    
+    array_backend : string
+    'ma' for masked arrays or 'nan32' for float32 arrays with NaN for invalid pixels, see arrays.
+    Default is arrays.array_backend.
+    
+    bbox : tuple or dict
+    Only read the part of the swath inside (lon_min, lat_min, lon_max, lat_max) or a KH93-style
+    {'N','S','E','W'} box, see l2_window(). Derived datasets are only computed there too. Optional; default is
+    the whole granule. Use intersects() to skip granules outside the box without reading them.
+    
+    Methods
+    -------
+    get_ds: Get previously unaccessed dataset from file and save in dictionaries.
+    
+    get_many: Get several previously unaccessed datasets from file at once.
+    
+    filtered: Get a dataset with pixels failing cloud mask/QA filters masked.
+    
+    to_store: Save datasets to a chunked, compressed netCDF4 archive.
+    
+    quick_plot: Plot variables quickly as a check/first look at the data.
+    
+    tri_plot: Pre-defined groupings of three plots meant for use on the ORACLES field campaign.
+    
+    five_plot: Pre-defined groupings of five plots meant for use on the ORACLES field campaign.
+        -value at each channel plus delta and del biases
+    
+    Returns
+    -------
+    jday, year, day : int
+    Julian day, year, calendar day
+    
+    month, time, satellite : string
+    Month, time of passage, satellite (Terra or Aqua)
+    
+    lat, lon : array, array
+    5 km x 5 km latitude and longitude arrays, cropped to the window if bbox is given.
+    
+    rows, cols : slice
+    Window of the 1 km swath that is read.
+    
+    ds_name : dict
+    Dictionary of named datasets available.
+    
+    ds : DerivedDict
+    Dictionary of dataset arrays, read from file (or computed) on first access. Check ds_name for available
+    parameters. Datasets are also attributes, e.g. self.Nd is self.ds['Nd'].
+    
+    units : dict
+    Dictionary of units for each dataset array.
+    
+    Modification history
+    --------------------
+    Written: Michael Diamond, 08/08-09/2016, Seattle, WA
+    Modified: Michael Diamond, 08/22/2016, Seattle, WA
+    Modified: Michael Diamond, 08/29/2016, Swakopmund, Namibia
+        -Collection 6 NRT processing now available!!!
+        -Updates to make compatible with C6 (mostly to ref, also added COT differences)
+    """
+    
+    def __init__(self,cfile,array_backend=None,bbox=None):
+        #Read in file
+        self.file = cfile
+        self.path = os.path.abspath(cfile)
+        self.array_backend = arrays.backend(array_backend)
         
         #
-        ###Difference between Nd(2.1) - Nd(3.7)
+        ###Get geolocation data and date
         #
-        self.delta_Nd37 = self.Nd - self.Nd37
-        ds_name['delta_Nd37'] = 'Cloud optical thickness difference (2.1-3.7 %sm)' % u"\u03BC"
-        ds['delta_Nd37'] = self.delta_Nd37
-        units['delta_Nd37'] = 'unitless'
-        #Normalized difference
-        self.del_Nd37 = 1000.*(self.delta_Nd37)/self.Nd
-        ds_name['del_Nd37'] = 'Normalized cloud optical thickness difference (2.1-3.7 %sm)' % u"\u03BC"
-        ds['del_Nd37'] = self.del_Nd37
-        units['del_Nd37'] = 'per mil'
+        name = os.path.basename(self.file)
+        self.jday = int(name[14:16+1])
+        self.year = int(name[10:13+1])
+        self.month = cal_day(self.jday,self.year).split()[0]
+        self.day = int(cal_day(self.jday,self.year).split()[1])
+        self.time = name[18:21+1]
+        if name[1] == 'Y':
+            self.satellite = 'Aqua'
+        elif name[1] == 'O':
+            self.satellite = 'Terra'
         
-        #Finishing touches
-        self.ds_name = ds_name
-        self.ds = ds
-        self.units = units
-        c.end()
+        #Cloud properties, geometry, Nd and biases are read from file (or derived) when first used, or
+        #memory-mapped from granule_cache
+        derived = mod06_nd() + MOD06_BIASES + [('raa',('vaa','saa'),(lambda a, b: a - b),'Relative azimuth angle','degrees')]
+        self.bbox = bbox
+        self.window = l2_window(self.path,bbox) if bbox is not None else None
+        self.rows, self.cols = self.window[2:] if self.window is not None else (slice(None), slice(None))
+        tag = nd_gamma if self.window is None else '%s.%s' % (nd_gamma,window_tag(self.window))
+        store = granule_cache.store(self.path,self.array_backend,tag)
+        self.ds_name, self.ds, self.units = mod06_datasets(self.path,MOD06_SDS+MOD06_GEOMETRY,derived,self.array_backend,store,\
+        self.window)
+        self.lon = self.ds['lon']
+        self.lat = self.ds['lat']
     
     def get_ds(self,dataset):
         """
@@ -2429,29 +3031,63 @@ class nrtMOD06(object):
         dataset : string
         Name of dataset. 
         """
-        c = SD.SD(self.file, SDC.READ)
-        data = c.select('%s' % dataset)[:]
-        attrs = c.select('%s' % dataset).attributes(full=1)
-        scale = attrs['scale_factor'][0]
-        offset = attrs['add_offset'][0]
-        unit = attrs['units'][0]
-        #Mask invalid data
-        valid_min = attrs["valid_range"][0][0]        
-        valid_max = attrs["valid_range"][0][1]
-        _FillValue = attrs["_FillValue"][0]
-        invalid = np.logical_or(data > valid_max, data < valid_min)
-        data = ma.MaskedArray(data, mask=invalid, fill_value=_FillValue)
-        #Fixer-upper
-        data = scale*(data - offset)
-        c.end()
-        #Add to dictionaries for future use
-        self.ds_name['%s' % dataset] = dataset
-        self.ds['%s' % dataset] = data
-        self.units['%s' % dataset] = unit
-        return data
+        return self.get_many([dataset],prefetch=False)[0]
+    
+    def get_many(self,datasets,prefetch=False):
+        """
+        Get several datasets from file that aren't already included, e.g. for exploring extra SDS.
+        
+        Each SDS is read with a single select from the pooled file and scaled/masked with scale_sds(), which
+        tolerates missing scale_factor, add_offset and valid_range attributes. Datasets already in ds or in
+        granule_cache are not read again.
+        
+        Parameters
+        ----------
+        datasets : list
+        Names of datasets (SDS).
+        
+        prefetch : boolean
+        Read the next SDS in a background thread while scaling the current one, see read_raw(). Default False.
+        
+        Returns
+        -------
+        data : list
+        Datasets in the order asked for. They are also added to ds, ds_name and units.
+        """
+        todo = []
+        for dataset in datasets:
+            if dict.__contains__(self.ds,dataset) or dataset in todo: continue
+            data = self.ds.store.get(dataset) if self.ds.store is not None else None
+            if data is None: todo.append(dataset)
+            else: dict.__setitem__(self.ds,dataset,data)
+        for dataset, data, attrs in read_raw(self.path,todo,prefetch,self.window):
+            #Add to dictionaries for future use
+            self.ds_name['%s' % dataset] = dataset
+            self.ds['%s' % dataset] = scale_sds(data,attrs,self.array_backend)
+            self.units['%s' % dataset] = attrs['units'][0] if 'units' in attrs else 'N/A'
+        for dataset in datasets:
+            if dataset in self.units: continue
+            attrs = handle_pool.select(self.path,dataset).attributes(full=1)
+            self.ds_name['%s' % dataset] = dataset
+            self.units['%s' % dataset] = attrs['units'][0] if 'units' in attrs else 'N/A'
+        return [self.ds[dataset] for dataset in datasets]
+    
+    def filtered(self,key,filters=('confident_cloudy','liquid','successful')):
+        """
+        Dataset with the pixels that fail QA filters masked, e.g. self.filtered('Nd'). See qa_mask() and
+        MOD06_FILTERS. Default keeps confident cloudy, liquid phase, successful retrievals.
+        """
+        return filtered(self.ds,key,filters)
+    
+    def to_store(self,path,variables=None,chunks=None,compression='zlib',pack=False):
+        """
+        Save datasets to a chunked, compressed netCDF4 file, see archive.write(). Open it again with
+        archive.read(path).
+        """
+        archive.write(path,self,variables,chunks,compression,pack=pack)
     
     #Quickly plot data as check/first pass
-    def quick_plot(self,data='cf',projection='merc'):
+    def quick_plot(self,data='cf',projection='merc',num=None):
         """
         Quick plot data for a single MOD06 or MYD06 NRT file. Intended as a check or first pass at data.
         
@@ -2463,9 +3099,12 @@ class nrtMOD06(object):
         projection : string
         Use 'merc' for mercator, 'global' for global plot (kav7), 'nsper' for Terra/Aqua's eye view.
         
+        num : int or string
+        Figure number/name to draw on, see render.figure(). Optional.
+        
         Returns
         -------
-        Plot of data subsampled to 5 km x 5 km resolution.
+        Plot of data subsampled to 5 km x 5 km resolution. Returns the matplotlib figure.
         
         Modification history
         --------------------
@@ -2474,8 +3113,8 @@ class nrtMOD06(object):
         if not type(data) == str:
             print('Error: Data must be a valid key to the "ds" dictionary.')
             return
-        plt.figure()
-        plt.clf()
+        fig = render.figure(num,name='nrtMOD06.quick_plot')
+        ax = fig.add_subplot(1,1,1)
         font = 'Arial'
         size = 20
         max_lon = self.lon.max()
@@ -2483,34 +3122,34 @@ class nrtMOD06(object):
         min_lon = self.lon.min()
         min_lat = self.lat.min()
         if projection == 'merc':
-            m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-            urcrnrlat=max_lat+1,projection='merc',resolution='l')
+            m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+            urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
             m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0])
             m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1])
         elif projection == 'global':
-            m = Basemap(lon_0=0,projection='kav7',resolution='c')
+            m = render.basemap(lon_0=0,projection='kav7',resolution='c',ax=ax)
             m.drawparallels(np.arange(-180,180,15),labels=[1,0,0,0])
             m.drawmeridians(np.arange(0,360,45),labels=[1,1,0,1])
         elif projection == 'satellite':
-            m = Basemap(projection='nsper',lon_0=self.lon.mean(),lat_0=self.lat.mean(),\
-            resolution='l',satellite_height=705000)
+            m = render.basemap(projection='nsper',lon_0=self.lon.mean(),lat_0=self.lat.mean(),\
+            resolution='l',satellite_height=705000,ax=ax)
             m.bluemarble(alpha=.75)
         else:
             print("Error: Projection must be 'merc', 'global', or 'satellite'.")
             return
-        m.drawcoastlines()
-        m.drawcountries()
+        render.background(m,ax,land=None)
         d = self.ds['%s' % data]
         if np.shape(d)[0] != np.shape(self.lat)[0]: d = d[::5,::5]
         #Might make these customized in future, for now generic
         cmap = 'viridis'
-        m.pcolormesh(self.lon,self.lat,d[:np.shape(self.lon)[0],:np.shape(self.lat)[1]],\
+        im = m.pcolormesh(self.lon,self.lat,d[:np.shape(self.lon)[0],:np.shape(self.lat)[1]],\
         shading='gouraud',cmap=cmap,latlon=True)
-        cbar = m.colorbar()
+        cbar = m.colorbar(im,fig=fig)
         cbar.ax.tick_params(labelsize=size-4) 
         cbar.set_label('[%s]' % self.units['%s' % data],fontname=font,fontsize=size-2)
-        plt.title('%s for %s %s, %s from %s' % \
+        ax.set_title('%s for %s %s, %s from %s' % \
         (self.ds_name['%s' % data],self.month,self.day,self.year,self.satellite), fontname=font,fontsize=size)
+        return fig
     
     def triplot(self,data='ref',projection='merc',full_res=False,num=None):
         """
@@ -2536,18 +3175,17 @@ class nrtMOD06(object):
  
         Returns
         -------
-        Figure with three subplots.
+        Figure with three subplots. Returns the matplotlib figure.
         
         Modification history
         --------------------
         Written: Michael Diamond, 8/10-11/2016, Seattle, WA
         """
-        plt.figure(num=num,figsize=(13.33,7.5))
+        fig = render.figure(num,(13.33,7.5),name='nrtMOD06.triplot')
         font = 'Arial'
         size = 16
         if full_res:
-            lat = zoom(self.lat,5.)
-            lon = zoom(self.lon,5.)
+            lon, lat = self.geo_1km()
         else:
             lat = self.lat
             lon = self.lon
@@ -2556,17 +3194,15 @@ class nrtMOD06(object):
         min_lon = lon.min()
         min_lat = lat.min()
         
-        plt.subplot(1,3,1)
+        ax = fig.add_subplot(1,3,1)
         if projection == 'merc':
-            m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-            urcrnrlat=max_lat+1,projection='merc',resolution='l')
+            m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+            urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
             m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
             m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
             x, y = m(min_lon, max_lat-1)
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
-        plt.text(x,y,'%s %s, %s' % (self.month, self.day, self.year),\
+        render.background(m,ax)
+        ax.text(x,y,'%s %s, %s' % (self.month, self.day, self.year),\
         bbox=dict(facecolor='w', alpha=1),fontname=font,fontsize=size-4)
         if data == 'ref': 
             key = 'delta_ref16'
@@ -2599,25 +3235,23 @@ class nrtMOD06(object):
         d = self.ds['%s' % key]
         if not full_res and data != 'geo': d = d[::5,::5]
         if full_res and data == 'geo': d = zoom(d,5.)
-        m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+        im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
         cmap=c,latlon=True,vmin=vmin,vmax=vmax)
-        cbar = m.colorbar(ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax],\
+        cbar = m.colorbar(im,fig=fig,ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax],\
         location='bottom',pad=.35)
         cbar.ax.set_xticklabels([vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
         cbar.ax.tick_params(labelsize=size-4)
         cbar.set_label('[%s]' % self.units['%s' % key],fontname=font,fontsize=size-2)
-        plt.title('A) %s' % t,fontname=font,fontsize=size)
+        ax.set_title('A) %s' % t,fontname=font,fontsize=size)
         
-        plt.subplot(1,3,2)
+        ax = fig.add_subplot(1,3,2)
         if projection == 'merc':
-            m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-            urcrnrlat=max_lat+1,projection='merc',resolution='l')
+            m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+            urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
             m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
             m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
-        plt.text(x,y,'Time: %s UTC' % (self.time),bbox=dict(facecolor='w', alpha=1),\
+        render.background(m,ax)
+        ax.text(x,y,'Time: %s UTC' % (self.time),bbox=dict(facecolor='w', alpha=1),\
         fontname=font,fontsize=size-4)
         d = self.ref
         if data == 'ref': 
@@ -2655,25 +3289,23 @@ class nrtMOD06(object):
             d = zoom(d,5.)*self.ref[:np.shape(lon)[0],:np.shape(lat)[1]]/self.ref[:np.shape(lon)[0],:np.shape(lat)[1]] #Kludge
         if full_res and data == 'cot': 
             d = zoom(d,5.)*self.ref[:np.shape(lon)[0],:np.shape(lat)[1]]/self.ref[:np.shape(lon)[0],:np.shape(lat)[1]] #Kludge
-        m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+        im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
         cmap=c,latlon=True,vmin=vmin,vmax=vmax)
-        cbar = m.colorbar(ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax],\
+        cbar = m.colorbar(im,fig=fig,ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax],\
         location='bottom',pad=.35)
         cbar.ax.set_xticklabels([vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
         cbar.ax.tick_params(labelsize=size-4)
         cbar.set_label('[%s]' % self.units['%s' % key],fontname=font,fontsize=size-2)
-        plt.title('B) %s' % t,fontname=font,fontsize=size)
+        ax.set_title('B) %s' % t,fontname=font,fontsize=size)
         
-        plt.subplot(1,3,3)
+        ax = fig.add_subplot(1,3,3)
         if projection == 'merc':
-            m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-            urcrnrlat=max_lat+1,projection='merc',resolution='l')
+            m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+            urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
             m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
             m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
-        plt.text(x,y,'Satellite: %s' % (self.satellite),bbox=dict(facecolor='w', alpha=1),\
+        render.background(m,ax)
+        ax.text(x,y,'Satellite: %s' % (self.satellite),bbox=dict(facecolor='w', alpha=1),\
         fontname=font,fontsize=size-4)
         d = self.ref
         if data == 'ref': 
@@ -2707,18 +3339,18 @@ class nrtMOD06(object):
         d = self.ds['%s' % key]
         if not full_res and data != 'geo': d = d[::5,::5]
         if full_res and data == 'geo': d = zoom(d,5.)
-        m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+        im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
         cmap=c,latlon=True,vmin=vmin,vmax=vmax)
-        cbar = m.colorbar(ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax],\
+        cbar = m.colorbar(im,fig=fig,ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax],\
         location='bottom',pad=.35)
         cbar.ax.set_xticklabels([vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
         cbar.ax.tick_params(labelsize=size-4)
         cbar.set_label('[%s]' % self.units['%s' % key],fontname=font,fontsize=size-2)
-        plt.title('C) %s' % t,fontname=font,fontsize=size)
-        
-        plt.show()
+        ax.set_title('C) %s' % t,fontname=font,fontsize=size)
+        render.show(fig)
+        return fig
 
-    def five_plot(self,data='ref'):
+    def five_plot(self,data='ref',num=None):
         """
         Make plot showing variable at each wavelength and biases
         
@@ -2727,13 +3359,25 @@ class nrtMOD06(object):
         data : string
         Choice of 'cot','ref', or 'Nd'. Default is effective radius.
         
+        num : int or string
+        Figure number/name to draw on, see render.figure(). Optional.
+        
+        Returns
+        -------
+        fig : matplotlib Figure
+        Figure with the plot(s).
+        
         Modification history
         --------------------
         Written: Michael Diamond, 08/29/2016, Swakopmund, Namibia
         """
-        plt.clf()
+        fig = render.figure(num,(13.33,7.5),name='nrtMOD06.five_plot')
         font = 'Arial'
         size = 15
+        #Compute the derived datasets for this plot together
+        if data in ['ref','cot','Nd']:
+            v = {'ref':'ref','cot':'COT','Nd':'Nd'}[data]
+            self.ds.derive([v,v+'16',v+'37','delta_%s16' % v,'del_%s16' % v])
         if data == 'ref':
             dA = self.ref16
             dB = self.ref
@@ -2773,6 +3417,9 @@ class nrtMOD06(object):
         else:
             print('Error: Invalid data input.')
             return
+        #Map background for the retrievals at each wavelength
+        if data == 'Nd': bg = dict(land='floralwhite',ocean='steelblue')
+        else: bg = {}
         #
         ###Variables at different wavelengths
         #
@@ -2787,157 +3434,141 @@ class nrtMOD06(object):
         min_lon = lon.min()
         min_lat = lat.min()
         #1.63 micron band
-        plt.subplot(2,3,1)
-        m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-        urcrnrlat=max_lat+1,projection='merc',resolution='l')
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
+        ax = fig.add_subplot(2,3,1)
+        m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+        urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
+        render.background(m,ax,**bg)
         m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0])
         m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1])
         x, y = m(min_lon, max_lat-1)
-        plt.text(x,y,'%s %s, %s' % (self.month,self.day, self.year),bbox=dict(facecolor='w', alpha=1),\
+        ax.text(x,y,'%s %s, %s' % (self.month,self.day, self.year),bbox=dict(facecolor='w', alpha=1),\
         fontname=font,fontsize=size-2)
         d = dA[::5,::5]
         if data == 'Nd': 
-            m.drawmapboundary(fill_color='steelblue')
-            m.fillcontinents(color='floralwhite',lake_color='steelblue',zorder=0)
             vmin = 1
             vmax = 1000
-            m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+            im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
             cmap='cubehelix',latlon=True,norm = LogNorm(vmin=vmin, vmax=vmax))
-            cbar = m.colorbar(ticks=[1,10,100,1000])
+            cbar = m.colorbar(im,fig=fig,ticks=[1,10,100,1000])
             cbar.ax.set_xticklabels([1,10,100,1000])
             cbar.ax.tick_params(labelsize=size-4)
             cbar.set_label('[per cc]',fontname=font,fontsize=size-2)
         else:
-            m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+            im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
             cmap='viridis',latlon=True,vmin=vmin,vmax=vmax)
-            cbar = m.colorbar(ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
+            cbar = m.colorbar(im,fig=fig,ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
             cbar.ax.set_xticklabels([vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
             cbar.ax.tick_params(labelsize=size-4)
             cbar.set_label('[%s]' % self.units['%s' % key],fontname=font,fontsize=size-2)
-        plt.title('A) 1.63 %sm/860 nm channels' % (u"\u03BC"),fontname=font,fontsize=size)
+        ax.set_title('A) 1.63 %sm/860 nm channels' % (u"\u03BC"),fontname=font,fontsize=size)
         #2.13 micron band
-        plt.subplot(2,3,2)
-        m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-        urcrnrlat=max_lat+1,projection='merc',resolution='l')
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
+        ax = fig.add_subplot(2,3,2)
+        m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+        urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
+        render.background(m,ax,**bg)
         m.drawparallels(np.arange(-180,180,10),labels=[0,0,0,0])
         m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1])
         x, y = m(min_lon, max_lat-1)
-        plt.text(x,y,'Time: %s' % (self.time),bbox=dict(facecolor='w', alpha=1),\
+        ax.text(x,y,'Time: %s' % (self.time),bbox=dict(facecolor='w', alpha=1),\
         fontname=font,fontsize=size-2)
         d = dB[::5,::5]
         if data == 'Nd': 
-            m.drawmapboundary(fill_color='steelblue')
-            m.fillcontinents(color='floralwhite',lake_color='steelblue',zorder=0)
             vmin = 1
             vmax = 1000
-            m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+            im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
             cmap='cubehelix',latlon=True,norm = LogNorm(vmin=vmin, vmax=vmax))
-            cbar = m.colorbar(ticks=[1,10,100,1000])
+            cbar = m.colorbar(im,fig=fig,ticks=[1,10,100,1000])
             cbar.ax.set_xticklabels([1,10,100,1000])
             cbar.ax.tick_params(labelsize=size-4)
             cbar.set_label('[per cc]',fontname=font,fontsize=size-2)
         else:
-            m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+            im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
             cmap='viridis',latlon=True,vmin=vmin,vmax=vmax)
-            cbar = m.colorbar(ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
+            cbar = m.colorbar(im,fig=fig,ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
             cbar.ax.set_xticklabels([vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
             cbar.ax.tick_params(labelsize=size-4)
             cbar.set_label('[%s]' % self.units['%s' % key],fontname=font,fontsize=size-2)
-        plt.title('B) Standard %s retrieval' % (key),fontname=font,fontsize=size)
+        ax.set_title('B) Standard %s retrieval' % (key),fontname=font,fontsize=size)
         #3.7 micron band
-        plt.subplot(2,3,3)
-        m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-        urcrnrlat=max_lat+1,projection='merc',resolution='l')
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
+        ax = fig.add_subplot(2,3,3)
+        m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+        urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
+        render.background(m,ax,**bg)
         m.drawparallels(np.arange(-180,180,10),labels=[0,0,0,0])
         m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1])
         x, y = m(min_lon, max_lat-1)
-        plt.text(x,y,'Satellite: %s' % (self.satellite),bbox=dict(facecolor='w', alpha=1),\
+        ax.text(x,y,'Satellite: %s' % (self.satellite),bbox=dict(facecolor='w', alpha=1),\
         fontname=font,fontsize=size-2)
         d = dC[::5,::5]
         if data == 'Nd': 
-            m.drawmapboundary(fill_color='steelblue')
-            m.fillcontinents(color='floralwhite',lake_color='steelblue',zorder=0)
             vmin = 1
             vmax = 1000
-            m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+            im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
             cmap='cubehelix',latlon=True,norm = LogNorm(vmin=vmin, vmax=vmax))
-            cbar = m.colorbar(ticks=[1,10,100,1000])
+            cbar = m.colorbar(im,fig=fig,ticks=[1,10,100,1000])
             cbar.ax.set_xticklabels([1,10,100,1000])
             cbar.ax.tick_params(labelsize=size-4)
             cbar.set_label('[per cc]',fontname=font,fontsize=size-2)
         else:
-            m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+            im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
             cmap='viridis',latlon=True,vmin=vmin,vmax=vmax)
-            cbar = m.colorbar(ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
+            cbar = m.colorbar(im,fig=fig,ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
             cbar.ax.set_xticklabels([vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
             cbar.ax.tick_params(labelsize=size-4)
             cbar.set_label('[%s]' % self.units['%s' % key],fontname=font,fontsize=size-2)
-        plt.title('C) 3.7 %sm/860 nm channels' % (u"\u03BC"),fontname=font,fontsize=size)
+        ax.set_title('C) 3.7 %sm/860 nm channels' % (u"\u03BC"),fontname=font,fontsize=size)
         #
         ###Bias plots
         #
-        lon = zoom(lon,5.)
-        lat = zoom(lat,5.)
+        lon, lat = self.geo_1km()
         #Delta
         key = kD
         vmin = vD[0]
         vmed = vD[1]
         vmax = vD[-1]
-        plt.subplot(2,2,3)
-        m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-        urcrnrlat=max_lat+1,projection='merc',resolution='l')
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
+        ax = fig.add_subplot(2,2,3)
+        m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+        urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
+        render.background(m,ax)
         m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0])
         m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1])
         d = dD
         if data == 'Nd':
-            m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+            im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
             cmap='RdYlBu',latlon=True,vmin=vmin,vmax=vmax)
         else:
-            m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+            im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
             cmap='RdYlBu_r',latlon=True,vmin=vmin,vmax=vmax)
-        cbar = m.colorbar(ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
+        cbar = m.colorbar(im,fig=fig,ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
         cbar.ax.set_xticklabels([vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
         cbar.ax.tick_params(labelsize=size-4)
         cbar.set_label('[%s]' % self.units['%s' % key],fontname=font,fontsize=size-2)
-        plt.title('D) %s (2.13 %sm - 1.63 %sm)' % (u"\u0394",u"\u03BC",u"\u03BC"),fontname=font,fontsize=size)
+        ax.set_title('D) %s (2.13 %sm - 1.63 %sm)' % (u"\u0394",u"\u03BC",u"\u03BC"),fontname=font,fontsize=size)
         #Del
         key = kE
         vmin = vE[0]
         vmed = vE[1]
         vmax = vE[-1]
-        plt.subplot(2,2,4)
-        m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-        urcrnrlat=max_lat+1,projection='merc',resolution='l')
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
+        ax = fig.add_subplot(2,2,4)
+        m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+        urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
+        render.background(m,ax)
         m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0])
         m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1])
         d = dE
         if data == 'Nd':
-            m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+            im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
             cmap='RdYlBu',latlon=True,vmin=vmin,vmax=vmax)
         else:
-            m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+            im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
             cmap='RdYlBu_r',latlon=True,vmin=vmin,vmax=vmax)
-        cbar = m.colorbar(ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
+        cbar = m.colorbar(im,fig=fig,ticks=[vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
         cbar.ax.set_xticklabels([vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax])
         cbar.ax.tick_params(labelsize=size-4)
         cbar.set_label('[%s]' % self.units['%s' % key],fontname=font,fontsize=size-2)
-        plt.title('E) %s (2.13 %sm - 1.63 %sm)' % (u"\u03B4",u"\u03BC",u"\u03BC"),fontname=font,fontsize=size)
-        plt.show()
+        ax.set_title('E) %s (2.13 %sm - 1.63 %sm)' % (u"\u03B4",u"\u03BC",u"\u03BC"),fontname=font,fontsize=size)
+        render.show(fig)
+        return fig
 
 """
 Class for NRT MOD06ACAERO/MYD06ACAERO files downloaded from from LANCE (https://lance.modaps.eosdis.nasa.gov/data_products/).
@@ -2956,10 +3587,25 @@ class nrtACAERO(object):
     afile : string
     M-D06ACAERO cloud file.
     
+    array_backend : string
+    'ma' for masked arrays or 'nan32' for float32 arrays with NaN for invalid pixels, see arrays.
+    Default is arrays.array_backend.
+    
+    bbox : tuple or dict
+    Only read the part of the swath inside (lon_min, lat_min, lon_max, lat_max) or a KH93-style
+    {'N','S','E','W'} box. The window lines up with that of nrtMOD06 for the same granule and bbox, see
+    l2_window(). Optional; default is the whole granule.
+    
+    window : tuple
+    Read the same part of the swath as another reader of this granule, e.g. window=cloud.window for an
+    nrtMOD06 object cloud. Used instead of bbox. Optional.
+    
     Methods
     -------
     get_ds: Get previously unaccessed dataset from file and save in dictionaries.
     
+    to_store: Save datasets to a chunked, compressed netCDF4 archive.
+    
     quick_plot: Plot variables quickly as a check/first look at the data.
     
     tri_plot: Pre-defined groupings of three plots meant for use on the ORACLES field campaign.
@@ -2975,6 +3621,9 @@ class nrtACAERO(object):
     lat, lon : array, array
     5 km x 5 km latitude and longitude arrays.
     
+    rows, cols : slice
+    Window of the swath that is read.
+    
     ds_name : dict
     Dictionary of named datasets available.
     
@@ -2986,10 +3635,10 @@ class nrtACAERO(object):
     Written: Michael Diamond, 08/30/2016, Swakopmund, Namibia
     """
     
-    def __init__(self,cfile):
+    def __init__(self,cfile,array_backend=None,bbox=None,window=None):
         #Read in file
         self.file = cfile
-        a = SD.SD(self.file, SDC.READ)
+        self.array_backend = arrays.backend(array_backend)
         #Dictionaries of all defined datasets
         ds_name = {} #Get full name from abbreviation
         ds = {} #Get dataset from abbreviation
@@ -2997,63 +3646,85 @@ class nrtACAERO(object):
         #
         ###Get geolocation data and date
         #
-        self.jday = int(self.file[17:20])
-        self.year = int(self.file[13:17])
+        name = os.path.basename(self.file)
+        self.jday = int(name[17:20])
+        self.year = int(name[13:17])
         self.month = cal_day(self.jday,self.year).split()[0]
         self.day = int(cal_day(self.jday,self.year).split()[1])
-        self.time = self.file[21:25]
-        if self.file[1] == 'Y':
+        self.time = name[21:25]
+        if name[1] == 'Y':
             self.satellite = 'Aqua'
-        elif self.file[1] == 'O':
+        elif name[1] == 'O':
             self.satellite = 'Terra'
-        self.lon = a.select('Longitude')[:,:]
-        ds_name['lon'] = 'Longitude'
-        ds['lon'] = self.lon
-        self.lat = a.select('Latitude')[:,:]
-        ds_name['lat'] = 'Latitude'
-        ds['lat'] = self.lat
-        
         datasets = ['Above_Cloud_AOD','Above_Cloud_AOD_ModAbsAero','Clear_Sky_AOD',\
         'Cloud_Effective_Radius','Cloud_Effective_Radius_ModAbsAero',\
         'Cloud_Optical_Thickness','Cloud_Optical_Thickness_ModAbsAero',\
         'Above_Cloud_AOD_Uncertainty','Above_Cloud_AOD_ModAbsAero_Uncertainty']
-        
-        for dset in datasets:
-            data = a.select('%s' % dset)[:]
-            attrs = a.select('%s' % dset).attributes(full=1)
-            scale = attrs['scale_factor'][0]
-            offset = attrs['add_offset'][0]
-            #_FillValue = attrs["_FillValue"][0] #Why needed? No max/min valid
-            ds_name['%s' % dset] = dset
-            ds['%s' % dset] = scale*(data - offset)
-        
-        #
-        ###Nd
-        #
-        k = .8
-        gam_ad = 2.E-6 #kg/m^4
-        frac_ad = 1
-        gam_eff = gam_ad*frac_ad
-        ds['Nd'] = 10**.5/(4*np.pi*1000**.5)*gam_eff**.5*ds['Cloud_Optical_Thickness']**.5/(ds['Cloud_Effective_Radius']*10**-6)**2.5/k/100.**3
+        ds_name['lon'] = 'Longitude'
+        ds_name['lat'] = 'Latitude'
+        for dset in datasets: ds_name['%s' % dset] = dset
         ds_name['Nd'] = 'Nd'
-        ds['Nd_ModAbsAero'] = 10**.5/(4*np.pi*1000**.5)*gam_eff**.5*ds['Cloud_Optical_Thickness_ModAbsAero']**.5/(ds['Cloud_Effective_Radius_ModAbsAero']*10**-6)**2.5/k/100.**3
-        ds_name['Nd_ModAbsAero'] = 'Nd_ModAbsAero'       
-        
-        #
-        ###Masking invalid AOD data
-        #
-        ds['Above_Cloud_AOD'] = ma.MaskedArray(ds['Above_Cloud_AOD'],ds['Above_Cloud_AOD_Uncertainty']>100,fill_value=0).filled()
-        ds['Above_Cloud_AOD'] = ma.MaskedArray(ds['Above_Cloud_AOD'],ds['Cloud_Optical_Thickness']<4,fill_value=0)
-        ds['Above_Cloud_AOD_ModAbsAero'] = ma.MaskedArray(ds['Above_Cloud_AOD_ModAbsAero'],ds['Above_Cloud_AOD_ModAbsAero_Uncertainty']>100,fill_value=0).filled()
-        ds['Above_Cloud_AOD_ModAbsAero'] = ma.MaskedArray(ds['Above_Cloud_AOD_ModAbsAero'],ds['Cloud_Optical_Thickness_ModAbsAero']<4,fill_value=0)
+        ds_name['Nd_ModAbsAero'] = 'Nd_ModAbsAero'
+        
+        self.bbox = bbox
+        #Geolocation is on the data grid
+        if window is not None: self.window = window[2:] + window[2:]
+        elif bbox is not None: self.window = l2_window(self.file,bbox,1)
+        else: self.window = None
+        self.rows, self.cols = self.window[2:] if self.window is not None else (slice(None), slice(None))
+        
+        #Memory-map everything from granule_cache if this granule was decoded before
+        store = granule_cache.store(self.file,self.array_backend,window_tag(self.window))
+        if store is not None:
+            ds = dict((key,store.get(key)) for key in ds_name)
+            if any(v is None for v in ds.values()): ds = {}
+        if not ds:
+            a = SD.SD(self.file, SDC.READ)
+            ds['lon'] = a.select('Longitude')[self.rows,self.cols]
+            ds['lat'] = a.select('Latitude')[self.rows,self.cols]
+            
+            for dset in datasets:
+                data = a.select('%s' % dset)[self.rows,self.cols]
+                attrs = a.select('%s' % dset).attributes(full=1)
+                scale = attrs['scale_factor'][0]
+                offset = attrs['add_offset'][0]
+                #_FillValue = attrs["_FillValue"][0] #Why needed? No max/min valid
+                if self.array_backend == 'nan32': data = data.astype(np.float32)
+                ds['%s' % dset] = scale*(data - offset)
+            
+            #
+            ###Nd
+            #
+            ds['Nd'], ds['Nd_ModAbsAero'] = droplet_number([ds['Cloud_Optical_Thickness'],ds['Cloud_Optical_Thickness_ModAbsAero']],\
+            [ds['Cloud_Effective_Radius'],ds['Cloud_Effective_Radius_ModAbsAero']])
+            
+            #
+            ###Masking invalid AOD data
+            #
+            ds['Above_Cloud_AOD'] = ma.MaskedArray(ds['Above_Cloud_AOD'],ds['Above_Cloud_AOD_Uncertainty']>100,fill_value=0).filled()
+            ds['Above_Cloud_AOD'] = arrays.masked(ds['Above_Cloud_AOD'],ds['Cloud_Optical_Thickness']<4,0,self.array_backend)
+            ds['Above_Cloud_AOD_ModAbsAero'] = ma.MaskedArray(ds['Above_Cloud_AOD_ModAbsAero'],ds['Above_Cloud_AOD_ModAbsAero_Uncertainty']>100,fill_value=0).filled()
+            ds['Above_Cloud_AOD_ModAbsAero'] = arrays.masked(ds['Above_Cloud_AOD_ModAbsAero'],ds['Cloud_Optical_Thickness_ModAbsAero']<4,0,\
+            self.array_backend)
+            a.end()
+            if store is not None:
+                for key in ds_name: store.put(key,ds[key])
+        self.lon = ds['lon']
+        self.lat = ds['lat']
         
         #Finishing touches
         self.ds_name = ds_name
         self.ds = ds
-        a.end()
+    
+    def to_store(self,path,variables=None,chunks=None,compression='zlib',pack=False):
+        """
+        Save datasets to a chunked, compressed netCDF4 file, see archive.write(). Open it again with
+        archive.read(path).
+        """
+        archive.write(path,self,variables,chunks,compression,pack=pack)
     
     #Quickly plot data as check/first pass
-    def quick_plot(self,data='Above_Cloud_AOD',projection='merc'):
+    def quick_plot(self,data='Above_Cloud_AOD',projection='merc',num=None):
         """
         Quick plot data for a single MOD06 or MYD06 NRT file. Intended as a check or first pass at data.
         
@@ -3065,9 +3736,12 @@ class nrtACAERO(object):
         projection : string
         Use 'merc' for mercator, 'global' for global plot (kav7), 'nsper' for Terra/Aqua's eye view.
         
+        num : int or string
+        Figure number/name to draw on, see render.figure(). Optional.
+        
         Returns
         -------
-        Plot of data subsampled to 5 km x 5 km resolution.
+        Plot of data subsampled to 5 km x 5 km resolution. Returns the matplotlib figure.
         
         Modification history
         --------------------
@@ -3076,8 +3750,8 @@ class nrtACAERO(object):
         if not type(data) == str:
             print('Error: Data must be a valid key to the "ds" dictionary.')
             return
-        plt.figure()
-        plt.clf()
+        fig = render.figure(num,name='nrtACAERO.quick_plot')
+        ax = fig.add_subplot(1,1,1)
         font = 'Arial'
         size = 20
         max_lon = self.lon.max()
@@ -3085,46 +3759,51 @@ class nrtACAERO(object):
         min_lon = self.lon.min()
         min_lat = self.lat.min()
         if projection == 'merc':
-            m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-            urcrnrlat=max_lat+1,projection='merc',resolution='l')
+            m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+            urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
             m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0])
             m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1])
         elif projection == 'global':
-            m = Basemap(lon_0=0,projection='kav7',resolution='c')
+            m = render.basemap(lon_0=0,projection='kav7',resolution='c',ax=ax)
             m.drawparallels(np.arange(-180,180,15),labels=[1,0,0,0])
             m.drawmeridians(np.arange(0,360,45),labels=[1,1,0,1])
         elif projection == 'satellite':
-            m = Basemap(projection='nsper',lon_0=self.lon.mean(),lat_0=self.lat.mean(),\
-            resolution='l',satellite_height=705000)
+            m = render.basemap(projection='nsper',lon_0=self.lon.mean(),lat_0=self.lat.mean(),\
+            resolution='l',satellite_height=705000,ax=ax)
             m.bluemarble(alpha=.75)
         else:
             print("Error: Projection must be 'merc', 'global', or 'satellite'.")
             return
-        m.drawcoastlines()
-        m.drawcountries()
+        render.background(m,ax,land=None)
         d = self.ds['%s' % data]
         #Might make these customized in future, for now generic
         cmap = 'viridis'
-        m.pcolormesh(self.lon,self.lat,d[:np.shape(self.lon)[0],:np.shape(self.lat)[1]],\
+        im = m.pcolormesh(self.lon,self.lat,d[:np.shape(self.lon)[0],:np.shape(self.lat)[1]],\
         shading='gouraud',cmap=cmap,latlon=True)
-        cbar = m.colorbar()
+        cbar = m.colorbar(im,fig=fig)
         cbar.ax.tick_params(labelsize=size-4) 
-        plt.title('%s for %s %s, %s from %s' % \
+        ax.set_title('%s for %s %s, %s from %s' % \
         (self.ds_name['%s' % data],self.month,self.day,self.year,self.satellite), fontname=font,fontsize=size)
+        return fig
     
-    def AOD_plot(self):
+    def AOD_plot(self,num=None):
         """
         Plot both ACAODs and clear sky AOD.
         
+        Parameters
+        ----------
+        num : int or string
+        Figure number/name to draw on, see render.figure(). Optional.
+        
         Returns
         -------
-        Figure with three subplots.
+        Figure with three subplots. Returns the matplotlib figure.
         
         Modification history
         --------------------
         Written: Michael Diamond, 8/30/2016, Swakopmund, Namibia
         """
-        plt.clf()
+        fig = render.figure(num,name='nrtACAERO.AOD_plot')
         font = 'Arial'
         size = 16
         lat = self.lat
@@ -3133,16 +3812,14 @@ class nrtACAERO(object):
         max_lat = lat.max()
         min_lon = lon.min()
         min_lat = lat.min()
-        plt.subplot(1,3,1)
-        m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-        urcrnrlat=max_lat+1,projection='merc',resolution='l')
+        ax = fig.add_subplot(1,3,1)
+        m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+        urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
         m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
         m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
         x, y = m(min_lon, max_lat-1)
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
-        plt.text(x,y,'%s %s, %s' % (self.month, self.day, self.year),\
+        render.background(m,ax)
+        ax.text(x,y,'%s %s, %s' % (self.month, self.day, self.year),\
         bbox=dict(facecolor='w', alpha=1),fontname=font,fontsize=size-4)
         key = 'Above_Cloud_AOD'
         t = 'ACAOD'
@@ -3151,24 +3828,22 @@ class nrtACAERO(object):
         vmed = 2.5
         vmax = 5
         d = self.ds['%s' % key]
-        m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+        im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
         cmap=c,latlon=True,vmin=vmin,vmax=vmax)
-        cbar = m.colorbar(ticks=[vmin, (vmin+vmed)/2., vmed, (vmed+vmax)/2., vmax],\
+        cbar = m.colorbar(im,fig=fig,ticks=[vmin, (vmin+vmed)/2., vmed, (vmed+vmax)/2., vmax],\
         location='bottom',pad=.35)
         cbar.ax.set_xticklabels([vmin, (vmin+vmed)/2., vmed, (vmed+vmax)/2., vmax])
         cbar.ax.tick_params(labelsize=size-4)
-        plt.title('A) %s' % t,fontname=font,fontsize=size)
+        ax.set_title('A) %s' % t,fontname=font,fontsize=size)
         
-        plt.subplot(1,3,2)
-        m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-        urcrnrlat=max_lat+1,projection='merc',resolution='l')
+        ax = fig.add_subplot(1,3,2)
+        m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+        urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
         m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
         m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
         x, y = m(min_lon, max_lat-1)
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
-        plt.text(x,y,'Time: %s' % (self.time),bbox=dict(facecolor='w', alpha=1),\
+        render.background(m,ax)
+        ax.text(x,y,'Time: %s' % (self.time),bbox=dict(facecolor='w', alpha=1),\
         fontname=font,fontsize=size-4)
         key = 'Above_Cloud_AOD_ModAbsAero'
         t = 'ACAOD (ModAbsAero)'
@@ -3177,24 +3852,22 @@ class nrtACAERO(object):
         vmed = 2.5
         vmax = 5
         d = self.ds['%s' % key]
-        m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+        im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
         cmap=c,latlon=True,vmin=vmin,vmax=vmax)
-        cbar = m.colorbar(ticks=[vmin, (vmin+vmed)/2., vmed, (vmed+vmax)/2., vmax],\
+        cbar = m.colorbar(im,fig=fig,ticks=[vmin, (vmin+vmed)/2., vmed, (vmed+vmax)/2., vmax],\
         location='bottom',pad=.35)
         cbar.ax.set_xticklabels([vmin, (vmin+vmed)/2., vmed, (vmed+vmax)/2., vmax])
         cbar.ax.tick_params(labelsize=size-4)
-        plt.title('B) %s' % t,fontname=font,fontsize=size)
+        ax.set_title('B) %s' % t,fontname=font,fontsize=size)
         
-        plt.subplot(1,3,3)
-        m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-        urcrnrlat=max_lat+1,projection='merc',resolution='l')
+        ax = fig.add_subplot(1,3,3)
+        m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+        urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
         m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
         m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
         x, y = m(min_lon, max_lat-1)
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
-        plt.text(x,y,'Satellite: %s' % (self.satellite),bbox=dict(facecolor='w', alpha=1),\
+        render.background(m,ax)
+        ax.text(x,y,'Satellite: %s' % (self.satellite),bbox=dict(facecolor='w', alpha=1),\
         fontname=font,fontsize=size-4)
         key = 'Clear_Sky_AOD'
         t = 'Clear Sky AOD'
@@ -3203,15 +3876,15 @@ class nrtACAERO(object):
         vmed = 2.5
         vmax = 5
         d = self.ds['%s' % key]
-        m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
+        im = m.pcolormesh(lon,lat,d[:np.shape(lon)[0],:np.shape(lat)[1]],\
         cmap=c,latlon=True,vmin=vmin,vmax=vmax)
-        cbar = m.colorbar(ticks=[vmin, (vmin+vmed)/2., vmed, (vmed+vmax)/2., vmax],\
+        cbar = m.colorbar(im,fig=fig,ticks=[vmin, (vmin+vmed)/2., vmed, (vmed+vmax)/2., vmax],\
         location='bottom',pad=.35)
         cbar.ax.set_xticklabels([vmin, (vmin+vmed)/2., vmed, (vmed+vmax)/2., vmax])
         cbar.ax.tick_params(labelsize=size-4)
-        plt.title('C) %s' % t,fontname=font,fontsize=size)
-        
-        plt.show()
+        ax.set_title('C) %s' % t,fontname=font,fontsize=size)
+        render.show(fig)
+        return fig
 
 class nrt_comp(object):
     """
@@ -3221,14 +3894,23 @@ class nrt_comp(object):
     
     Parameters
     ----------
-    cfile : string
-    NRT MOD06_L2 file.
+    cfile : string or nrtMOD06
+    NRT MOD06_L2 file, or an already open nrtMOD06 object.
     
-    afile : string
-    NRT MOD06ACAERO file.
+    afile : string or nrtACAERO
+    NRT MOD06ACAERO file, or an already open nrtACAERO object. Default None finds the ACAERO file of the same
+    granule in the directory of cfile, see directory_index().
     
     *Files should be from same time*
     
+    array_backend : string
+    'ma' or 'nan32', see arrays. Default is arrays.array_backend. Files are opened with open_granule, so
+    objects already open in this process are reused.
+    
+    bbox : tuple or dict
+    Only read the part of the granule inside a lon/lat box, see nrtMOD06. The ACAERO file is read over the
+    same window. Objects given for cfile/afile must cover the same window.
+    
     Modification history
     --------------------
     Written: Michael Diamond, 08/30/2016, Swakopmund, Namibia
@@ -3236,10 +3918,17 @@ class nrt_comp(object):
         -Finished plots
     """
     
-    def __init__(self,cfile,afile):
-        #Read in files
-        c = nrtMOD06(cfile)
-        a = nrtACAERO(afile)
+    def __init__(self,cfile,afile=None,array_backend=None,bbox=None):
+        #Read in files (or use the objects given)
+        if isinstance(cfile,nrtMOD06): c = cfile
+        else: c = open_granule(cfile,nrtMOD06,array_backend=array_backend,bbox=bbox)
+        if afile is None:
+            afile = directory_index(os.path.dirname(c.path)).partner(c.path,'ACAERO')
+            if afile is None: raise ValueError('No ACAERO file found for %s' % c.file)
+        if isinstance(afile,nrtACAERO): a = afile
+        else: a = open_granule(afile,nrtACAERO,array_backend=array_backend,window=c.window)
+        if (c.rows, c.cols) != (a.rows, a.cols):
+            raise ValueError('%s and %s cover different parts of the swath' % (c.file, a.file))
         self.lon = a.lon
         self.lat = a.lat
         self.time = c.time
@@ -3265,7 +3954,7 @@ class nrt_comp(object):
         ACAOD = a.ds['Above_Cloud_AOD']
         ACAOD = ma.MaskedArray(ACAOD,a.ds['Above_Cloud_AOD_Uncertainty'] > 100,fill_value=0).filled()
         invalid = a.ds['Cloud_Optical_Thickness']<4
-        ACAOD = ma.MaskedArray(ACAOD, invalid)
+        ACAOD = arrays.masked(ACAOD,invalid,array_backend=a.array_backend)
         self.ds['%s' % key] = ACAOD
         self.name['%s' % key] = 'ACAOD'
         self.cmap['%s' % key] = 'inferno_r'
@@ -3327,7 +4016,7 @@ class nrt_comp(object):
         self.units['%s' % key] = 'per mil'
         self.keys.append(key)        
         
-    def compare(self,key='delta_ref'):
+    def compare(self,key='delta_ref',num=None):
         """
         Compare ACAOD with bias given by the key.
         
@@ -3336,12 +4025,20 @@ class nrt_comp(object):
         key : string
         Name of bias to plot.
         
+        num : int or string
+        Figure number/name to draw on, see render.figure(). Optional.
+        
+        Returns
+        -------
+        fig : matplotlib Figure
+        Figure with the plot(s).
+        
         Modification history
         --------------------
         Written: Michael Diamond, 08/30/2016, Swakopmund, Namibia
         """
         micron = u"\u03BC"+'m'
-        plt.clf()
+        fig = render.figure(num,name='nrt_comp.compare')
         font = 'Arial'
         size = 16
         max_lon = self.lon.max()
@@ -3353,20 +4050,18 @@ class nrt_comp(object):
         vmed = self.v['ACAOD'][1]
         vmax = self.v['ACAOD'][-1]
         cmap = self.cmap['ACAOD']
-        plt.subplot(1,2,1)
-        m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-        urcrnrlat=max_lat+1,projection='merc',resolution='l')
+        ax = fig.add_subplot(1,2,1)
+        m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+        urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
         m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
         m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
-        m.pcolormesh(self.lon,self.lat,self.ds['ACAOD'],cmap=cmap,vmin=vmin,vmax=vmax,latlon=True)
+        render.background(m,ax)
+        im = m.pcolormesh(self.lon,self.lat,self.ds['ACAOD'],cmap=cmap,vmin=vmin,vmax=vmax,latlon=True)
         ticks = [0,.5,1,1.5,2,2.5,3]
-        cbar = m.colorbar(ticks=ticks,extend='max')
+        cbar = m.colorbar(im,fig=fig,ticks=ticks,extend='max')
         cbar.ax.set_xticklabels(ticks)
         cbar.ax.tick_params(labelsize=size-4)
-        plt.title('A) ACAOD on %s %s, %s, from %s' % (self.month,self.day,self.year,self.satellite),\
+        ax.set_title('A) ACAOD on %s %s, %s, from %s' % (self.month,self.day,self.year,self.satellite),\
         fontname=font,fontsize=size)
         #Bias
         bias = self.ds[key]
@@ -3374,23 +4069,22 @@ class nrt_comp(object):
         vmed = self.v[key][1]
         vmax = self.v[key][-1]
         cmap = self.cmap[key]
-        plt.subplot(1,2,2)
-        m = Basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
-        urcrnrlat=max_lat+1,projection='merc',resolution='l')
+        ax = fig.add_subplot(1,2,2)
+        m = render.basemap(llcrnrlon=min_lon-1,llcrnrlat=min_lat-1,urcrnrlon=max_lon+1,\
+        urcrnrlat=max_lat+1,projection='merc',resolution='l',ax=ax)
         m.drawparallels(np.arange(-180,180,10),labels=[1,0,0,0],fontsize=size-2,fontname=font)
         m.drawmeridians(np.arange(0,360,10),labels=[1,1,0,1],fontsize=size-2,fontname=font)
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
-        m.pcolormesh(self.lon,self.lat,bias,cmap=cmap,vmin=vmin,vmax=vmax,latlon=True)
+        render.background(m,ax)
+        im = m.pcolormesh(self.lon,self.lat,bias,cmap=cmap,vmin=vmin,vmax=vmax,latlon=True)
         ticks = [vmin, (vmin+vmed)/2, vmed, (vmed+vmax)/2, vmax]
-        cbar = m.colorbar(ticks=ticks,extend='both')
+        cbar = m.colorbar(im,fig=fig,ticks=ticks,extend='both')
         cbar.ax.set_xticklabels(ticks)
         cbar.ax.tick_params(labelsize=size-4)
         cbar.set_label('[%s]' % self.units['%s' % key],fontname=font,fontsize=size-2)
-        plt.title('B) %s (2.13 %s - 1.63 %s)' % (self.name[key],micron,micron), \
+        ax.set_title('B) %s (2.13 %s - 1.63 %s)' % (self.name[key],micron,micron), \
         fontname=font,fontsize=size)
-        plt.show()
+        render.show(fig)
+        return fig
 
 """
 Atmospheric level 3 files
@@ -3403,6 +4097,10 @@ class MOD08(object):
     ----------
     file_name : string
     Name of file, in standard LAADS/LANCE notation.
+    
+    array_backend : string
+    'ma' for masked arrays or 'nan32' for float32 arrays with NaN for invalid data, see arrays.
+    Default is arrays.array_backend.
         
     Returns
     -------
@@ -3427,14 +4125,16 @@ class MOD08(object):
             -KH expanded to calculate average over each subtropical KH93 Sc region
     """
     
-    def __init__(self,file_name):
-        self.year = int(file_name[10:14])
-        self.jday = int(file_name[14:17])
+    def __init__(self,file_name,array_backend=None):
+        self.array_backend = arrays.backend(array_backend)
+        name = os.path.basename(file_name)
+        self.year = int(name[10:14])
+        self.jday = int(name[14:17])
         self.month = cal_day(self.jday,self.year).split()[0]
         self.day = int(cal_day(self.jday,self.year).split()[1])
-        self.type = file_name[6]
-        if file_name[1] == 'Y': self.satellite = 'Aqua'
-        elif file_name[1] == 'O': self.satellite = 'Terra'
+        self.type = name[6]
+        if name[1] == 'Y': self.satellite = 'Aqua'
+        elif name[1] == 'O': self.satellite = 'Terra'
         self.ds = {}
         self.units = {}
         self.names = {}
@@ -3501,7 +4201,7 @@ class MOD08(object):
             valid_min = attrs["valid_range"][0][0]
             valid_max = attrs["valid_range"][0][1]
             invalid = np.logical_or(values > valid_max, values < valid_min)
-            values = ma.MaskedArray(values, mask=invalid, fill_value=_FillValue)
+            values = arrays.masked(values,invalid,_FillValue,self.array_backend)
             self.ds[key] = (values-offset) * scale
             self.units[key] = attrs['units'][0]
             self.names[key] = attrs['long_name'][0]
@@ -3537,9 +4237,16 @@ class MOD08(object):
         W = self.XDim.index(KH93[deck]['W']-.5)
         d = self.ds[key][N:S+1,W:E+1]
         lat = self.lat[N:S+1,W:E+1]
-        KH = np.sum(d*np.cos(np.pi/180.*lat))/np.sum(np.cos(np.pi/180.*lat))
+        KH = arrays.nansum(d*np.cos(np.pi/180.*lat))/np.sum(np.cos(np.pi/180.*lat))
         return KH
     
+    def to_store(self,path,variables=None,chunks=None,compression='zlib',pack=False):
+        """
+        Save datasets to a chunked, compressed netCDF4 file, see archive.write(). Open it again with
+        archive.read(path).
+        """
+        archive.write(path,self,variables,chunks,compression,pack=pack)
+    
     def map(self,key,KH=False,cmap='viridis'):
         """
         Global map of Atmospheric L3 variable.
@@ -3614,7 +4321,7 @@ class MOD(object):
     General purpose function intended to work on any L2 or L3 MODIS HDF file.
     """
     
-    def __init__(self,filename):
+    def __init__(self,filename,array_backend=None):
         """
         General purpose function intended to work on any L2 or L3 MODIS HDF file
         
@@ -3627,6 +4334,10 @@ class MOD(object):
         filename : string
         MODIS HDF file.
         
+        array_backend : string
+        'ma' for masked arrays or 'nan32' for float32 arrays with NaN for invalid data, see arrays.
+        Default is arrays.array_backend.
+        
         Returns
         -------
         ds : dictionary
@@ -3645,6 +4356,7 @@ class MOD(object):
         --------------------
         Written: Michael Diamond, 11/23/2016, Hawthorne, NY
         """
+        self.array_backend = arrays.backend(array_backend)
         data = SD.SD(filename,SDC.READ)
         self.ds = {}
         self.names = {}
@@ -3671,7 +4383,7 @@ class MOD(object):
                     valid_max = attrs["valid_range"][0][1]
                     _FillValue = attrs['_FillValue'][0]
                     invalid = np.logical_or(values > valid_max, values < valid_min)
-                    values = ma.MaskedArray(values, mask=invalid, fill_value=_FillValue)
+                    values = arrays.masked(values,invalid,_FillValue,self.array_backend)
             except: pass
             try: values = (values-offset) * scale
             except: pass
@@ -3684,7 +4396,200 @@ class MOD(object):
 
     
 
+"""
+Granule registry
+"""
+
+#Live reader objects by (path, size, mtime, reader, settings). Entries disappear when the objects are garbage collected.
+_granules = weakref.WeakValueDictionary()
+_granules_lock = threading.RLock()
+
+def granule_reader(filename):
+    """
+    Reader class for a MODIS file, from its name: nrtACAERO, nrtMOD06 or MOD06, MOD021KM, MOD08, MOD14 or MOD.
+    """
+    name = os.path.basename(filename)
+    product = name.split('.')[0]
+    if 'ACAERO' in product: return nrtACAERO
+    if product[3:] == '06_L2':
+        if '.NRT.' in name: return nrtMOD06
+        return MOD06
+    if product[3:] == '021KM': return MOD021KM
+    if product[3:].startswith('08'): return MOD08
+    if product[3:].startswith('14'): return MOD14
+    return MOD
+
+def open_granule(filename,reader=None,**kwargs):
+    """
+    Open a MODIS file, reusing the reader object if the same file is already open in this process.
+    
+    Parameters
+    ----------
+    filename : string
+    MODIS HDF file. File names are resolved against the current directory, so the same file opened from
+    different directories is shared.
+    
+    reader : class
+    Reader to use, e.g. nrtMOD06. Default is granule_reader(filename).
+    
+    **kwargs
+    Passed to the reader, e.g. array_backend='nan32'. Objects opened with different keywords (or a different
+    arrays.array_backend or nd_gamma setting) are not shared.
+    
+    Returns
+    -------
+    granule : reader object
+    The object is shared, so don't modify its datasets in place. A file modified since it was opened (e.g.
+    re-downloaded) is read again.
+    """
+    if reader is None: reader = granule_reader(filename)
+    path = os.path.abspath(filename)
+    st = os.stat(path)
+    #Keywords left at their default (None) don't change the object
+    settings = sorted((k, v) for k, v in kwargs.items() if v is not None)
+    key = (path, st.st_size, st.st_mtime, reader, repr(settings), arrays.array_backend, nd_gamma)
+    granule = _granules.get(key)
+    if granule is not None: return granule
+    #Read without holding the lock, so different files can be opened in parallel
+    granule = reader(filename,**kwargs)
+    with _granules_lock:
+        #Keep the first object if another thread opened the same file meanwhile
+        shared = _granules.get(key)
+        if shared is not None: return shared
+        _granules[key] = granule
+    return granule
+
+"""
+Granule index
+"""
+
+#Short names of MODIS products in GranuleIndex, by file name prefix (after MOD/MYD)
+PRODUCTS = {'021KM' : 'L1b', '02HKM' : 'L1b_500m', '02QKM' : 'L1b_250m', '03' : 'geo', '06_L2' : 'MOD06',\
+'06ACAERO' : 'ACAERO', '14' : 'MOD14', '35_L2' : 'MOD35'}
+
+def granule_key(filename):
+    """
+    Parse a MODIS granule file name, e.g. MOD06ACAERO.A2016251.0930.006.NRT.hdf.
+    
+    Returns
+    -------
+    key, product : tuple, string
+    (satellite, year, jday, time) of the granule and its short product name (see PRODUCTS), or None, None if
+    filename isn't a MODIS granule (e.g. daily L3 files have no time).
+    """
+    parts = os.path.basename(filename).split('.')
+    if len(parts) < 4 or parts[0][:3] not in ['MOD','MYD']: return None, None
+    date, time = parts[1], parts[2]
+    if len(date) != 8 or date[0] != 'A' or not date[1:].isdigit() or len(time) != 4 or not time.isdigit():
+        return None, None
+    satellite = 'Aqua' if parts[0][1] == 'Y' else 'Terra'
+    return (satellite, int(date[1:5]), int(date[5:8]), time), PRODUCTS.get(parts[0][3:],parts[0][3:])
 
+def _time_order(key):
+    satellite, year, jday, time = key
+    return year, jday, time, satellite
 
+class GranuleIndex(object):
+    """
+    Index of MODIS granule files by satellite, date and time, for finding collocated products (e.g. the
+    MOD06ACAERO file of a MOD06_L2 granule) without scanning a directory or building file names.
+    
+    Parameters
+    ----------
+    directories : string or list
+    Directories to scan (one listdir each). Optional.
+    
+    files : list
+    File paths to add, e.g. from a catalog. Optional.
+    
+    Methods
+    -------
+    add: Add a file.
+    
+    scan: Add the MODIS files in a directory.
+    
+    get: Every product of a granule.
+    
+    partner: Path of another product of the granule of a file.
+    
+    files: Paths of every granule of a product.
+    
+    pairs: Iterate over granules that have both of two products.
+    """
+    
+    def __init__(self,directories=None,files=None):
+        self._granules = {} #(satellite, year, jday, time) -> {product : path}
+        if isinstance(directories,str): directories = [directories]
+        for directory in directories or []: self.scan(directory)
+        for path in files or []: self.add(path)
+    
+    def add(self,path):
+        """
+        Add a file. Returns its granule key, or None if it isn't a MODIS granule. If a granule has two files of
+        the same product (e.g. collections or processing dates), the last one by file name is kept.
+        """
+        key, product = granule_key(path)
+        if key is None: return None
+        products = self._granules.setdefault(key,{})
+        old = products.get(product)
+        if old is None or os.path.basename(path) > os.path.basename(old): products[product] = path
+        return key
+    
+    def scan(self,directory):
+        """
+        Add every MODIS .hdf file in directory. Paths are directory joined with the file name.
+        """
+        for name in os.listdir(directory):
+            if name.endswith('.hdf'): self.add(os.path.join(directory,name))
+    
+    def get(self,satellite,year,jday,time):
+        """
+        Dictionary of the path of each product of a granule, e.g. get('Terra',2016,251,'0930')['ACAERO'].
+        Empty if the granule isn't indexed.
+        """
+        return dict(self._granules.get((satellite, int(year), int(jday), '%04d' % int(time)),{}))
+    
+    def partner(self,filename,product):
+        """
+        Path of product (e.g. 'ACAERO', 'MOD06', 'L1b', 'geo') for the same granule as filename, or None.
+        """
+        key = granule_key(filename)[0]
+        if key is None: return None
+        return self._granules.get(key,{}).get(product)
+    
+    def files(self,product,satellite=None):
+        """
+        Paths of every granule of product (optionally only for one satellite), in time order.
+        """
+        return [self._granules[key][product] for key in sorted(self._granules,key=_time_order) \
+        if product in self._granules[key] and satellite in [None,key[0]]]
+    
+    def pairs(self,first='MOD06',second='ACAERO',satellite=None):
+        """
+        Iterate over (first path, second path) of every granule with both products, in time order. Default
+        gives MOD06_L2 and MOD06ACAERO pairs for nrt_comp.
+        """
+        for key in sorted(self._granules,key=_time_order):
+            products = self._granules[key]
+            if first in products and second in products and satellite in [None,key[0]]:
+                yield products[first], products[second]
+    
+    def __len__(self):
+        return len(self._granules)
+    
+    def __contains__(self,key):
+        return key in self._granules
 
+#Indexes of directories, by path, rebuilt when the directory changes
+_indexes = {}
 
+def directory_index(directory):
+    """
+    GranuleIndex of a directory, scanned again only if the directory was modified since the last call.
+    """
+    directory = os.path.abspath(directory)
+    mtime = os.stat(directory).st_mtime
+    entry = _indexes.get(directory)
+    if entry is None or entry[0] != mtime:
+        entry = _indexes[directory] = (mtime, GranuleIndex(directory))
+    return entry[1]
@@ -0,0 +1,246 @@
+"""
+Shared rendering helpers for modipy and sevipy plots.
+
+With headless = True, figures are plain matplotlib Figure objects drawn on an Agg canvas. They are never
+registered with pyplot, so plotting works without a display and from worker processes. Each figure is kept
+and reused (cleared) the next time the same figure number/name is asked for, instead of building a new
+window every call. With headless = False, figures come from pyplot as before.
+
+Plot methods return their figure; use save() to write it to a file.
+
+basemap() and background() cache map projections and pre-rendered map backgrounds (land fill, coastlines,
+ORACLES stations...) by extent, projection and resolution, so they are built once rather than for every plot.
+"""
+
+#Import libraries
+import os
+import copy
+import pickle
+import hashlib
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+#Draw headless by default if matplotlib is already on a non-interactive backend (e.g. no display)
+headless = matplotlib.get_backend().lower() in ['agg','pdf','ps','svg','cairo','template']
+
+#Reusable headless figures
+_figures = {}
+
+def figure(num=None,figsize=None,name=None):
+    """
+    Get a cleared figure to draw on.
+
+    Parameters
+    ----------
+    num : int or string
+    Figure number/name. Headless figures with the same num (or name if num is None) are reused.
+
+    figsize : tuple
+    Figure size in inches. Optional.
+
+    name : string
+    Key for the reused headless figure when num is None, usually the name of the plot method.
+
+    Returns
+    -------
+    fig : matplotlib Figure
+    """
+    if not headless:
+        import matplotlib.pylab as plt
+        fig = plt.figure(num=num,figsize=figsize)
+        fig.clf()
+        return fig
+    if num is None: num = name
+    fig = _figures.get(num)
+    if fig is None:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        _figures[num] = fig
+    else:
+        fig.clf()
+        if figsize is not None: fig.set_size_inches(figsize)
+    return fig
+
+def save(fig,filename,dpi=None,**kwargs):
+    """
+    Save a figure to file, e.g. save(cloud.five_plot(),'Nd.png',dpi=150).
+    """
+    fig.savefig(filename,dpi=dpi,**kwargs)
+
+def show(fig):
+    """
+    Show a figure if plotting interactively. Does nothing when headless.
+    """
+    if not headless:
+        import matplotlib.pylab as plt
+        plt.show()
+
+def close(num=None):
+    """
+    Forget a reused figure, or all of them if num is None.
+    """
+    if not headless:
+        import matplotlib.pylab as plt
+        if num is None: plt.close('all')
+        else: plt.close(num)
+    elif num is None: _figures.clear()
+    else: _figures.pop(num,None)
+
+"""
+Map cache
+"""
+
+#Directory to pickle Basemap instances and save background layers to. None to only cache in memory.
+map_cache_dir = None
+
+#ORACLES map domain
+ORACLES = dict(llcrnrlon=-15.5,llcrnrlat=-25.5,urcrnrlon=15.5,urcrnrlat=-4.5,projection='merc',resolution='l')
+
+#ORACLES stations (lon, lat, color, marker, size): Walvis Bay, Ascension Island, St. Helena
+STATIONS = [(14.5247,-22.9390,'orange','D',250),(-14.3559,-7.9467,'c','*',375),(-5.7089,-15.9650,'chartreuse','*',375)]
+
+#Routine ORACLES flight track (lons, lats)
+TRACK = ([14.5247,13,0],[-22.9390,-23,-10])
+
+_basemaps = {}
+_layers = {}
+
+def _round(v):
+    if isinstance(v,float) or isinstance(v,np.floating): return round(float(v),4)
+    return v
+
+def _cache_path(kind,key,ext):
+    return os.path.join(map_cache_dir,'%s.%s.%s' % (kind,hashlib.sha1(key.encode('utf-8')).hexdigest()[:12],ext))
+
+def basemap(ax=None,**kwargs):
+    """
+    Get a Basemap, reusing an existing projection for the same keywords instead of building it again.
+    
+    Parameters
+    ----------
+    ax : matplotlib Axes
+    Default axes for the returned map. Optional.
+    
+    **kwargs
+    Passed to Basemap, e.g. render.basemap(ax=ax,**render.ORACLES). Extents, projection and resolution
+    make up the cache key.
+    
+    Returns
+    -------
+    m : Basemap
+    Shallow copy of the cached map (coastline and boundary polygons are shared) with m.ax = ax.
+    """
+    key = repr(sorted((k,_round(v)) for k, v in kwargs.items()))
+    m = _basemaps.get(key)
+    if m is None and map_cache_dir is not None:
+        path = _cache_path('basemap',key,'pickle')
+        if os.path.exists(path):
+            with open(path,'rb') as f: m = pickle.load(f)
+    if m is None:
+        from mpl_toolkits.basemap import Basemap
+        m = Basemap(**kwargs)
+        if map_cache_dir is not None:
+            if not os.path.isdir(map_cache_dir): os.makedirs(map_cache_dir)
+            tmp = '%s.%s.tmp' % (path,os.getpid())
+            with open(tmp,'wb') as f: pickle.dump(m,f,-1)
+            os.rename(tmp,path)
+    _basemaps[key] = m
+    m = copy.copy(m)
+    m._cache_key = key
+    m.ax = ax
+    return m
+
+def _draw_layer(m,draw,width,height,dpi):
+    """
+    Draw on a transparent off-screen axes spanning the map projection limits and return the RGBA pixels.
+    """
+    #Own copy so the map boundary patch Basemap keeps for clipping is not shared between figures
+    m = copy.copy(m)
+    m._mapboundarydraw = None
+    fig = Figure(figsize=(width,height),dpi=dpi)
+    FigureCanvasAgg(fig)
+    fig.patch.set_alpha(0)
+    ax = fig.add_axes([0,0,1,1])
+    draw(m,ax)
+    ax.set_axis_off()
+    ax.set_aspect('auto')
+    ax.set_xlim(m.xmin,m.xmax)
+    ax.set_ylim(m.ymin,m.ymax)
+    fig.canvas.draw()
+    w, h = fig.canvas.get_width_height()
+    return np.frombuffer(fig.canvas.buffer_rgba(),np.uint8).reshape(h,w,4).copy()
+
+def background(m,ax,land='k',ocean=None,lake=None,coastlines=True,countries=True,stations=False,pixels=1600):
+    """
+    Draw the static map background as two cached images, an underlay (ocean and land fill) below the data and
+    an overlay (coastlines, country borders and, optionally, the ORACLES stations and flight track) above it.
+    
+    The images are rendered once per map, style and axes size, kept in memory and saved to map_cache_dir.
+    Parallels and meridians are still drawn by Basemap since their labels fall outside the map.
+    
+    Parameters
+    ----------
+    m : Basemap
+    Map from basemap() (or any Basemap).
+    
+    ax : matplotlib Axes
+    Axes to draw on.
+    
+    land, ocean, lake : string
+    Fill colors, None for no fill. Default black land with no ocean fill. lake defaults to ocean.
+    
+    coastlines, countries : boolean
+    Draw coastlines/country borders. Default True.
+    
+    stations : boolean
+    Mark ORACLES stations (STATIONS) and flight track (TRACK). Default False.
+    
+    pixels : int
+    Size of the longer side of the cached images. Default 1600.
+    """
+    if lake is None: lake = ocean
+    map_key = getattr(m,'_cache_key',None) or repr((sorted(m.projparams.items()),m.resolution,\
+    _round(m.llcrnrlon),_round(m.llcrnrlat),_round(m.urcrnrlon),_round(m.urcrnrlat)))
+    #Match the physical size of the map on the axes so line widths and markers look the same as vector drawing
+    fig = ax.get_figure()
+    box = ax.get_position()
+    box_w = box.width*fig.get_figwidth()
+    box_h = box.height*fig.get_figheight()
+    aspect = (m.xmax-m.xmin)/(m.ymax-m.ymin)
+    width = round(min(box_w,box_h*aspect),2)
+    height = round(width/aspect,2)
+    dpi = pixels/max(width,height)
+    extent = (m.xmin,m.xmax,m.ymin,m.ymax)
+    
+    def under(m,lax):
+        if ocean is not None: m.drawmapboundary(fill_color=ocean,linewidth=0,ax=lax)
+        if land is not None: m.fillcontinents(color=land,lake_color=lake,ax=lax)
+    
+    def over(m,lax):
+        if coastlines: m.drawcoastlines(ax=lax)
+        if countries: m.drawcountries(ax=lax)
+        if stations:
+            for lon, lat, c, marker, s in STATIONS:
+                m.scatter(lon,lat,s=s,c=c,marker=marker,latlon=True,ax=lax)
+            m.plot(TRACK[0],TRACK[1],c='w',linewidth=5,linestyle='dashed',latlon=True,ax=lax)
+            m.plot(TRACK[0],TRACK[1],c='k',linewidth=3,linestyle='dashed',latlon=True,ax=lax)
+    
+    for name, draw, style, zorder in [('under',under,(land,ocean,lake),0),('over',over,(coastlines,countries,stations),2)]:
+        if not any(v not in [None,False] for v in style): continue
+        key = repr((map_key,name,style,width,height,pixels))
+        image = _layers.get(key)
+        if image is None and map_cache_dir is not None:
+            path = _cache_path('layer',key,'npy')
+            if os.path.exists(path): image = np.load(path)
+        if image is None:
+            image = _draw_layer(m,draw,width,height,dpi)
+            if map_cache_dir is not None:
+                if not os.path.isdir(map_cache_dir): os.makedirs(map_cache_dir)
+                tmp = '%s.%s.tmp.npy' % (path[:-4],os.getpid())
+                np.save(tmp,image)
+                os.rename(tmp,path)
+        _layers[key] = image
+        ax.imshow(image,extent=extent,origin='upper',interpolation='bilinear',zorder=zorder)
+    m.set_axes_limits(ax=ax)
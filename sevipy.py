@@ -13,9 +13,9 @@ Modified (v.1.2): Michael Diamond, 09/02/2016, Swakopmund, Namibia
 #Import libraries
 import netCDF4 as nc
 import numpy as np
-import numpy.ma as ma
-import matplotlib.pylab as plt
-from mpl_toolkits.basemap import Basemap
+import render
+import arrays
+import archive
 from matplotlib.colors import LogNorm
 import pysolar
 import datetime
@@ -176,165 +176,158 @@ class CR(object):
         data_C1.close()
         data_C2.close()
     
-    def merc(self):
+    def merc(self,num=None):
         """
         Plot the view as seen from the satellite
         """
-        plt.clf()
+        fig = render.figure(num,name='CR.merc')
+        ax = fig.add_subplot(1,1,1)
         font = 16
-        m = Basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
-        urcrnrlat=self.lat.max(),projection='merc',resolution='i')
+        m = render.basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
+        urcrnrlat=self.lat.max(),projection='merc',resolution='i',ax=ax)
         m.drawmapboundary(linewidth=1.5)        
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
+        render.background(m,ax)
         m.drawparallels(np.arange(-180,180,5),labels=[1,0,0,0],fontsize=font-2)
         m.drawmeridians(np.arange(0,360,5),labels=[1,1,0,1],fontsize=font-2)
-        m.pcolormesh(self.lon,self.lat,self.CR,shading='gouraud',cmap='RdYlBu_r',latlon=True,vmin=.9,vmax=1.1)
-        cbar = m.colorbar()
+        im = m.pcolormesh(self.lon,self.lat,self.CR,shading='gouraud',cmap='RdYlBu_r',latlon=True,vmin=.9,vmax=1.1)
+        cbar = m.colorbar(im,fig=fig)
         cbar.ax.tick_params(labelsize=font-2) 
         cbar.set_label('Channel 2:Channel 1 color ratio',fontsize=font-1)
-        plt.title('Color ratio from MSG SEVIRI (%s/%s/%s, %s UTC)' % \
+        ax.set_title('Color ratio from MSG SEVIRI (%s/%s/%s, %s UTC)' % \
         (cal_day(int(self.jday),int(self.year))[0],cal_day(int(self.jday),int(self.year))[1],\
         self.year,self.time),fontsize=font+2)
-        plt.show()
+        render.show(fig)
+        return fig
     
-    def view(self):
+    def view(self,num=None):
         """
         Plot the view as seen from the satellite
         """
-        plt.clf()
-        m = Basemap(projection='nsper',lon_0=self.lon.mean(),lat_0=self.lat.mean(),resolution='l',satellite_height=36000*1000)
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
+        fig = render.figure(num,name='CR.view')
+        ax = fig.add_subplot(1,1,1)
+        m = render.basemap(projection='nsper',lon_0=self.lon.mean(),lat_0=self.lat.mean(),resolution='l',satellite_height=36000*1000,ax=ax)
+        render.background(m,ax)
         m.drawparallels(np.arange(-180,180,10))
         m.drawmeridians(np.arange(0,360,10))
-        m.pcolormesh(self.lon,self.lat,self.CR,shading='gouraud',cmap='RdYlBu_r',latlon=True,vmin=.5,vmax=1.5)
-        cbar = m.colorbar()
+        im = m.pcolormesh(self.lon,self.lat,self.CR,shading='gouraud',cmap='RdYlBu_r',latlon=True,vmin=.5,vmax=1.5)
+        cbar = m.colorbar(im,fig=fig)
         cbar.set_label('Channel 1:Channel 2 color ratio')
-        plt.title('View from MSG SEVIRI (%s/%s/%s, %s UTC)' % \
+        ax.set_title('View from MSG SEVIRI (%s/%s/%s, %s UTC)' % \
         (cal_day(int(self.jday),int(self.year))[0],cal_day(int(self.jday),int(self.year))[1],\
         self.year,self.time))
-        plt.show()
+        render.show(fig)
+        return fig
         
-    def radmerc(self):
+    def radmerc(self,num=None):
         """
         Plot the view as seen from the satellite
         """
-        plt.clf()
+        fig = render.figure(num,name='CR.radmerc')
+        ax = fig.add_subplot(1,1,1)
         font = 16
-        m = Basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
-        urcrnrlat=self.lat.max(),projection='merc',resolution='i')
+        m = render.basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
+        urcrnrlat=self.lat.max(),projection='merc',resolution='i',ax=ax)
         m.drawmapboundary(linewidth=1.5)        
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
+        render.background(m,ax)
         m.drawparallels(np.arange(-180,180,5),labels=[1,0,0,0],fontsize=font-2)
         m.drawmeridians(np.arange(0,360,5),labels=[1,1,0,1],fontsize=font-2)
-        m.pcolormesh(self.lon,self.lat,self.Rad2/self.Rad1,shading='gouraud',cmap='RdYlBu_r',latlon=True,vmin=0.6,vmax=.8)
-        cbar = m.colorbar()
+        im = m.pcolormesh(self.lon,self.lat,self.Rad2/self.Rad1,shading='gouraud',cmap='RdYlBu_r',latlon=True,vmin=0.6,vmax=.8)
+        cbar = m.colorbar(im,fig=fig)
         cbar.ax.tick_params(labelsize=font-2) 
         cbar.set_label('Channel 2:Channel 1 color ratio',fontsize=font-1)
-        plt.title('Radiance color ratio from MSG SEVIRI (%s/%s/%s, %s UTC)' % \
+        ax.set_title('Radiance color ratio from MSG SEVIRI (%s/%s/%s, %s UTC)' % \
         (cal_day(int(self.jday),int(self.year))[0],cal_day(int(self.jday),int(self.year))[1],\
         self.year,self.time),fontsize=font+2)
-        plt.show()
+        render.show(fig)
+        return fig
     
-    def check(self):
+    def check(self,num=None):
         """
         Plot radiances and reflectances to make sure it all makes sense.
         """
-        plt.clf()
+        fig = render.figure(num,name='CR.check')
         font = 12
-        plt.subplot(2,2,1)
-        m = Basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
-        urcrnrlat=self.lat.max(),projection='merc',resolution='c')
+        ax = fig.add_subplot(2,2,1)
+        m = render.basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
+        urcrnrlat=self.lat.max(),projection='merc',resolution='c',ax=ax)
         m.drawmapboundary(linewidth=1.5)        
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
+        render.background(m,ax)
         m.drawparallels(np.arange(-180,180,5),labels=[1,0,0,0],fontsize=font-2)
         m.drawmeridians(np.arange(0,360,5),labels=[1,1,0,1],fontsize=font-2)
-        m.pcolormesh(self.lon,self.lat,self.Rad1,shading='gouraud',cmap='viridis',latlon=True,vmin=0,vmax=300)
-        cbar = m.colorbar()
+        im = m.pcolormesh(self.lon,self.lat,self.Rad1,shading='gouraud',cmap='viridis',latlon=True,vmin=0,vmax=300)
+        cbar = m.colorbar(im,fig=fig)
         cbar.ax.tick_params(labelsize=font-2) 
         cbar.set_label('Channel 1 radiance [W/m2/micron/sr]',fontsize=font-1)
-        plt.title('600 nm radiance from MSG SEVIRI (%s/%s/%s, %s UTC)' % \
+        ax.set_title('600 nm radiance from MSG SEVIRI (%s/%s/%s, %s UTC)' % \
         (cal_day(int(self.jday),int(self.year))[0],cal_day(int(self.jday),int(self.year))[1],\
         self.year,self.time),fontsize=font+2)
-        plt.subplot(2,2,2)
-        m = Basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
-        urcrnrlat=self.lat.max(),projection='merc',resolution='c')
+        ax = fig.add_subplot(2,2,2)
+        m = render.basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
+        urcrnrlat=self.lat.max(),projection='merc',resolution='c',ax=ax)
         m.drawmapboundary(linewidth=1.5)        
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
+        render.background(m,ax)
         m.drawparallels(np.arange(-180,180,5),labels=[1,0,0,0],fontsize=font-2)
         m.drawmeridians(np.arange(0,360,5),labels=[1,1,0,1],fontsize=font-2)
-        m.pcolormesh(self.lon,self.lat,self.Rad2,shading='gouraud',cmap='plasma',latlon=True,vmin=0,vmax=300)
-        cbar = m.colorbar()
+        im = m.pcolormesh(self.lon,self.lat,self.Rad2,shading='gouraud',cmap='plasma',latlon=True,vmin=0,vmax=300)
+        cbar = m.colorbar(im,fig=fig)
         cbar.ax.tick_params(labelsize=font-2) 
         cbar.set_label('Channel 2 radiance [W/m2/micron/sr]',fontsize=font-1)
-        plt.title('800 nm radiance from MSG SEVIRI (%s/%s/%s, %s UTC)' % \
+        ax.set_title('800 nm radiance from MSG SEVIRI (%s/%s/%s, %s UTC)' % \
         (cal_day(int(self.jday),int(self.year))[0],cal_day(int(self.jday),int(self.year))[1],\
         self.year,self.time),fontsize=font+2)
-        plt.subplot(2,2,3)
-        m = Basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
-        urcrnrlat=self.lat.max(),projection='merc',resolution='c')
+        ax = fig.add_subplot(2,2,3)
+        m = render.basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
+        urcrnrlat=self.lat.max(),projection='merc',resolution='c',ax=ax)
         m.drawmapboundary(linewidth=1.5)        
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
+        render.background(m,ax)
         m.drawparallels(np.arange(-180,180,5),labels=[1,0,0,0],fontsize=font-2)
         m.drawmeridians(np.arange(0,360,5),labels=[1,1,0,1],fontsize=font-2)
-        m.pcolormesh(self.lon,self.lat,self.R1,shading='gouraud',cmap='YlGn',latlon=True,vmin=0,vmax=1)
-        cbar = m.colorbar()
+        im = m.pcolormesh(self.lon,self.lat,self.R1,shading='gouraud',cmap='YlGn',latlon=True,vmin=0,vmax=1)
+        cbar = m.colorbar(im,fig=fig)
         cbar.ax.tick_params(labelsize=font-2) 
         cbar.set_label('Channel 1 reflectance [unitless]',fontsize=font-1)
-        plt.title('600 nm reflectance from MSG SEVIRI (%s/%s/%s, %s UTC)' % \
+        ax.set_title('600 nm reflectance from MSG SEVIRI (%s/%s/%s, %s UTC)' % \
         (cal_day(int(self.jday),int(self.year))[0],cal_day(int(self.jday),int(self.year))[1],\
         self.year,self.time),fontsize=font+2)
-        plt.subplot(2,2,4)
-        m = Basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
-        urcrnrlat=self.lat.max(),projection='merc',resolution='c')
+        ax = fig.add_subplot(2,2,4)
+        m = render.basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
+        urcrnrlat=self.lat.max(),projection='merc',resolution='c',ax=ax)
         m.drawmapboundary(linewidth=1.5)        
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
+        render.background(m,ax)
         m.drawparallels(np.arange(-180,180,5),labels=[1,0,0,0],fontsize=font-2)
         m.drawmeridians(np.arange(0,360,5),labels=[1,1,0,1],fontsize=font-2)
-        m.pcolormesh(self.lon,self.lat,self.R2,shading='gouraud',cmap='YlOrRd',latlon=True,vmin=0,vmax=1)
-        cbar = m.colorbar()
+        im = m.pcolormesh(self.lon,self.lat,self.R2,shading='gouraud',cmap='YlOrRd',latlon=True,vmin=0,vmax=1)
+        cbar = m.colorbar(im,fig=fig)
         cbar.ax.tick_params(labelsize=font-2) 
         cbar.set_label('Channel 2 reflectance [unitless]',fontsize=font-1)
-        plt.title('800 nm reflectance from MSG SEVIRI (%s/%s/%s, %s UTC)' % \
+        ax.set_title('800 nm reflectance from MSG SEVIRI (%s/%s/%s, %s UTC)' % \
         (cal_day(int(self.jday),int(self.year))[0],cal_day(int(self.jday),int(self.year))[1],\
         self.year,self.time),fontsize=font+2)
-        plt.show()
+        render.show(fig)
+        return fig
     
-    def szaplot(self):
+    def szaplot(self,num=None):
         """
         Plot the sza
         """
-        plt.clf()
+        fig = render.figure(num,name='CR.szaplot')
+        ax = fig.add_subplot(1,1,1)
         font = 16
-        m = Basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
-        urcrnrlat=self.lat.max(),projection='merc',resolution='i')
+        m = render.basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
+        urcrnrlat=self.lat.max(),projection='merc',resolution='i',ax=ax)
         m.drawmapboundary(linewidth=1.5)        
-        m.drawcoastlines()
-        m.drawcountries()
-        m.fillcontinents('k',zorder=0)
+        render.background(m,ax)
         m.drawparallels(np.arange(-180,180,5),labels=[1,0,0,0],fontsize=font-2)
         m.drawmeridians(np.arange(0,360,5),labels=[1,1,0,1],fontsize=font-2)
-        m.pcolormesh(self.lon,self.lat,self.sza,shading='gouraud',cmap='magma_r',latlon=True,vmin=0,vmax=90)
-        cbar = m.colorbar()
+        im = m.pcolormesh(self.lon,self.lat,self.sza,shading='gouraud',cmap='magma_r',latlon=True,vmin=0,vmax=90)
+        cbar = m.colorbar(im,fig=fig)
         cbar.ax.tick_params(labelsize=font-2) 
         cbar.set_label('Degrees',fontsize=font-1)
-        plt.title('Solar zenith angle (%s/%s/%s, %s UTC)' % \
+        ax.set_title('Solar zenith angle (%s/%s/%s, %s UTC)' % \
         (cal_day(int(self.jday),int(self.year))[0],cal_day(int(self.jday),int(self.year))[1],\
         self.year,self.time),fontsize=font+2)
-        plt.show()
+        render.show(fig)
+        return fig
 
 """
 Cloud products
@@ -348,10 +341,16 @@ class cloud(object):
     fn : string
     File name for cloud product.
     
+    array_backend : string
+    'ma' for masked arrays or 'nan32' for float32 arrays with NaN for invalid pixels, see arrays.
+    Default is arrays.array_backend.
+    
     Methods
     -------
     plot: Create a plot of a variable over the ORACLES study area. See names for available datasets to plot.
     
+    to_store: Save datasets to a chunked, compressed netCDF4 archive.
+    
     Returns
     -------
     jday, year, hour, mintue, month, day : int
@@ -382,7 +381,8 @@ class cloud(object):
         -Made Ztop/Zbottom in feet
     """
     
-    def __init__(self,fn):
+    def __init__(self,fn,array_backend=None):
+        self.array_backend = arrays.backend(array_backend)
         #
         ###Load data
         #
@@ -419,7 +419,7 @@ class cloud(object):
             self.names['%s' % ds_name] = data.getncattr('long_name')
             data = data[:,:]
             invalid = np.logical_or(data > valid_max, data < valid_min)
-            data = ma.MaskedArray(data,mask=invalid,fill_value=_FillValue)
+            data = arrays.masked(data,invalid,_FillValue,self.array_backend)
             self.ds['%s' % ds_name] = data
         
         c.close()
@@ -442,7 +442,14 @@ class cloud(object):
         self.names['Re'] = 'Liquid Radius'
         self.units['Re'] = '%sm' % u"\u03BC"
         
-    def plot(self,key='Re'):
+    def to_store(self,path,variables=None,chunks=None,compression='zlib',pack=False):
+        """
+        Save datasets to a chunked, compressed netCDF4 file, see archive.write(). Open it again with
+        archive.read(path).
+        """
+        archive.write(path,self,variables,chunks,compression,pack=pack)
+    
+    def plot(self,key='Re',num=None):
         """
         Create a plot of a variable over the ORACLES study area. 
         
@@ -454,6 +461,13 @@ class cloud(object):
         clf : boolean
         If True, clear off pre-existing figure. If False, plot over pre-existing figure.
         
+        num : int or string
+        Figure number/name to draw on, see render.figure(). Optional.
+        
+        Returns
+        -------
+        fig : matplotlib Figure
+        
         Modification history
         --------------------
         Written: Michael Diamond, 08/16/2016, Seattle, WA
@@ -462,35 +476,33 @@ class cloud(object):
         Modified: Michael Diamond, 09/02/2016, Swakopmund, Namibia
             -Updated flihgt track
         """
-        plt.clf()
+        fig = render.figure(num,name='cloud.plot')
+        ax = fig.add_subplot(1,1,1)
         size = 16
         font = 'Arial'
-        m = Basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
-        urcrnrlat=self.lat.max(),projection='merc',resolution='i')
+        m = render.basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
+        urcrnrlat=self.lat.max(),projection='merc',resolution='i',ax=ax)
         m.drawparallels(np.arange(-180,180,5),labels=[1,0,0,0],fontsize=size,fontname=font)
         m.drawmeridians(np.arange(0,360,5),labels=[1,1,0,1],fontsize=size,fontname=font)
         m.drawmapboundary(linewidth=1.5)        
-        m.drawcoastlines()
-        m.drawcountries()
         if key == 'Pbot' or key == 'Ptop' or key == 'Nd' or key == 'DZ': 
-            m.drawmapboundary(fill_color='steelblue')
-            m.fillcontinents(color='floralwhite',lake_color='steelblue',zorder=0)
-        else: m.fillcontinents('k',zorder=0)
+            render.background(m,ax,land='floralwhite',ocean='steelblue')
+        else: render.background(m,ax)
         if key == 'Nd':
-            m.pcolormesh(self.lon,self.lat,self.ds['%s' % key],cmap=self.colors['%s' % key],\
+            im = m.pcolormesh(self.lon,self.lat,self.ds['%s' % key],cmap=self.colors['%s' % key],\
             latlon=True,norm = LogNorm(vmin=self.v['%s' % key][0],vmax=self.v['%s' % key][1]))
         elif key == 'Zbf' or key == 'Ztf':
             levels = [0,250,500,750,1000,1250,1500,1750,2000,2500,3000,3500,4000,5000,6000,7000,8000,9000,10000]
-            m.contourf(self.lon,self.lat,self.ds['%s' % key],levels=levels,\
+            im = m.contourf(self.lon,self.lat,self.ds['%s' % key],levels=levels,\
             cmap=self.colors['%s' % key],latlon=True,extend='max')
         elif key == 'DZ':
             levels = [0,500,1000,1500,2000,2500,3000,3500,4000,4500,5000,5500,6000,6500,7000]
-            m.contourf(self.lon,self.lat,self.ds['%s' % key],levels=levels,\
+            im = m.contourf(self.lon,self.lat,self.ds['%s' % key],levels=levels,\
             cmap=self.colors['%s' % key],latlon=True,extend='max')
         else:
-            m.pcolormesh(self.lon,self.lat,self.ds['%s' % key],cmap=self.colors['%s' % key],\
+            im = m.pcolormesh(self.lon,self.lat,self.ds['%s' % key],cmap=self.colors['%s' % key],\
             latlon=True,vmin=self.v['%s' % key][0],vmax=self.v['%s' % key][1])
-        cbar = m.colorbar()
+        cbar = m.colorbar(im,fig=fig)
         cbar.ax.tick_params(labelsize=size-2) 
         cbar.set_label('[%s]' % self.units['%s' % key],fontsize=size,fontname=font)
         if key == 'Pbot' or key == 'Ptop': cbar.ax.invert_yaxis() 
@@ -499,9 +511,10 @@ class cloud(object):
         m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
         m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
         m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-        plt.title('%s from MSG SEVIRI on %s/%s/%s at %s UTC' % \
+        ax.set_title('%s from MSG SEVIRI on %s/%s/%s at %s UTC' % \
         (self.names['%s' % key],self.month,self.day,self.year,self.time),fontsize=size+4,fontname=font)
-        plt.show()
+        render.show(fig)
+        return fig
 
 """
 Aerosol products
@@ -515,10 +528,16 @@ class aero(object):
     fn : string
     File name for cloud product.
     
+    array_backend : string
+    'ma' for masked arrays or 'nan32' for float32 arrays with NaN for invalid pixels, see arrays.
+    Default is arrays.array_backend.
+    
     Methods
     -------
     plot: Create a plot of a variable over the ORACLES study area. See names for available datasets to plot.
     
+    to_store: Save datasets to a chunked, compressed netCDF4 archive.
+    
     Returns
     -------
     jday, year, hour, mintue, month, day : int
@@ -546,7 +565,8 @@ class aero(object):
     Written (v.1.0): Michael Diamond, 8/16/2016, Seattle, WA
     """
     
-    def __init__(self,fn):
+    def __init__(self,fn,array_backend=None):
+        self.array_backend = arrays.backend(array_backend)
         #
         ###Load data
         #
@@ -579,12 +599,19 @@ class aero(object):
             self.names['%s' % ds_name] = data.getncattr('long_name')
             data = data[:,:]
             invalid = np.logical_or(data > valid_max, data < valid_min)
-            data = ma.MaskedArray(data,mask=invalid,fill_value=_FillValue)
+            data = arrays.masked(data,invalid,_FillValue,self.array_backend)
             self.ds['%s' % ds_name] = data
         
         a.close()
           
-    def plot(self,key='AOD'):
+    def to_store(self,path,variables=None,chunks=None,compression='zlib',pack=False):
+        """
+        Save datasets to a chunked, compressed netCDF4 file, see archive.write(). Open it again with
+        archive.read(path).
+        """
+        archive.write(path,self,variables,chunks,compression,pack=pack)
+    
+    def plot(self,key='AOD',num=None):
         """
         Create a plot of a variable over the ORACLES study area. 
         
@@ -593,6 +620,13 @@ class aero(object):
         key : string
         See names for available datasets to plot.
         
+        num : int or string
+        Figure number/name to draw on, see render.figure(). Optional.
+        
+        Returns
+        -------
+        fig : matplotlib Figure
+        
         Modification history
         --------------------
         Written: Michael Diamond, 08/16/2016, Seattle, WA
@@ -601,29 +635,27 @@ class aero(object):
         Modified: Michael Diamond, 09/02/2016, Swakopmund, Namibia
             -Updated flight track
         """
-        plt.clf()
+        fig = render.figure(num,name='aero.plot')
+        ax = fig.add_subplot(1,1,1)
         size = 16
         font = 'Arial'
-        m = Basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
-        urcrnrlat=self.lat.max(),projection='merc',resolution='i')
+        m = render.basemap(llcrnrlon=self.lon.min(),llcrnrlat=self.lat.min(),urcrnrlon=self.lon.max(),\
+        urcrnrlat=self.lat.max(),projection='merc',resolution='i',ax=ax)
         m.drawparallels(np.arange(-180,180,5),labels=[1,0,0,0],fontsize=size,fontname=font)
         m.drawmeridians(np.arange(0,360,5),labels=[1,1,0,1],fontsize=size,fontname=font)
         m.drawmapboundary(linewidth=1.5)        
-        m.drawcoastlines()
-        m.drawcountries()
-        m.drawmapboundary(fill_color='steelblue')
-        m.fillcontinents(color='floralwhite',lake_color='steelblue',zorder=0)
+        render.background(m,ax,land='floralwhite',ocean='steelblue')
         if key == 'AOD':
-            m.pcolormesh(self.lon,self.lat,self.ds['%s' % key],cmap=self.colors['%s' % key],\
+            im = m.pcolormesh(self.lon,self.lat,self.ds['%s' % key],cmap=self.colors['%s' % key],\
             latlon=True,vmin=self.v['%s' % key][0],vmax=self.v['%s' % key][1])
-            cbar = m.colorbar()
+            cbar = m.colorbar(im,fig=fig)
             cbar.ax.tick_params(labelsize=size-2) 
             cbar.set_label('[%s]' % self.units['%s' % key],fontsize=size,fontname=font)
         elif key == 'ATYP':
-            m.pcolormesh(self.lon,self.lat,self.ds['%s' % key],cmap=self.colors['%s' % key],\
+            im = m.pcolormesh(self.lon,self.lat,self.ds['%s' % key],cmap=self.colors['%s' % key],\
             latlon=True,vmin=self.v['%s' % key][0],vmax=self.v['%s' % key][1])
-            plt.contourf(np.array(([5,1],[3,2])),cmap=self.colors['%s' % key],levels=[0,1,2,3,4,5])
-            cbar = m.colorbar(ticks=[0,1,2,3,4,5])
+            im = ax.contourf(np.array(([5,1],[3,2])),cmap=self.colors['%s' % key],levels=[0,1,2,3,4,5])
+            cbar = m.colorbar(im,fig=fig,ticks=[0,1,2,3,4,5])
             cbar.ax.set_yticklabels(['Sea Salt','Sulphate','Organic C','Black C','Dust'])
             cbar.ax.tick_params(labelsize=size-2) 
         else:
@@ -633,6 +665,7 @@ class aero(object):
         m.scatter(-5.7089,-15.9650,s=375,c='chartreuse',marker='*',latlon=True)
         m.plot([14.5247,13,0],[-22.9390,-23,-10],c='w',linewidth=5,linestyle='dashed',latlon=True)
         m.plot([14.5247,13,0],[-22.9390,-23,-10],c='k',linewidth=3,linestyle='dashed',latlon=True)
-        plt.title('%s from MSG SEVIRI on %s/%s/%s at %s UTC' % \
+        ax.set_title('%s from MSG SEVIRI on %s/%s/%s at %s UTC' % \
         (self.names['%s' % key],self.month,self.day,self.year,self.time),fontsize=size+4,fontname=font)
-        plt.show()
+        render.show(fig)
+        return fig